@@ -0,0 +1,5 @@
+# app/__init__.py
+from dotenv import load_dotenv
+
+# before any module reads its settings from the environment
+load_dotenv()
@@ -0,0 +1,117 @@
+# app/api/admission.py
+"""
+Admission control for CPU-bound evaluation.
+
+Evaluations run on a dedicated executor with EVALUATION_WORKERS slots
+(threads, or processes with EVALUATION_EXECUTOR=process). Requests wait
+for a slot in an admission queue of at most ADMISSION_MAX_QUEUE; when it
+is full they are rejected right away with 429, and a request still queued
+after ADMISSION_QUEUE_TIMEOUT_SECONDS gets 503. Both carry Retry-After.
+Overload therefore sheds requests instead of slowing every one of them.
+"""
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+from fastapi import HTTPException
+
+EVALUATION_EXECUTOR = os.getenv("EVALUATION_EXECUTOR", "thread")
+EVALUATION_WORKERS = int(os.getenv("EVALUATION_WORKERS", str(min(32, (os.cpu_count() or 1) + 4))))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "2"))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "1"))
+
+
+def build_executor(kind: str = EVALUATION_EXECUTOR, workers: int = EVALUATION_WORKERS) -> Executor:
+    if kind == "thread":
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="evaluate")
+    if kind == "process":
+        # spawn: every worker imports the app and compiles its own rule plan
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    raise ValueError(f"EVALUATION_EXECUTOR must be 'thread' or 'process', not {kind!r}")
+
+
+class AdmissionController:
+    def __init__(self, executor: Executor = None, workers: int = EVALUATION_WORKERS,
+                 max_queue: int = ADMISSION_MAX_QUEUE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT_SECONDS,
+                 retry_after: int = ADMISSION_RETRY_AFTER_SECONDS):
+        """
+        `workers` is the number of evaluations run at once; it should match
+        the executor's size. Counters are only touched on the event loop.
+        """
+        self.executor = build_executor(workers=workers) if executor is None else executor
+        self.threads = isinstance(self.executor, ThreadPoolExecutor)
+        self.workers = workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.queued = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._loop = None
+        self._slots: asyncio.Semaphore = None
+
+    def _saturated(self, status_code: int, detail: str) -> HTTPException:
+        return HTTPException(status_code=status_code, detail=detail,
+                             headers={"Retry-After": str(self.retry_after)})
+
+    async def _acquire(self, reject: bool):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # semaphores belong to one event loop (one per worker process in production)
+            self._loop, self._slots = loop, asyncio.Semaphore(self.workers)
+        if not self._slots.locked():
+            await self._slots.acquire()
+            return
+        if reject and self.queued >= self.max_queue:
+            self.rejected += 1
+            raise self._saturated(429, "evaluation queue is full")
+        self.queued += 1
+        acquire = asyncio.ensure_future(self._slots.acquire())
+        try:
+            try:
+                done, _ = await asyncio.wait({acquire}, timeout=self.queue_timeout if reject else None)
+            except asyncio.CancelledError:
+                # the client went away while queued; give back a slot it may hold
+                if not acquire.cancel():
+                    self._slots.release()
+                raise
+            # cancel() fails only if it got a slot just now; a cancelled
+            # acquire hands back a slot it was being given
+            if not done and acquire.cancel():
+                self.timed_out += 1
+                raise self._saturated(503, "timed out waiting for an evaluation slot")
+        finally:
+            self.queued -= 1
+
+    async def run(self, fn: Callable, *args, reject: bool = True) -> Any:
+        """
+        fn(*args) on the executor once a slot is free. With reject=False
+        (rows of an already admitted batch) the request waits for a slot
+        however long the queue is.
+        """
+        await self._acquire(reject)
+        self.in_flight += 1
+        try:
+            if self.threads:
+                # keep the caller's context (e.g. an active trace)
+                fn = functools.partial(contextvars.copy_context().run, fn)
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": self.workers, "max_queue": self.max_queue, "queued": self.queued,
+                "in_flight": self.in_flight, "completed": self.completed,
+                "rejected": self.rejected, "timed_out": self.timed_out}
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
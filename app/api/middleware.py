@@ -0,0 +1,34 @@
+# app/api/middleware.py
+from app.utils import trace
+
+
+class TraceMiddleware:
+    """
+    Pure ASGI middleware running each HTTP request in a trace_scope: sampled
+    1 in TRACE_SAMPLE_EVERY, or forced by sending the TRACE_HEADER header
+    (any value but "0"). Traced responses carry the id in X-Trace-Id, to
+    find the request's records in the log file.
+    """
+
+    def __init__(self, app, header: str = trace.TRACE_HEADER):
+        self.app = app
+        self.header = header.lower().encode('latin-1')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        force = any(k == self.header and v not in (b'', b'0') for k, v in scope['headers'])
+        with trace.trace_scope(force=force) as trace_id:
+            if trace_id is None:
+                await self.app(scope, receive, send)
+                return
+
+            async def send_with_id(message):
+                if message['type'] == 'http.response.start':
+                    headers = list(message.get('headers', [])) + [(b'x-trace-id', trace_id.encode('latin-1'))]
+                    message = {**message, 'headers': headers}
+                await send(message)
+
+            trace.event('request', method=scope['method'], path=scope['path'])
+            await self.app(scope, receive, send_with_id)
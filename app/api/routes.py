@@ -1,13 +1,179 @@
 # app/api/routes.py
-from fastapi import FastAPI
-from app.core.path_resolver import PathResolver, load_fields_config
-from app.core.rule_loader import load_rules
+import json
+from typing import List, NamedTuple
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+from app.api.admission import AdmissionController
+from app.api.middleware import TraceMiddleware
+from app.api.streaming import RequestStreamingResponse
+from app.core.base_validator import NOT_APPLICABLE, PASS, results_to_dicts
+from app.core.mongo_client import MongoClientWrapper, close_clients
+from app.core.projections import build_projections
+from app.core.result_cache import build_result_cache
+from app.core.result_store import RESULT_STORE_ENABLED, ResultStore, build_result_store
+from app.core.rule_plan import load_rule_plan, select_rules
 from app.core.rule_dispatcher import RuleDispatcher
+from app.utils import metrics
+from app.utils.date_utils import parse_date
+from app.utils.fuzzy_matcher import load_scorer
+from app.utils.json_stream import JSONStreamSplitter, StreamFormatError
+from app.utils.serialization import dumps_json, encode, negotiate, result_dicts
 
 app = FastAPI(title="Mortgage Rule Engine API")
+app.add_middleware(TraceMiddleware)
+
+# rules.yaml + fields.yaml are compiled once when the app starts;
+# requests only pay for evaluating the loan itself.
+dispatcher = RuleDispatcher(plan=load_rule_plan(), cache=build_result_cache())
+
+# evaluations run on a dedicated, bounded executor; see app/api/admission.py
+admission = AdmissionController()
+
+_mongo: MongoClientWrapper = None
+_store: ResultStore = None
+_ready = False
+
+def get_mongo() -> MongoClientWrapper:
+    """
+    Shared wrapper over the pooled client (override in tests). Only the
+    fields the rule plan can read are fetched.
+    """
+    global _mongo
+    if _mongo is None:
+        _mongo = MongoClientWrapper(projections=build_projections(dispatcher.plan))
+    return _mongo
+
+def get_result_store() -> ResultStore:
+    """Write-behind store of full evaluations; None unless RESULT_STORE_ENABLED."""
+    global _store
+    if _store is None and RESULT_STORE_ENABLED:
+        _store = build_result_store(get_mongo().db)
+    return _store
+
+@app.on_event("startup")
+def warm_up():
+    """
+    Load what was left out of startup imports (rapidfuzz, dateutil) and run
+    one evaluation, so the first request doesn't pay for it. uvicorn only
+    accepts connections once this has run; GET /ready reports it too.
+    """
+    global _ready
+    load_scorer()
+    parse_date("January 1, 2000")
+    dispatcher.evaluate({})
+    _ready = True
+
+@app.get("/ready")
+def ready():
+    if not _ready:
+        raise HTTPException(status_code=503, detail="warming up")
+    return {"ready": True, "plan_version": dispatcher.plan.version}
+
+@app.on_event("shutdown")
+def _close_mongo():
+    if _store is not None:
+        _store.close()
+    close_clients()
+    admission.shutdown()
+
+class EvaluationOptions(NamedTuple):
+    # bitmask of the rules to evaluate (see rule_plan.select_rules)
+    only: int
+    fail_fast: bool
+    alerts_only: bool
+    compact: bool
+
+def _split(value: str) -> List[str]:
+    return None if value is None else [v.strip() for v in value.split(',') if v.strip()]
+
+def evaluation_options(rules: str = None, prefix: str = None, tags: str = None,
+                       fail_fast: bool = False, alerts_only: bool = False,
+                       compact: bool = False) -> EvaluationOptions:
+    """
+    Query options shared by the validate endpoints (comma-separated lists):
+      rules=PPV-0001..PPV-0012,PPV-0020  only these rules ("A..B" is a range)
+      prefix=PPV-00                      only rules whose id starts with one of these
+      tags=simple,complex                only rules with one of these tags / types
+      fail_fast=true                     stop at the first ALERT, leave out the rest
+      alerts_only=true                   leave PASS and NOT_APPLICABLE out of the response
+      compact=true                       details only on non-PASS results
+    Rules outside the selection aren't evaluated and aren't in the response.
+    """
+    if rules is None and prefix is None and tags is None:
+        return EvaluationOptions(-1, fail_fast, alerts_only, compact)
+    try:
+        only = select_rules(dispatcher.plan, _split(rules), _split(prefix), _split(tags))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return EvaluationOptions(only, fail_fast, alerts_only, compact)
+
+ALL_RULES = EvaluationOptions(-1, False, False, False)
+
+def _evaluate(context, options: EvaluationOptions):
+    if options.only == -1 and not options.fail_fast:
+        return dispatcher.evaluate(context)
+    return dispatcher.evaluate_selected(context, options.only, options.fail_fast)
+
+def _result_dicts(results, options: EvaluationOptions):
+    if options.alerts_only:
+        results = [r for r in results if r.status is not PASS and r.status is not NOT_APPLICABLE]
+    return result_dicts(results, options.compact)
+
+def _evaluate_and_encode(loan_id, context, options: EvaluationOptions, media_type: str, keep: bool = False):
+    """
+    One loan's response body, and its result dicts if `keep`; runs on the
+    evaluation executor. Dicts rather than ValidationResults, which a
+    process executor can't pickle back (NO_DETAILS is a mappingproxy).
+    """
+    results = _evaluate(context, options)
+    with metrics.stage('serialize'):
+        body, media_type = encode({"loan_id": loan_id, "results": _result_dicts(results, options)}, media_type)
+    return body, media_type, results_to_dicts(results) if keep else None
+
+async def _respond(request: Request, loan_id, context, options: EvaluationOptions) -> Response:
+    """
+    Evaluate once admitted; JSON, or msgpack when the Accept header asks
+    for it. Full evaluations go to the result store when it is enabled.
+    """
+    store = None
+    if loan_id is not None and options.only == -1 and not options.fail_fast:
+        store = get_result_store()
+    body, media_type, results = await admission.run(_evaluate_and_encode, loan_id, context, options,
+                                                    negotiate(request.headers.get('accept')),
+                                                    store is not None)
+    if results is not None:
+        # never hold up the response: a full queue drops the write
+        store.put(loan_id, dispatcher.plan.version, results, timeout=0)
+    return Response(body, media_type=media_type)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus text format; empty unless METRICS_ENABLED is set."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit / miss / eviction counters of the per-rule result cache."""
+    if dispatcher.cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **dispatcher.cache.stats()}
+
+@app.get("/results/stats")
+def result_store_stats():
+    """Queued / written / unchanged / dropped counts of the result store."""
+    store = get_result_store()
+    if store is None:
+        return {"enabled": False}
+    return {"enabled": True, **store.stats()}
+
+@app.get("/admission/stats")
+def admission_stats():
+    """Evaluation slots, admission queue depth, in-flight and rejected counts."""
+    return admission.stats()
 
 @app.post("/validate")
-def validate(payload: dict):
+async def validate(payload: dict, request: Request, options: EvaluationOptions = Depends(evaluation_options)):
     """
     Payload expected to be the combined context:
     {
@@ -17,9 +183,68 @@ def validate(payload: dict):
       "credit_report": { ... },
       "drive_report": { ... }
     }
+    See evaluation_options for selecting rules and trimming the response;
+    send `Accept: application/msgpack` for msgpack. Answers 429 / 503 with
+    Retry-After when the evaluation queue is saturated.
+    """
+    return await _respond(request, payload.get('los', {}).get('loan_id'), payload, options)
+
+@app.get("/validate/{loan_id}")
+async def validate_loan(loan_id: str, request: Request, mongo: MongoClientWrapper = Depends(get_mongo),
+                  options: EvaluationOptions = Depends(evaluation_options)):
     """
-    resolver = PathResolver(load_fields_config())
-    rules = load_rules()
-    dispatcher = RuleDispatcher(resolver=resolver, rules=rules)
-    results = dispatcher.evaluate(payload)
-    return {"loan_id": payload.get('los', {}).get('loan_id'), "results": results}
+    Load the loan's LOS, Title, Appraisal, CreditReport and DriveReport
+    documents (fetched concurrently) and evaluate them server-side.
+    """
+    context = await run_in_threadpool(mongo.load_context, loan_id)
+    if not context.get('los'):
+        raise HTTPException(status_code=404, detail=f"loan '{loan_id}' not found")
+    return await _respond(request, loan_id, context, options)
+
+def _evaluate_document(index: int, doc: bytes, options: EvaluationOptions = ALL_RULES) -> bytes:
+    """Evaluate one raw context from a batch; failures are reported inline."""
+    loan_id = None
+    try:
+        payload = json.loads(doc)
+        if not isinstance(payload, dict):
+            raise ValueError("context must be a JSON object")
+        loan_id = (payload.get('los') or {}).get('loan_id')
+        results = _evaluate(payload, options)
+    except Exception as e:
+        return dumps_json({"index": index, "loan_id": loan_id, "error": str(e)}) + b"\n"
+    with metrics.stage('serialize'):
+        return dumps_json({"index": index, "loan_id": loan_id,
+                           "results": _result_dicts(results, options)}) + b"\n"
+
+@app.post("/validate/batch")
+async def validate_batch(request: Request, options: EvaluationOptions = Depends(evaluation_options)):
+    """
+    Body: combined contexts (same shape as POST /validate) either as NDJSON,
+    one context per line, or as a JSON array.
+    Response: NDJSON, one line per context in input order, written as soon
+    as that context is evaluated:
+      {"index": 0, "loan_id": "...", "results": [...]}
+      {"index": 1, "loan_id": null, "error": "..."}
+    The body is parsed incrementally, so batches larger than memory are fine.
+    Takes the same query options as POST /validate. Contexts are evaluated
+    on the same executor as single requests, but once a batch is accepted
+    its contexts wait for a slot instead of being rejected.
+    """
+    async def lines():
+        splitter = JSONStreamSplitter()
+        index = 0
+        try:
+            async for chunk in request.stream():
+                for doc in splitter.feed(chunk):
+                    yield await admission.run(_evaluate_document, index, doc, options, reject=False)
+                    index += 1
+            for doc in splitter.close():
+                yield await admission.run(_evaluate_document, index, doc, options, reject=False)
+                index += 1
+        except StreamFormatError as e:
+            # the stream can't be split any further; report where it broke
+            yield dumps_json({"index": index, "loan_id": None, "error": str(e)}) + b"\n"
+        except ClientDisconnect:
+            return
+
+    return RequestStreamingResponse(lines(), media_type="application/x-ndjson")
@@ -0,0 +1,20 @@
+# app/api/streaming.py
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+
+class RequestStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse for endpoints that keep reading the request body while
+    the response is being streamed (request in, results out).
+
+    The stock StreamingResponse listens for client disconnects by calling
+    receive() in parallel, which would swallow request body chunks. Here the
+    body iterator owns receive(); a client disconnect surfaces as
+    ClientDisconnect from request.stream() and ends the iterator.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
@@ -0,0 +1,377 @@
+# app/batch.py
+"""
+Offline batch runner.
+
+    python -m app.batch contexts/            -o results.jsonl   # one context per *.json file
+    python -m app.batch contexts.jsonl       -o results.jsonl   # one context per line
+    python -m app.batch --mongo '{"Loan Details.Investor": "Fannie Mae"}' -o results.parquet
+
+Loans are evaluated in chunks across a process pool; every worker compiles
+its own rule plan once. Output lines have the same shape as
+POST /validate/batch. With --mongo a worker fetches its chunk's contexts
+with one `$in` query per collection (MongoClientWrapper.stream_contexts)
+rather than five find_one per loan. After each chunk is written the
+checkpoint file (<output>.ckpt) records it, so re-running the same command
+after a crash picks up where the last run stopped. A .parquet output is staged as
+<output>.jsonl and converted when the run completes (needs pyarrow).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from app.utils.serialization import dumps_json, result_dicts
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_CHUNK_SIZE = 250
+# seconds between progress log lines
+PROGRESS_INTERVAL = 10
+
+# per-worker state, set up by _init_worker
+_dispatcher = None
+_mongo = None
+_columnar = None
+
+
+class CheckpointError(RuntimeError):
+    """The checkpoint belongs to a different run than the one requested."""
+
+
+def _init_worker(mongo_uri: Optional[str], mongo_db: Optional[str], columnar: bool):
+    global _dispatcher, _mongo, _columnar
+    from app.core.rule_dispatcher import RuleDispatcher
+    from app.core.rule_plan import load_rule_plan
+    _dispatcher = RuleDispatcher(plan=load_rule_plan())
+    if mongo_uri is not None:
+        from app.core.mongo_client import MongoClientWrapper
+        from app.core.projections import build_projections
+        _mongo = MongoClientWrapper(uri=mongo_uri, db_name=mongo_db,
+                                    projections=build_projections(_dispatcher.plan))
+    if columnar:
+        from app.core.vectorized import ColumnarEvaluator
+        _columnar = ColumnarEvaluator(_dispatcher)
+
+
+def _load(kind: str, item: Any) -> Dict[str, Any]:
+    if kind == 'file':
+        with open(item, 'rb') as fh:
+            context = json.loads(fh.read())
+    else:
+        context = json.loads(item)
+    if not isinstance(context, dict):
+        raise ValueError("context must be a JSON object")
+    return context
+
+
+def _line(index: int, source: Optional[str], loan_id: Any, results=None, error=None) -> str:
+    line = {"index": index, "loan_id": loan_id}
+    if source is not None:
+        line["source"] = source
+    if error is None:
+        line["results"] = result_dicts(results)
+    else:
+        line["error"] = error
+    return dumps_json(line).decode('utf-8') + "\n"
+
+
+def _load_chunk(kind: str, items: List[Any]) -> Iterator[Any]:
+    """The context of each item in order, or the exception loading it raised."""
+    if kind != 'mongo':
+        for item in items:
+            try:
+                yield _load(kind, item)
+            except Exception as e:
+                yield e
+        return
+    # the whole chunk in one $in query per collection
+    try:
+        contexts = [context for _, context in _mongo.stream_contexts(items, chunk_size=len(items))]
+    except Exception as e:
+        contexts = [e] * len(items)
+    for loan_id, context in zip(items, contexts):
+        if isinstance(context, dict) and not context['los']:
+            context = LookupError(f"LOS document not found for loan_id {loan_id}")
+        yield context
+
+
+def _run_chunk(task: Tuple[int, str, int, List[Any]]) -> Tuple[int, int, str]:
+    """
+    Evaluate one chunk in a worker. Returns (chunk_id, loans, output text);
+    failures of single loans are reported inline like the batch endpoint.
+    """
+    chunk_id, kind, first_index, items = task
+    loaded = []
+    for i, (item, context) in enumerate(zip(items, _load_chunk(kind, items))):
+        source = os.path.basename(item) if kind == 'file' else None
+        loan_id = item if kind == 'mongo' else None
+        if isinstance(context, Exception):
+            loaded.append((first_index + i, source, loan_id, None, str(context)))
+            continue
+        if loan_id is None:
+            loan_id = (context.get('los') or {}).get('loan_id')
+        loaded.append((first_index + i, source, loan_id, context, None))
+
+    ok = [entry for entry in loaded if entry[4] is None]
+    results: Dict[int, Any] = {}
+    if _columnar is not None and ok:
+        try:
+            for entry, res in zip(ok, _columnar.evaluate([entry[3] for entry in ok])):
+                results[entry[0]] = res
+        except Exception:
+            # one odd context spoils the whole column; redo the chunk loan by loan
+            results.clear()
+    out = []
+    for index, source, loan_id, context, error in loaded:
+        if error is None and index not in results:
+            try:
+                results[index] = _dispatcher.evaluate(context)
+            except Exception as e:
+                error = str(e)
+        out.append(_line(index, source, loan_id, results.get(index), error))
+    return chunk_id, len(items), ''.join(out)
+
+
+def _read_checkpoint(path: str, header: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Chunk records of a previous run of the same job. A torn last record
+    (killed mid-write) is ignored.
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as fh:
+        lines = fh.read().splitlines()
+    if not lines:
+        return []
+    try:
+        previous = json.loads(lines[0])
+    except ValueError:
+        previous = None
+    if previous != header:
+        raise CheckpointError(f"{path} was written for a different run; pass --restart to discard it")
+    records = []
+    for raw in lines[1:]:
+        try:
+            records.append(json.loads(raw))
+        except ValueError:
+            break
+    return records
+
+
+class _Source:
+    """Deterministically ordered work items of one run, split into chunks."""
+
+    def __init__(self, kind: str, description: str, chunk_size: int):
+        self.kind = kind
+        self.description = description
+        self.chunk_size = chunk_size
+
+    def items(self) -> Iterator[Any]:
+        raise NotImplementedError
+
+    def chunks(self, skip: Set[int]) -> Iterator[Tuple[int, str, int, List[Any]]]:
+        chunk: List[Any] = []
+        chunk_id = index = 0
+        for item in self.items():
+            chunk.append(item)
+            if len(chunk) == self.chunk_size:
+                if chunk_id not in skip:
+                    yield chunk_id, self.kind, index, chunk
+                chunk_id, index, chunk = chunk_id + 1, index + len(chunk), []
+        if chunk and chunk_id not in skip:
+            yield chunk_id, self.kind, index, chunk
+
+
+class _DirectorySource(_Source):
+    def __init__(self, path: str, chunk_size: int):
+        super().__init__('file', os.path.abspath(path), chunk_size)
+        self.path = path
+
+    def items(self) -> Iterator[str]:
+        for name in sorted(os.listdir(self.path)):
+            if name.endswith('.json'):
+                yield os.path.join(self.path, name)
+
+
+class _JSONLSource(_Source):
+    def __init__(self, path: str, chunk_size: int):
+        super().__init__('line', os.path.abspath(path), chunk_size)
+        self.path = path
+
+    def items(self) -> Iterator[bytes]:
+        # lines are handed to workers unparsed; decoding happens in parallel
+        with open(self.path, 'rb') as fh:
+            for line in fh:
+                line = line.strip()
+                if line:
+                    yield line
+
+
+class _MongoSource(_Source):
+    def __init__(self, query: Dict[str, Any], uri: Optional[str], db_name: Optional[str], chunk_size: int):
+        super().__init__('mongo', json.dumps(query, sort_keys=True), chunk_size)
+        self.query = query
+        self.uri = uri
+        self.db_name = db_name
+
+    def items(self) -> Iterator[Any]:
+        from app.core.mongo_client import LOS_COLLECTION, MongoClientWrapper
+        mongo = MongoClientWrapper(uri=self.uri, db_name=self.db_name)
+        cursor = mongo.db[LOS_COLLECTION].find(self.query, {'loan_id': 1, '_id': 0}).sort('loan_id', 1)
+        for doc in cursor:
+            if doc.get('loan_id') is not None:
+                yield doc['loan_id']
+
+
+def _write_parquet(jsonl_path: str, parquet_path: str):
+    """One row per (loan, rule); details are kept as JSON text."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError(f"pyarrow is required for Parquet output; JSONL results are in {jsonl_path}")
+    columns = ('index', 'source', 'loan_id', 'rule_id', 'status', 'message', 'details', 'error')
+    schema = pa.schema([('index', pa.int64())] + [(c, pa.string()) for c in columns[1:]])
+    writer = pq.ParquetWriter(parquet_path, schema)
+    try:
+        batch: List[Dict[str, Any]] = []
+        with open(jsonl_path, 'r', encoding='utf-8') as fh:
+            for raw in fh:
+                line = json.loads(raw)
+                base = {'index': line['index'], 'source': line.get('source'),
+                        'loan_id': None if line.get('loan_id') is None else str(line['loan_id'])}
+                if 'error' in line:
+                    batch.append(dict(base, error=line['error']))
+                for r in line.get('results') or []:
+                    batch.append(dict(base, rule_id=r['rule_id'], status=r['status'], message=r['message'],
+                                      details=json.dumps(r['details'], default=str)))
+                if len(batch) >= 100000:
+                    writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                    batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+    finally:
+        writer.close()
+
+
+def run(source: _Source, output: str, workers: int = None, restart: bool = False,
+        columnar: bool = False) -> Dict[str, Any]:
+    """
+    Evaluate every loan of source into output, resuming from its checkpoint.
+    Returns run statistics (loans evaluated in this run, elapsed, loans/sec).
+    """
+    workers = workers or os.cpu_count() or 1
+    parquet = output.endswith('.parquet')
+    jsonl_path = output + '.jsonl' if parquet else output
+    ckpt_path = output + '.ckpt'
+    header = {'source': source.description, 'kind': source.kind, 'chunk_size': source.chunk_size}
+
+    if restart:
+        for path in (jsonl_path, ckpt_path):
+            if os.path.exists(path):
+                os.remove(path)
+    records = _read_checkpoint(ckpt_path, header)
+    done = {r['chunk'] for r in records}
+    offset = max((r['offset'] for r in records), default=0)
+    resumed = sum(r['loans'] for r in records)
+    if done:
+        logger.info(f"Resuming: {len(done)} chunks ({resumed} loans) already written")
+
+    out = open(jsonl_path, 'ab')
+    ckpt = open(ckpt_path, 'w', encoding='utf-8')
+    try:
+        # drop lines written after the last checkpointed chunk
+        out.truncate(offset)
+        # rewritten without any torn record so new records append cleanly
+        ckpt.writelines(json.dumps(r) + "\n" for r in [header] + records)
+        ckpt.flush()
+
+        mongo = source if isinstance(source, _MongoSource) else None
+        initargs = ((mongo.uri or _default_uri()) if mongo else None, mongo.db_name if mongo else None, columnar)
+        started = last_report = time.perf_counter()
+        loans = 0
+        # spawn: workers must not inherit the parent's Mongo sockets
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=initargs) as pool:
+            tasks = source.chunks(done)
+            pending = set()
+            # bounded window so a huge input is never queued in memory at once
+            window = workers * 2
+            while True:
+                for task in tasks:
+                    pending.add(pool.submit(_run_chunk, task))
+                    if len(pending) >= window:
+                        break
+                if not pending:
+                    break
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    chunk_id, count, text = future.result()
+                    out.write(text.encode('utf-8'))
+                    out.flush()
+                    os.fsync(out.fileno())
+                    ckpt.write(json.dumps({'chunk': chunk_id, 'offset': out.tell(), 'loans': count}) + "\n")
+                    ckpt.flush()
+                    loans += count
+                now = time.perf_counter()
+                if now - last_report >= PROGRESS_INTERVAL:
+                    last_report = now
+                    logger.info(f"{resumed + loans} loans written, {loans / (now - started):.0f} loans/sec")
+        elapsed = time.perf_counter() - started
+    finally:
+        out.close()
+        ckpt.close()
+
+    if parquet:
+        _write_parquet(jsonl_path, output)
+    stats = {'loans': loans, 'total': resumed + loans, 'elapsed': round(elapsed, 3),
+             'loans_per_sec': round(loans / elapsed, 1) if elapsed else 0.0, 'workers': workers}
+    logger.info(f"Done: {loans} loans in {elapsed:.1f}s ({stats['loans_per_sec']} loans/sec, "
+                f"{workers} workers); {stats['total']} loans in {output}")
+    return stats
+
+
+def _default_uri() -> str:
+    from app.core.mongo_client import MONGO_URI
+    return MONGO_URI
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m app.batch', description="Evaluate loans offline in bulk.")
+    parser.add_argument('input', nargs='?', help="directory of *.json contexts or a JSONL file")
+    parser.add_argument('--mongo', metavar='QUERY', help="LOS filter (JSON) selecting the loan_ids to evaluate")
+    parser.add_argument('--mongo-uri', help="defaults to MONGO_URI")
+    parser.add_argument('--mongo-db', help="defaults to MONGO_DB")
+    parser.add_argument('-o', '--output', required=True, help="results file (.jsonl or .parquet)")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--columnar', action='store_true', help="evaluate each chunk column-wise (needs numpy)")
+    parser.add_argument('--restart', action='store_true', help="discard the checkpoint and previous output")
+    args = parser.parse_args(argv)
+
+    if (args.input is None) == (args.mongo is None):
+        parser.error("give either an input path or --mongo")
+    if args.mongo is not None:
+        source = _MongoSource(json.loads(args.mongo), args.mongo_uri, args.mongo_db, args.chunk_size)
+    elif os.path.isdir(args.input):
+        source = _DirectorySource(args.input, args.chunk_size)
+    elif os.path.isfile(args.input):
+        source = _JSONLSource(args.input, args.chunk_size)
+    else:
+        parser.error(f"{args.input} not found")
+
+    try:
+        stats = run(source, args.output, workers=args.workers, restart=args.restart, columnar=args.columnar)
+    except RuntimeError as e:
+        logger.error(str(e))
+        return 1
+    print(json.dumps(stats))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,63 @@
 # app/core/base_validator.py
-from typing import Dict, Any
+import sys
+from types import MappingProxyType
+from typing import Dict, Any, Iterable, List, Mapping, NamedTuple
+
+# Result statuses; interned so status checks are identity comparisons
+PASS = sys.intern("PASS")
+ALERT = sys.intern("ALERT")
+CONDITION = sys.intern("CONDITION")
+NOT_APPLICABLE = sys.intern("NOT_APPLICABLE")
+ERROR = sys.intern("ERROR")
+
+# Shared, read-only details of results that carry none
+NO_DETAILS: Mapping[str, Any] = MappingProxyType({})
+
+
+class ValidationResult(NamedTuple):
+    """
+    Outcome of one rule for one loan. Immutable and tuple-backed; turned
+    into the JSON shape with to_dict() at the API / output boundary.
+    """
+    rule_id: str
+    status: str
+    message: str
+    details: Mapping[str, Any]
+
+    def to_dict(self) -> Dict[str, Any]:
+        details = self.details
+        return {"rule_id": self.rule_id, "status": self.status, "message": self.message,
+                "details": {} if details is NO_DETAILS else details}
+
+
+def results_to_dicts(results: Iterable[ValidationResult]) -> List[Dict[str, Any]]:
+    return [r.to_dict() for r in results]
+
 
 class BaseValidator:
+    """
+    Validators are stateless: the rule plan creates one instance per class
+    and shares it across rules, requests and threads.
+    """
+    # fields.yaml fields read by evaluate(), per collection. None means
+    # undeclared: the rule is re-run whenever any source document changes.
+    reads: Dict[str, List[str]] = None
+    # Keys read straight from the context rather than through fields.yaml,
+    # per collection, as '->' paths. Used to build loader projections.
+    raw_reads: Dict[str, List[str]] = {}
+    # Serve results from the dispatcher's ResultCache. Only worth it when
+    # evaluate() costs clearly more than resolving and repr-ing its reads
+    # (date parsing, fuzzy matching); plain field checks are faster to re-run.
+    cache_results: bool = False
+
     def pass_result(self, rule: Dict[str, Any], details=None):
-        return {"rule_id": rule.get("id"), "status": "PASS", "message": "", "details": details or {}}
+        return ValidationResult(rule.get("id"), PASS, "", details or NO_DETAILS)
 
     def alert_result(self, rule: Dict[str, Any], message=None, details=None):
-        return {"rule_id": rule.get("id"), "status": "ALERT", "message": message or rule.get("alert_message",""), "details": details or {}}
+        return ValidationResult(rule.get("id"), ALERT, message or rule.get("alert_message",""), details or NO_DETAILS)
 
     def condition_result(self, rule: Dict[str, Any], message=None, details=None):
-        return {"rule_id": rule.get("id"), "status": "CONDITION", "message": message or rule.get("condition_message",""), "details": details or {}}
+        return ValidationResult(rule.get("id"), CONDITION, message or rule.get("condition_message",""), details or NO_DETAILS)
 
     def not_applicable_result(self, rule: Dict[str, Any]):
-        return {"rule_id": rule.get("id"), "status": "NOT_APPLICABLE", "message": "", "details": {}}
+        return ValidationResult(rule.get("id"), NOT_APPLICABLE, "", NO_DETAILS)
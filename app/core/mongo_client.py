@@ -1,8 +1,14 @@
 # app/core/mongo_client.py
-from pymongo import MongoClient
 import os
-from dotenv import load_dotenv
-load_dotenv()
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from .context_builder import build_context_from_docs
+from app.utils import metrics
+
+if TYPE_CHECKING:
+    from pymongo import MongoClient
 
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 MONGO_DB = os.getenv("MONGO_DB", "MortgageAI")
@@ -11,23 +17,209 @@ TITLE_COLLECTION = os.getenv("TITLE_COLLECTION", "Title")
 APPRAISAL_COLLECTION = os.getenv("APPRAISAL_COLLECTION", "Appraisal")
 CREDIT_COLLECTION = os.getenv("CREDIT_COLLECTION", "CreditReport")
 DRIVE_COLLECTION = os.getenv("DRIVE_COLLECTION", "DriveReport")
+# engine collection name (context key) -> MongoDB collection
+SOURCE_COLLECTIONS = {
+    'los': LOS_COLLECTION,
+    'title': TITLE_COLLECTION,
+    'appraisal': APPRAISAL_COLLECTION,
+    'credit_report': CREDIT_COLLECTION,
+    'drive_report': DRIVE_COLLECTION,
+}
+
+# Connection pool / timeouts for the shared client
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "10000"))
+# Threads used to fetch the five source documents of a loan in parallel
+MONGO_LOADER_THREADS = int(os.getenv("MONGO_LOADER_THREADS", "32"))
+# Fetch source documents as RawBSONDocuments: each subdocument is decoded
+# when a rule first reads into it, the rest stays undecoded BSON bytes
+MONGO_RAW_DOCUMENTS = os.getenv("MONGO_RAW_DOCUMENTS", "false").lower() in ("1", "true", "yes")
+# Loans per chunk of stream_contexts ($in list length), and documents per
+# cursor batch (getMore round trip) when fetching those chunks
+MONGO_CONTEXT_CHUNK_SIZE = int(os.getenv("MONGO_CONTEXT_CHUNK_SIZE", "500"))
+MONGO_CURSOR_BATCH_SIZE = int(os.getenv("MONGO_CURSOR_BATCH_SIZE", "1000"))
+
+_clients: Dict[str, "MongoClient"] = {}
+_clients_lock = threading.Lock()
+_loader_pool: ThreadPoolExecutor = None
+
+
+def get_client(uri: str = None) -> "MongoClient":
+    """
+    Process-wide pooled client per URI. MongoClient is thread-safe and keeps
+    its own connection pool, so it should be created once and shared.
+    """
+    uri = uri or MONGO_URI
+    client = _clients.get(uri)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(uri)
+            if client is None:
+                # imported here: pymongo takes a while to import and the API
+                # only needs it once a loan is fetched by id
+                from pymongo import MongoClient
+                client = _clients[uri] = MongoClient(
+                    uri,
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    minPoolSize=MONGO_MIN_POOL_SIZE,
+                    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                    socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+                )
+    return client
+
+
+def _get_loader_pool() -> ThreadPoolExecutor:
+    global _loader_pool
+    if _loader_pool is None:
+        with _clients_lock:
+            if _loader_pool is None:
+                _loader_pool = ThreadPoolExecutor(max_workers=MONGO_LOADER_THREADS,
+                                                  thread_name_prefix="mongo-loader")
+    return _loader_pool
+
+
+def close_clients():
+    """Close shared clients and the loader pool (application shutdown)."""
+    global _loader_pool
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+        if _loader_pool is not None:
+            _loader_pool.shutdown(wait=False)
+            _loader_pool = None
+
 
 class MongoClientWrapper:
-    def __init__(self, uri: str = None, db_name: str = None):
-        self.client = MongoClient(uri or MONGO_URI)
+    def __init__(self, uri: str = None, db_name: str = None, client=None,
+                 projections: Dict[str, Optional[Dict[str, int]]] = None,
+                 raw: bool = None):
+        """
+        Uses the shared pooled client for `uri`; pass `client` to use a
+        specific one instead (e.g. mongomock in tests).
+        `projections` maps 'los' / 'title' / 'appraisal' / 'credit_report' /
+        'drive_report' to a find() projection (see core.projections);
+        collections without one are fetched whole.
+        `raw` (default MONGO_RAW_DOCUMENTS) returns the source documents as
+        RawBSONDocuments; `db` itself always decodes normally.
+        """
+        self.client = client or get_client(uri)
         self.db = self.client[db_name or MONGO_DB]
+        self.projections = projections or {}
+        self.raw = MONGO_RAW_DOCUMENTS if raw is None else raw
+        self._sources = {key: self._source(name) for key, name in SOURCE_COLLECTIONS.items()}
+
+    def _source(self, name: str):
+        collection = self.db[name]
+        if not self.raw:
+            return collection
+        from bson.codec_options import CodecOptions
+        from bson.raw_bson import RawBSONDocument
+        return collection.with_options(codec_options=CodecOptions(document_class=RawBSONDocument))
+
+    def _get(self, key: str, loan_id):
+        doc = self._sources[key].find_one({'loan_id': loan_id}, self.projections.get(key))
+        return {} if doc is None else doc
 
     def get_los(self, loan_id):
-        return self.db[LOS_COLLECTION].find_one({'loan_id': loan_id}) or {}
+        return self._get('los', loan_id)
 
     def get_title(self, loan_id):
-        return self.db[TITLE_COLLECTION].find_one({'loan_id': loan_id}) or {}
+        return self._get('title', loan_id)
 
     def get_appraisal(self, loan_id):
-        return self.db[APPRAISAL_COLLECTION].find_one({'loan_id': loan_id}) or {}
+        return self._get('appraisal', loan_id)
 
     def get_credit(self, loan_id):
-        return self.db[CREDIT_COLLECTION].find_one({'loan_id': loan_id}) or {}
+        return self._get('credit_report', loan_id)
 
     def get_drive(self, loan_id):
-        return self.db[DRIVE_COLLECTION].find_one({'loan_id': loan_id}) or {}
+        return self._get('drive_report', loan_id)
+
+    def load_context(self, loan_id) -> Dict[str, Any]:
+        """
+        Fetch all five source documents of a loan concurrently and assemble
+        the engine context. Wall time is one round trip instead of five.
+        """
+        pool = _get_loader_pool()
+        with metrics.stage('context_fetch'):
+            futures = {
+                'los': pool.submit(self.get_los, loan_id),
+                'title': pool.submit(self.get_title, loan_id),
+                'appraisal': pool.submit(self.get_appraisal, loan_id),
+                'credit': pool.submit(self.get_credit, loan_id),
+                'drive': pool.submit(self.get_drive, loan_id),
+            }
+            return build_context_from_docs(**{name: f.result() for name, f in futures.items()})
+
+    def _find_chunk(self, key: str, loan_ids: List[Any], batch_size: int) -> Dict[Any, Any]:
+        """loan_id -> document of collection `key`, for one chunk of loan_ids."""
+        cursor = self._sources[key].find({'loan_id': {'$in': loan_ids}}, self.projections.get(key),
+                                         batch_size=batch_size)
+        docs = {}
+        for doc in cursor:
+            # the first document of a loan wins, as with find_one
+            docs.setdefault(doc['loan_id'], doc)
+        return docs
+
+    def _assemble(self, loan_ids: List[Any], batch_size: int,
+                  los: Dict[Any, Any] = None) -> Iterator[Tuple[Any, Dict[str, Any]]]:
+        """
+        (loan_id, context) per loan_id of one chunk. The collections are
+        fetched concurrently; LOS too unless its documents are given.
+        """
+        pool = _get_loader_pool()
+        keys = list(dict.fromkeys(loan_ids))
+        with metrics.stage('context_fetch'):
+            futures = {key: pool.submit(self._find_chunk, key, keys, batch_size)
+                       for key in SOURCE_COLLECTIONS if key != 'los' or los is None}
+            docs = {key: f.result() for key, f in futures.items()}
+        los = docs['los'] if los is None else los
+        title, appraisal, credit, drive = (docs['title'], docs['appraisal'],
+                                           docs['credit_report'], docs['drive_report'])
+        for loan_id in loan_ids:
+            yield loan_id, build_context_from_docs(
+                los=los.get(loan_id, {}), title=title.get(loan_id, {}), appraisal=appraisal.get(loan_id, {}),
+                credit=credit.get(loan_id, {}), drive=drive.get(loan_id, {}))
+
+    def stream_contexts(self, loan_ids: Iterable[Any] = None, query: Dict[str, Any] = None,
+                        chunk_size: int = None, batch_size: int = None) -> Iterator[Tuple[Any, Dict[str, Any]]]:
+        """
+        (loan_id, context) for many loans, assembled like load_context but
+        chunk_size loans at a time: one concurrent `$in` query per
+        collection and chunk instead of five find_one per loan. Give either
+        loan_ids (yielded in that order; a loan without an LOS document gets
+        an empty 'los') or a filter on the LOS collection (yielded in
+        loan_id order). Only one chunk is held in memory at a time.
+        """
+        if (loan_ids is None) == (query is None):
+            raise ValueError("give either loan_ids or query")
+        chunk_size = chunk_size or MONGO_CONTEXT_CHUNK_SIZE
+        batch_size = batch_size or MONGO_CURSOR_BATCH_SIZE
+        if loan_ids is not None:
+            ids = iter(loan_ids)
+            while True:
+                chunk = list(islice(ids, chunk_size))
+                if not chunk:
+                    return
+                yield from self._assemble(chunk, batch_size)
+        # the LOS documents come with the query; the other four by $in
+        cursor = self._sources['los'].find(query, self.projections.get('los'),
+                                           batch_size=batch_size).sort('loan_id', 1)
+        los: Dict[Any, Any] = {}
+        previous = None
+        for doc in cursor:
+            loan_id = doc.get('loan_id')
+            if loan_id is None or loan_id == previous:
+                continue
+            previous = loan_id
+            los[loan_id] = doc
+            if len(los) == chunk_size:
+                yield from self._assemble(list(los), batch_size, los)
+                los = {}
+        if los:
+            yield from self._assemble(list(los), batch_size, los)
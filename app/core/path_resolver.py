@@ -1,13 +1,17 @@
 # app/core/path_resolver.py
 import os
-import yaml
-from typing import Any, Dict
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from .rule_loader import load_yaml
+
+# Order in which collections are probed when a field is looked up by name only
+COLLECTIONS = ('los', 'title', 'appraisal', 'credit_report', 'drive_report')
+
+FIELDS_PATH = os.path.join(os.path.dirname(__file__), '..', 'config', 'fields.yaml')
+
 
 def load_fields_config(path: str = None) -> Dict[str, Dict]:
-    if path is None:
-        path = os.path.join(os.path.dirname(__file__), '..', 'config', 'fields.yaml')
-    with open(path, 'r', encoding='utf-8') as fh:
-        return yaml.safe_load(fh)
+    return load_yaml(path or FIELDS_PATH)
 
 
 class PathResolver:
@@ -15,44 +19,164 @@ class PathResolver:
 
     def __init__(self, fields_config: Dict[str, Dict] = None):
         self.fields = fields_config or load_fields_config()
+        # (collection, logical_name) -> (tuple of keys or None, default)
+        self._accessors: Dict[Tuple[str, str], Tuple[Any, Any]] = {}
+        # logical_name -> collections (in COLLECTIONS order) that define it
+        self._collections: Dict[str, Tuple[str, ...]] = {}
+        self._compile()
+
+    def _compile(self):
+        for collection, coll_fields in self.fields.items():
+            for logical_name, info in (coll_fields or {}).items():
+                info = info or {}
+                path = info.get('path')
+                keys = tuple(p.strip() for p in path.split(self.SEPARATOR)) if path else None
+                self._accessors[(collection, logical_name)] = (keys, info.get('default'))
+        for collection in COLLECTIONS:
+            for logical_name in (self.fields.get(collection) or {}):
+                self._collections[logical_name] = self._collections.get(logical_name, ()) + (collection,)
 
     def _get_field_info(self, collection: str, logical_name: str) -> Dict[str, Any]:
         coll = self.fields.get(collection, {})
         return coll.get(logical_name, {})
 
+    def collections_for(self, logical_name: str) -> Tuple[str, ...]:
+        """Collections whose fields.yaml section defines logical_name."""
+        return self._collections.get(logical_name, ())
+
+    def keys(self, collection: str, logical_name: str) -> Optional[Tuple[str, ...]]:
+        """Key path of logical_name in collection; None if it has no path."""
+        accessor = self._accessors.get((collection, logical_name))
+        return accessor[0] if accessor else None
+
+    def paths(self, collection: str) -> List[Tuple[str, ...]]:
+        """Key paths of every field fields.yaml defines for collection."""
+        return [keys for (coll, _), (keys, _) in self._accessors.items()
+                if coll == collection and keys]
+
     def resolve(self, context: Dict[str, Any], collection: str, logical_name: str) -> Any:
         """
         Resolve logical_name in given collection from context using fields.yaml mapping.
         Works with '->' separator so actual keys may contain '.' safely.
         Returns default if missing.
         """
-        info = self._get_field_info(collection, logical_name)
-        path = info.get('path')
-        default = info.get('default')
-
-        if not path:
+        accessor = self._accessors.get((collection, logical_name))
+        if accessor is None:
+            return None
+        keys, default = accessor
+        if keys is None:
             return default
 
-        # Start at root of the collection
+        # Start at root of the collection. Documents may be any Mapping, e.g.
+        # RawBSONDocuments that decode each level on first access
         cur = context.get(collection, {})
 
-        # Split using safe separator
-        parts = [p.strip() for p in path.split(self.SEPARATOR)]
-
-        for key in parts:
-            if isinstance(cur, dict) and key in cur:
+        for key in keys:
+            if (type(cur) is dict or isinstance(cur, Mapping)) and key in cur:
                 cur = cur[key]
             else:
                 return default
 
         return cur if cur is not None else default
 
+    def resolve_many(self, contexts: Sequence[Dict[str, Any]], collection: str,
+                     logical_name: str) -> List[Any]:
+        """
+        resolve() for the same field over many contexts (columnar evaluation).
+        """
+        accessor = self._accessors.get((collection, logical_name))
+        if accessor is None:
+            return [None] * len(contexts)
+        keys, default = accessor
+        if keys is None:
+            return [default] * len(contexts)
+        out = []
+        for context in contexts:
+            cur = context.get(collection, {})
+            for key in keys:
+                if (type(cur) is dict or isinstance(cur, Mapping)) and key in cur:
+                    cur = cur[key]
+                else:
+                    cur = default
+                    break
+            out.append(cur if cur is not None else default)
+        return out
+
     def resolve_any(self, context: Dict[str, Any], logical_name: str) -> Any:
         """
-        Try resolving logical_name across all collections.
+        Try resolving logical_name across the collections that define it.
         """
-        for coll in ['los', 'title', 'appraisal', 'credit_report', 'drive_report']:
+        for coll in self.collections_for(logical_name):
             val = self.resolve(context, coll, logical_name)
             if val not in [None, [], {}]:
                 return val
         return None
+
+    def shared(self, context: Dict[str, Any], key: str, build: Callable[[], Any]) -> Any:
+        """
+        Per-context helper structure (e.g. a tradeline index) built by
+        build(). Without a view there is nothing to share it with.
+        """
+        return build()
+
+    def view(self, context: Dict[str, Any]) -> "ResolvedView":
+        return ResolvedView(self, context)
+
+
+class ResolvedView:
+    """
+    Memoizing view of one context for the duration of one evaluation:
+    each (collection, logical_name) is walked at most once.
+    Exposes the PathResolver interface, so it can be handed to validators
+    in place of the resolver.
+    """
+    __slots__ = ('resolver', 'context', '_values', '_shared', 'truth')
+
+    def __init__(self, resolver: PathResolver, context: Dict[str, Any]):
+        self.resolver = resolver
+        self.context = context
+        self._values: Dict[Tuple[str, str], Any] = {}
+        self._shared: Dict[str, Any] = None
+        # trigger predicate slot -> outcome for this context (see rule_plan)
+        self.truth: Dict[int, bool] = {}
+
+    @property
+    def fields(self) -> Dict[str, Dict]:
+        return self.resolver.fields
+
+    def collections_for(self, logical_name: str) -> Tuple[str, ...]:
+        return self.resolver.collections_for(logical_name)
+
+    def get(self, collection: str, logical_name: str) -> Any:
+        key = (collection, logical_name)
+        try:
+            return self._values[key]
+        except KeyError:
+            val = self._values[key] = self.resolver.resolve(self.context, collection, logical_name)
+            return val
+
+    def resolve(self, context: Dict[str, Any], collection: str, logical_name: str) -> Any:
+        if context is not self.context:
+            return self.resolver.resolve(context, collection, logical_name)
+        return self.get(collection, logical_name)
+
+    def resolve_any(self, context: Dict[str, Any], logical_name: str) -> Any:
+        if context is not self.context:
+            return self.resolver.resolve_any(context, logical_name)
+        for coll in self.collections_for(logical_name):
+            val = self.get(coll, logical_name)
+            if val not in [None, [], {}]:
+                return val
+        return None
+
+    def shared(self, context: Dict[str, Any], key: str, build: Callable[[], Any]) -> Any:
+        """build() once per evaluation; every validator gets the same object."""
+        if context is not self.context:
+            return self.resolver.shared(context, key, build)
+        if self._shared is None:
+            self._shared = {}
+        try:
+            return self._shared[key]
+        except KeyError:
+            val = self._shared[key] = build()
+            return val
@@ -0,0 +1,61 @@
+# app/core/projections.py
+from typing import Dict, Iterable, Optional, Tuple
+from .path_resolver import COLLECTIONS, PathResolver
+from .rule_plan import RulePlan
+
+# Keys every loader needs regardless of rules (joins, response loan_id)
+ALWAYS_FETCH = (('loan_id',),)
+
+
+def _projectable(keys: Tuple[str, ...]) -> Tuple[str, ...]:
+    """
+    Longest prefix of a key path a MongoDB projection can address.
+    Projection paths are dotted, so a key containing '.' (or starting with
+    '$') can't be named; its parent subdocument is fetched whole instead.
+    """
+    out = []
+    for key in keys:
+        if not key or '.' in key or key.startswith('$'):
+            break
+        out.append(key)
+    return tuple(out)
+
+
+def build_projection(paths: Iterable[Tuple[str, ...]]) -> Optional[Dict[str, int]]:
+    """
+    Inclusion projection covering all key paths, or None when the whole
+    document is needed. Paths nested under another included path are
+    dropped (MongoDB rejects overlapping projection paths).
+    """
+    prefixes = set()
+    for keys in paths:
+        prefix = _projectable(keys)
+        if not prefix:
+            return None
+        prefixes.add(prefix)
+    kept = []
+    # ancestors sort directly before their descendants
+    for prefix in sorted(prefixes):
+        if kept and prefix[:len(kept[-1])] == kept[-1]:
+            continue
+        kept.append(prefix)
+    projection = {'.'.join(p): 1 for p in kept}
+    projection['_id'] = 0
+    return projection
+
+
+def build_projections(plan: RulePlan, resolver: PathResolver = None) -> Dict[str, Optional[Dict[str, int]]]:
+    """
+    Per-collection projections ('los', 'title', ...) for everything the plan
+    can read: every fields.yaml path plus the raw keys validators read from
+    the context directly (BaseValidator.raw_reads).
+    """
+    resolver = resolver or plan.resolver
+    paths = {coll: list(ALWAYS_FETCH) for coll in COLLECTIONS}
+    for coll in COLLECTIONS:
+        paths[coll].extend(resolver.paths(coll))
+    for validator_cls in {r.validator_cls for r in plan.rules}:
+        for coll, raw_paths in getattr(validator_cls, 'raw_reads', {}).items():
+            paths.setdefault(coll, list(ALWAYS_FETCH)).extend(
+                tuple(k.strip() for k in p.split(PathResolver.SEPARATOR)) for p in raw_paths)
+    return {coll: build_projection(p) for coll, p in paths.items()}
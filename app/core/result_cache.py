@@ -0,0 +1,224 @@
+# app/core/result_cache.py
+"""
+Per-rule result cache shared across requests.
+
+A rule's result is a function of the rule plan and of the values its
+validator reads (BaseValidator.reads / raw_reads), so the cache key is
+exactly those values plus the plan version (hashed for the shared
+backend). A rule is served from cache whenever its own inputs are
+unchanged, even if other parts of the loan changed. Triggers are still
+checked on every evaluation (they are cheap and memoized); only validator
+runs are cached, and only for validators with cache_results set.
+
+The evaluation date is part of the key: rules measuring against "now"
+(see date_utils.evaluation_now) change from one day to the next.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+from .base_validator import ERROR, NO_DETAILS, ValidationResult
+from .path_resolver import PathResolver, ResolvedView
+from .rule_plan import CompiledRule, RulePlan
+from app.utils.date_utils import now
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Entries kept in process memory (0 disables the cache)
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "50000"))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "3600"))
+# none | mongo: share entries between processes (e.g. uvicorn workers)
+RESULT_CACHE_BACKEND = os.getenv("RESULT_CACHE_BACKEND", "none")
+RESULT_CACHE_COLLECTION = os.getenv("RESULT_CACHE_COLLECTION", "RuleResultCache")
+
+_MISSING = object()
+
+# (plan version, rule id, evaluation day, repr of the values read)
+CacheKey = Tuple[str, str, int, str]
+
+# (field reads as (collection, logical_name), raw reads as (collection, keys))
+RuleInputs = Tuple[Tuple[Tuple[str, str], ...], Tuple[Tuple[str, Tuple[str, ...]], ...]]
+
+
+def rule_inputs(rule: CompiledRule) -> Optional[RuleInputs]:
+    """What a rule's validator reads; None if it isn't cached."""
+    cls = rule.validator_cls
+    if not cls.cache_results or cls.reads is None:
+        return None
+    fields = tuple((coll, name) for coll, names in sorted(cls.reads.items()) for name in names)
+    raw = tuple((coll, tuple(p.strip() for p in path.split(PathResolver.SEPARATOR)))
+                for coll, paths in sorted(cls.raw_reads.items()) for path in paths)
+    return fields, raw
+
+
+def _raw(context: Dict[str, Any], collection: str, keys: Tuple[str, ...]) -> Any:
+    cur = context.get(collection, _MISSING)
+    for key in keys:
+        if not isinstance(cur, Mapping) or key not in cur:
+            return _MISSING
+        cur = cur[key]
+    return cur
+
+
+def _digest(key: CacheKey) -> str:
+    return hashlib.blake2b(repr(key).encode('utf-8'), digest_size=20).hexdigest()
+
+
+def _utcnow() -> datetime:
+    # naive UTC, as pymongo returns datetimes
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class MongoCacheBackend:
+    """
+    Cache entries in a MongoDB collection, shared by every process using
+    it. Expired entries are ignored on read and removed by a TTL index.
+    """
+
+    def __init__(self, collection):
+        from pymongo.errors import PyMongoError
+        self.collection = collection
+        try:
+            collection.create_index('expires_at', expireAfterSeconds=0)
+        except PyMongoError as e:
+            logger.warning(f"Could not create TTL index on result cache: {e}")
+
+    def get_many(self, keys: Sequence[CacheKey]) -> Dict[CacheKey, ValidationResult]:
+        ids = {_digest(key): key for key in keys}
+        found = {}
+        for doc in self.collection.find({'_id': {'$in': list(ids)}, 'expires_at': {'$gt': _utcnow()}}):
+            rule_id, status, message, details = doc['r']
+            found[ids[doc['_id']]] = ValidationResult(rule_id, status, message, details or NO_DETAILS)
+        return found
+
+    def put_many(self, entries: Dict[CacheKey, ValidationResult], ttl: float):
+        from pymongo.errors import PyMongoError
+        expires_at = _utcnow() + timedelta(seconds=ttl)
+        docs = [{'_id': _digest(key), 'r': [r.rule_id, r.status, r.message, dict(r.details)],
+                 'expires_at': expires_at}
+                for key, r in entries.items()]
+        try:
+            # duplicate keys (stored by another process meanwhile) are fine
+            self.collection.insert_many(docs, ordered=False)
+        except PyMongoError:
+            pass
+
+
+class ResultCache:
+    """
+    LRU + TTL map from rule cache key to ValidationResult, in front of an
+    optional shared backend. Thread-safe; results are immutable and shared.
+    """
+
+    def __init__(self, maxsize: int = RESULT_CACHE_SIZE, ttl: float = RESULT_CACHE_TTL_SECONDS,
+                 backend: MongoCacheBackend = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.backend = backend
+        # key -> (expiry on time.monotonic(), result), least recently used first
+        self._entries: "OrderedDict[CacheKey, Tuple[float, ValidationResult]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inputs: Dict[Tuple[str, str], Optional[RuleInputs]] = {}
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, plan: RulePlan, rule: CompiledRule, view: ResolvedView) -> Optional[CacheKey]:
+        """Cache key of rule for the viewed context; None if it can't be cached."""
+        try:
+            inputs = self._inputs[(plan.version, rule.id)]
+        except KeyError:
+            inputs = self._inputs[(plan.version, rule.id)] = rule_inputs(rule)
+        if inputs is None:
+            return None
+        fields, raw = inputs
+        get = view.get
+        values = [get(coll, name) for coll, name in fields]
+        if raw:
+            context = view.context
+            values.extend(_raw(context, coll, keys) for coll, keys in raw)
+        # repr is exact for the JSON / BSON types contexts are made of
+        # (unlike ==, it tells 1, 1.0 and True apart)
+        return plan.version, rule.id, now().toordinal(), repr(values)
+
+    def get_many(self, keys: Iterable[CacheKey]) -> Dict[CacheKey, ValidationResult]:
+        """Cached results of the given keys (absent keys are misses)."""
+        found = {}
+        missing = []
+        clock = time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > clock:
+                    self._entries.move_to_end(key)
+                    found[key] = entry[1]
+                else:
+                    if entry is not None:
+                        del self._entries[key]
+                    missing.append(key)
+            self.hits += len(found)
+        shared = {}
+        if missing and self.backend is not None:
+            from pymongo.errors import PyMongoError
+            try:
+                shared = self.backend.get_many(missing)
+            except PyMongoError as e:
+                logger.warning(f"Shared result cache unavailable: {e}")
+            if shared:
+                self._store(shared)
+                found.update(shared)
+        with self._lock:
+            self.shared_hits += len(shared)
+            self.misses += len(missing) - len(shared)
+        return found
+
+    def put_many(self, entries: Dict[CacheKey, ValidationResult]):
+        # errors may be transient (bad deploy, resource limits): never cached
+        entries = {k: r for k, r in entries.items() if r.status is not ERROR}
+        if not entries:
+            return
+        self._store(entries)
+        if self.backend is not None:
+            self.backend.put_many(entries, self.ttl)
+
+    def _store(self, entries: Dict[CacheKey, ValidationResult]):
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for key, result in entries.items():
+                self._entries[key] = (expires, result)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {'size': len(self._entries), 'maxsize': self.maxsize, 'ttl_seconds': self.ttl,
+                    'hits': self.hits, 'shared_hits': self.shared_hits, 'misses': self.misses,
+                    'evictions': self.evictions,
+                    'hit_ratio': round((self.hits + self.shared_hits) / lookups, 4) if lookups else None}
+
+
+def build_result_cache(db=None) -> Optional[ResultCache]:
+    """The cache configured by RESULT_CACHE_*; None when disabled."""
+    if RESULT_CACHE_SIZE <= 0:
+        return None
+    backend = None
+    if RESULT_CACHE_BACKEND == 'mongo':
+        if db is None:
+            from .mongo_client import MongoClientWrapper
+            db = MongoClientWrapper().db
+        backend = MongoCacheBackend(db[RESULT_CACHE_COLLECTION])
+    return ResultCache(backend=backend)
@@ -0,0 +1,289 @@
+# app/core/result_store.py
+"""
+Write-behind store of evaluation results in RESULTS_COLLECTION.
+
+put() queues a loan's results and returns; a background thread writes
+them as unordered bulk_write batches of up to RESULT_STORE_BATCH_SIZE
+upserts, or whatever has arrived after RESULT_STORE_FLUSH_SECONDS. A
+document per (loan_id, plan_version) holds the results and their hash:
+results whose hash is the one last stored for that key aren't written
+at all, and the upsert filter also skips documents already holding the
+hash (so replays and other processes' writes are no-ops). The queue
+holds at most RESULT_STORE_MAX_QUEUE loans; close() flushes it.
+"""
+import hashlib
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from .base_validator import ValidationResult
+from app.utils import metrics
+from app.utils.logger import get_logger
+from app.utils.serialization import dumps_json
+
+logger = get_logger(__name__)
+
+RESULTS_COLLECTION = os.getenv("RESULTS_COLLECTION", "ValidationResults")
+# Persist the API's full evaluations (the worker always stores its results)
+RESULT_STORE_ENABLED = os.getenv("RESULT_STORE_ENABLED", "false").lower() in ("1", "true", "yes")
+RESULT_STORE_BATCH_SIZE = int(os.getenv("RESULT_STORE_BATCH_SIZE", "500"))
+RESULT_STORE_FLUSH_SECONDS = float(os.getenv("RESULT_STORE_FLUSH_SECONDS", "1"))
+RESULT_STORE_MAX_QUEUE = int(os.getenv("RESULT_STORE_MAX_QUEUE", "10000"))
+# How long put() waits for room in a full queue before dropping the results
+RESULT_STORE_PUT_TIMEOUT_SECONDS = float(os.getenv("RESULT_STORE_PUT_TIMEOUT_SECONDS", "5"))
+# (loan_id, plan version) keys whose last stored results hash is kept in memory
+RESULT_STORE_HASHES = int(os.getenv("RESULT_STORE_HASHES", "100000"))
+
+_DUPLICATE_KEY = 11000
+_STOP = object()
+
+# (loan_id, plan version)
+StoreKey = Tuple[Any, str]
+
+
+def results_hash(results: List[Dict[str, Any]]) -> str:
+    return hashlib.blake2b(dumps_json(results), digest_size=16).hexdigest()
+
+
+class _Flush:
+    """Queue marker: write what is batched so far, then set `done`."""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class ResultStore:
+    """
+    Thread-safe; one flusher thread per store. Documents still queued are
+    returned by get(), so readers never see older results than they put.
+    """
+
+    def __init__(self, collection, batch_size: int = RESULT_STORE_BATCH_SIZE,
+                 flush_interval: float = RESULT_STORE_FLUSH_SECONDS,
+                 max_queue: int = RESULT_STORE_MAX_QUEUE,
+                 put_timeout: float = RESULT_STORE_PUT_TIMEOUT_SECONDS,
+                 hashes: int = RESULT_STORE_HASHES):
+        from pymongo.errors import PyMongoError
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.max_hashes = hashes
+        try:
+            # the upsert filter relies on it to tell "unchanged" from "new"
+            collection.create_index([('loan_id', 1), ('plan_version', 1)], unique=True)
+        except PyMongoError as e:
+            logger.warning(f"Could not create unique index on {collection.name}: {e}")
+        self._queue: "queue.Queue" = queue.Queue(max_queue)
+        # key -> document queued but not written yet
+        self._pending: Dict[StoreKey, Dict[str, Any]] = {}
+        # key -> hash of the results last put or read, least recent first
+        self._hashes: "OrderedDict[StoreKey, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.written = 0
+        self.unchanged = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="result-store", daemon=True)
+        self._thread.start()
+
+    def _remember(self, key: StoreKey, digest: Optional[str]):
+        """Record (or with None forget) the hash stored for key; under the lock."""
+        if digest is None:
+            self._hashes.pop(key, None)
+            return
+        self._hashes[key] = digest
+        self._hashes.move_to_end(key)
+        while len(self._hashes) > self.max_hashes:
+            self._hashes.popitem(last=False)
+
+    def put(self, loan_id: Any, plan_version: str,
+            results: Iterable[Union[ValidationResult, Dict[str, Any]]],
+            timeout: float = None, **fields) -> bool:
+        """
+        Queue a loan's results (ValidationResults or their dicts) with any
+        extra `fields` for its document. Returns False if they were skipped
+        as unchanged, or dropped because the store is closed or the queue
+        stayed full for `timeout` seconds (default put_timeout; 0 never
+        waits).
+        """
+        results = [r.to_dict() if isinstance(r, ValidationResult) else r for r in results]
+        key = (loan_id, plan_version)
+        digest = results_hash(results)
+        with self._lock:
+            if self._closed:
+                self.dropped += 1
+                self._count('dropped')
+                logger.warning(f"Result store is closed; dropped results of loan {loan_id}")
+                return False
+            if self._hashes.get(key) == digest:
+                self.unchanged += 1
+                self._count('unchanged')
+                return False
+            previous = self._hashes.get(key)
+            self._remember(key, digest)
+            self._pending[key] = doc = {
+                **fields, 'loan_id': loan_id, 'plan_version': plan_version, 'results': results,
+                'results_hash': digest, 'evaluated_at': datetime.now(timezone.utc)}
+        try:
+            self._queue.put((key, doc), timeout=self.put_timeout if timeout is None else timeout)
+        except queue.Full:
+            with self._lock:
+                if self._pending.get(key) is doc:
+                    del self._pending[key]
+                    self._remember(key, previous)
+                self.dropped += 1
+            self._count('dropped')
+            logger.warning(f"Result store queue is full; dropped results of loan {loan_id}")
+            return False
+        with self._lock:
+            self.queued += 1
+        return True
+
+    def get(self, loan_id: Any, plan_version: str) -> Optional[Dict[str, Any]]:
+        """The loan's stored (or still queued) document for plan_version; None if there is none."""
+        key = (loan_id, plan_version)
+        with self._lock:
+            doc = self._pending.get(key)
+        if doc is None:
+            doc = self.collection.find_one({'loan_id': loan_id, 'plan_version': plan_version})
+            if doc is not None and doc.get('results_hash'):
+                with self._lock:
+                    if key not in self._pending:
+                        self._remember(key, doc['results_hash'])
+        return doc
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch: Dict[StoreKey, Dict[str, Any]] = {}
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if isinstance(item, _Flush):
+                    self._write(batch)
+                    batch = {}
+                    item.done.set()
+                elif item is _STOP:
+                    self._write(batch)
+                    return
+                else:
+                    key, doc = item
+                    # the latest results of a loan replace earlier ones in the batch
+                    batch[key] = doc
+                    if len(batch) >= self.batch_size:
+                        break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch: Dict[StoreKey, Dict[str, Any]]):
+        if not batch:
+            return
+        from pymongo import UpdateOne
+        from pymongo.errors import BulkWriteError, PyMongoError
+        ops = [UpdateOne({'loan_id': doc['loan_id'], 'plan_version': doc['plan_version'],
+                          'results_hash': {'$ne': doc['results_hash']}},
+                         {'$set': doc}, upsert=True)
+               for doc in batch.values()]
+        keys = list(batch)
+        failed = []
+        unchanged = 0
+        start = time.perf_counter()
+        try:
+            self.collection.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            # a duplicate key means the document already holds these results
+            for err in e.details.get('writeErrors', ()):
+                if err.get('code') == _DUPLICATE_KEY:
+                    unchanged += 1
+                else:
+                    failed.append(keys[err['index']])
+                    logger.warning(f"Storing results of loan {keys[err['index']][0]} failed: {err.get('errmsg')}")
+        except PyMongoError as e:
+            failed = keys
+            logger.warning(f"Storing {len(keys)} results failed: {e}")
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            for key, doc in batch.items():
+                if self._pending.get(key) is doc:
+                    del self._pending[key]
+            for key in failed:
+                # so the next put of the same results is written
+                if self._hashes.get(key) == batch[key]['results_hash']:
+                    self._remember(key, None)
+            self.batches += 1
+            self.written += len(batch) - len(failed) - unchanged
+            self.unchanged += unchanged
+            self.failed += len(failed)
+        if metrics.ENABLED:
+            metrics.RESULT_STORE_BATCH_SIZE.observe(len(batch))
+            metrics.RESULT_STORE_FLUSH_SECONDS.observe(elapsed)
+            for outcome, count in (('written', len(batch) - len(failed) - unchanged),
+                                   ('unchanged', unchanged), ('failed', len(failed))):
+                if count:
+                    metrics.RESULT_STORE_WRITES.inc(outcome, amount=count)
+
+    @staticmethod
+    def _count(outcome: str):
+        if metrics.ENABLED:
+            metrics.RESULT_STORE_WRITES.inc(outcome)
+
+    def flush(self, timeout: float = None) -> bool:
+        """Write everything queued so far; False if that took longer than timeout."""
+        if self._closed:
+            return True
+        marker = _Flush()
+        self._queue.put(marker)
+        return marker.done.wait(timeout)
+
+    def close(self, timeout: float = None):
+        """Flush and stop the flusher thread (shutdown); later puts are dropped."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            return
+        # puts that got past the closed check while we were stopping
+        batch = {}
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, _Flush):
+                item.done.set()
+            elif item is not _STOP:
+                batch[item[0]] = item[1]
+        self._write(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'queued': self.queued, 'pending': len(self._pending), 'written': self.written,
+                    'unchanged': self.unchanged, 'dropped': self.dropped, 'failed': self.failed,
+                    'batches': self.batches, 'batch_size': self.batch_size,
+                    'max_queue': self._queue.maxsize}
+
+
+def build_result_store(db=None) -> ResultStore:
+    """A ResultStore on RESULTS_COLLECTION of db (default: the configured database)."""
+    if db is None:
+        from .mongo_client import MongoClientWrapper
+        db = MongoClientWrapper().db
+    return ResultStore(db[RESULTS_COLLECTION])
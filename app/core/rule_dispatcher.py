@@ -1,157 +1,203 @@
 # app/core/rule_dispatcher.py
-from typing import List, Dict, Any
-from importlib import import_module
+from time import perf_counter
+from typing import Any, Dict, Iterable, List, Sequence, Union
+from .base_validator import ALERT, ERROR, NO_DETAILS, ValidationResult
 from .rule_loader import load_rules
-from .path_resolver import PathResolver, load_fields_config
+from .path_resolver import PathResolver, ResolvedView, load_fields_config
+from .rule_plan import RulePlan, CompiledRule, compile_rule_plan
+from .result_cache import CacheKey, ResultCache
+from .trigger_index import iter_bits
+from app.utils import metrics, trace
+from app.utils.date_utils import evaluation_now
 
 class RuleDispatcher:
-    def __init__(self, resolver: PathResolver = None, rules: List[Dict[str, Any]] = None):
-        self.resolver = resolver or PathResolver(load_fields_config())
-        self.rules = rules or load_rules()
+    def __init__(self, resolver: PathResolver = None, rules: List[Dict[str, Any]] = None,
+                 plan: RulePlan = None, cache: ResultCache = None):
+        """
+        Either pass a precompiled `plan` (preferred; compile once and share it),
+        or `rules` / `resolver` and the plan is compiled here. With a `cache`,
+        validator results are reused while the fields they read are unchanged.
+        """
+        if plan is None:
+            resolver = resolver or PathResolver(load_fields_config())
+            plan = compile_rule_plan(rules or load_rules(), resolver.fields)
+        self.plan = plan
+        self.resolver = resolver or plan.resolver
+        self.rules = [r.rule for r in plan.rules]
+        self.cache = cache
+
+    def _check_trigger(self, rule: CompiledRule, context: Dict[str, Any]) -> bool:
+        """
+        Evaluate the compiled trigger of a rule. See rule_plan.compile_trigger
+        for the supported trigger syntax (AND fields, `or:` and `and:` blocks).
+        """
+        return rule.trigger(self.resolver.view(context))
 
-        # Load validators module
-        try:
-            self.validators_mod = import_module('app.validators.validators')
-        except Exception:
-            self.validators_mod = import_module('app.validators')
+    def evaluate(self, context: Dict[str, Any]) -> List[ValidationResult]:
+        # one "now" for every date computation of this loan
+        with evaluation_now():
+            return self._evaluate(context, list(self.plan.not_applicable))
 
-    def _token_gt(self, token: str, value: Any) -> bool:
-        """Interpret tokens like 'GT80' => value > 80."""
-        token = str(token)
-        if token.upper().startswith('GT'):
+    def evaluate_selected(self, context: Dict[str, Any], only: int,
+                          fail_fast: bool = False) -> List[ValidationResult]:
+        """
+        Results of just the rules in the `only` bitmask (see
+        rule_plan.select_rules), in rule order; the other rules' triggers
+        aren't checked. With fail_fast, evaluation stops at the first ALERT
+        and the rules after it are left out of the results.
+        """
+        only &= self.plan.index.all
+        with evaluation_now():
+            if fail_fast:
+                return self._evaluate_until_alert(context, only)
+            results = self._evaluate(context, list(self.plan.not_applicable), only)
+        return [results[i] for i in iter_bits(only)]
+
+    def evaluate_incremental(self, context: Dict[str, Any],
+                             previous_results: Sequence[Union[ValidationResult, Dict[str, Any]]],
+                             changed_collections: Iterable[str]) -> List[ValidationResult]:
+        """
+        Re-evaluate only the rules that read one of changed_collections
+        (see RulePlan.dependents) and keep previous_results for the rest.
+        previous_results is the full output of an earlier evaluate() of the
+        same loan under this plan (ValidationResults or their dicts); if it
+        doesn't line up with the plan's rules everything is re-evaluated.
+        Note that results computed against "now" (no closing date) are only
+        refreshed when one of their collections changes.
+        """
+        plan = self.plan
+        rules = plan.rules
+        results = [r if isinstance(r, ValidationResult) else ValidationResult(**r)
+                   for r in previous_results]
+        if len(results) != len(rules) or any(r.rule_id != rule.id for r, rule in zip(results, rules)):
+            return self.evaluate(context)
+        affected = 0
+        for coll in changed_collections:
+            if coll not in plan.dependents:
+                raise ValueError(f"unknown collection '{coll}'")
+            affected |= plan.dependents[coll]
+        if not affected:
+            return results
+        for i in iter_bits(affected):
+            results[i] = plan.not_applicable[i]
+        with evaluation_now():
+            return self._evaluate(context, results, affected)
+
+    def _evaluate(self, context: Dict[str, Any], results: List[ValidationResult],
+                  only: int = -1) -> List[ValidationResult]:
+        """Fill in results for the rules in the `only` bitmask (all by default)."""
+        rules = self.plan.rules
+        cache = self.cache
+        timed = metrics.ENABLED
+        # per-rule timing for the histograms and/or a sampled trace
+        instrumented = timed or trace.active() is not None
+        if timed:
+            start = perf_counter()
+        # one memoized view per evaluation: each field path is walked once
+        view = self.resolver.view(context)
+        # rules ruled out by the trigger index stay NOT_APPLICABLE without
+        # having their triggers checked
+        triggered = []
+        for i in iter_bits(self.plan.index.candidates(view, only)):
             try:
-                threshold = float(token[2:])
-            except:
-                return False
+                if rules[i].trigger(view):
+                    triggered.append(i)
+            except Exception as e:
+                results[i] = ValidationResult(rules[i].id, ERROR, str(e), NO_DETAILS)
+        if timed:
+            checked = perf_counter()
+            metrics.STAGE_SECONDS.observe(checked - start, 'trigger_check')
+
+        # cache key -> index of a triggered rule to look up in the cache
+        pending: Dict[CacheKey, int] = {}
+        for i in triggered:
+            rule = rules[i]
             try:
-                v = float(value)
-                if v <= 1:
-                    v = v * 100
-                return v > threshold
-            except:
-                return False
-        return False
-
-    # ---------------------------------------------------------------
-    # NEW: OR SUPPORT + Helper Methods
-    # ---------------------------------------------------------------
-
-    def _check_trigger_single(self, key: str, allowed, context: Dict[str, Any]) -> bool:
-        """Checks a single trigger field."""
-
-        if not isinstance(allowed, list):
-            allowed = [allowed]
-
-        matched_any = False
-
-        for coll in ['los', 'title', 'appraisal', 'credit_report', 'drive_report']:
-            val = self.resolver.resolve(context, coll, key)
-            if val is None or val == "":
-                continue
-
-            # ANY = match if the field is present
-            if any(str(a).upper() == 'ANY' for a in allowed):
-                matched_any = True
-                break
+                if cache is not None:
+                    key = cache.key(self.plan, rule, view)
+                    if key is not None:
+                        pending[key] = i
+                        continue
 
-            # GT tokens
-            for a in allowed:
-                if isinstance(a, str) and a.upper().startswith('GT'):
-                    if self._token_gt(a, val):
-                        matched_any = True
-                        break
-                else:
-                    # direct equality or intersection
-                    if isinstance(val, list):
-                        if any(str(x) == str(a) for x in val):
-                            matched_any = True
-                            break
-                    else:
-                        if str(val).strip() == str(a).strip():
-                            matched_any = True
-                            break
+                results[i] = self._run(rule, context, view) if instrumented else \
+                    rule.validator.evaluate(rule.rule, context, view)
 
-            if matched_any:
-                break
-
-        return matched_any
-
-    def _check_trigger_block(self, block: Dict[str, Any], context: Dict[str, Any]) -> bool:
-        """Checks a block of triggers (AND inside a single OR block)."""
-        for key, allowed in block.items():
-            if not self._check_trigger_single(key, allowed, context):
-                return False
-        return True
+            except Exception as e:
+                results[i] = ValidationResult(rule.id, ERROR, str(e), NO_DETAILS)
+        if pending:
+            self._evaluate_cached(context, view, results, pending, instrumented)
+
+        if timed:
+            metrics.STAGE_SECONDS.observe(perf_counter() - checked, 'validate')
+            metrics.EVALUATIONS.inc()
+            evaluated = results if only == -1 else [results[i] for i in iter_bits(only)]
+            metrics.RULE_RESULTS.inc_each([(r.rule_id, r.status) for r in evaluated])
+        return results
 
-    # ---------------------------------------------------------------
-    # UPDATED _check_trigger WITH OR SUPPORT
-    # ---------------------------------------------------------------
-    def _check_trigger(self, rule: Dict[str, Any], context: Dict[str, Any]) -> bool:
+    def _evaluate_until_alert(self, context: Dict[str, Any], only: int) -> List[ValidationResult]:
         """
-        Supports:
-            - Regular AND triggers
-            - OR block:
-                trigger:
-                  or:
-                    - field1: [values]
-                    - field2: [values]
+        Rule by rule (trigger, then validator) in rule order until one
+        alerts. Only the per-rule metrics are recorded, not the stages.
         """
-
-        trigger = rule.get('trigger') or {}
-
-        # 1. OR BLOCK SUPPORT
-        or_blocks = trigger.get("or")
-        if or_blocks:
-            or_matched = False
-            for block in or_blocks:
-                # Each OR block is an AND block internally
-                if self._check_trigger_block(block, context):
-                    or_matched = True
-                    break
-            if not or_matched:
-                return False
-
-        # 2. NORMAL AND TRIGGERS (skip "or" key)
-        for key, allowed in trigger.items():
-            if key == "or":
-                continue
-            if not self._check_trigger_single(key, allowed, context):
-                return False
-
-        return True
-
-    # ---------------------------------------------------------------
-
-    def _get_validator(self, name: str):
-        cls = getattr(self.validators_mod, name, None)
-        if cls is None:
-            raise Exception(f"Validator '{name}' not found.")
-        return cls()
-
-    def evaluate(self, context: Dict[str, Any]) -> List[Dict[str, Any]]:
+        rules = self.plan.rules
+        cache = self.cache
+        instrumented = metrics.ENABLED or trace.active() is not None
+        view = self.resolver.view(context)
+        candidates = self.plan.index.candidates(view, only)
         results = []
-        for rule in self.rules:
+        for i in iter_bits(only):
+            rule = rules[i]
+            result = rule.not_applicable
             try:
-                triggered = self._check_trigger(rule, context)
-                if not triggered:
-                    results.append({
-                        'rule_id': rule.get('id'),
-                        'status': 'NOT_APPLICABLE',
-                        'message': '',
-                        'details': {}
-                    })
-                    continue
-
-                validator_name = rule.get('validator')
-                validator = self._get_validator(validator_name)
-                res = validator.evaluate(rule, context, self.resolver)
-                results.append(res)
-
+                if candidates >> i & 1 and rule.trigger(view):
+                    key = cache.key(self.plan, rule, view) if cache is not None else None
+                    if key is not None:
+                        result = cache.get_many([key]).get(key)
+                    if key is None or result is None:
+                        result = self._run(rule, context, view) if instrumented else \
+                            rule.validator.evaluate(rule.rule, context, view)
+                        if key is not None:
+                            cache.put_many({key: result})
             except Exception as e:
-                results.append({
-                    'rule_id': rule.get('id'),
-                    'status': 'ERROR',
-                    'message': str(e),
-                    'details': {}
-                })
+                result = ValidationResult(rule.id, ERROR, str(e), NO_DETAILS)
+            results.append(result)
+            if result.status is ALERT:
+                break
+        if metrics.ENABLED:
+            metrics.EVALUATIONS.inc()
+            metrics.RULE_RESULTS.inc_each([(r.rule_id, r.status) for r in results])
         return results
+
+    def _run(self, rule: CompiledRule, context: Dict[str, Any], view: ResolvedView) -> ValidationResult:
+        """rule.validator.evaluate, timed into the per-rule histogram and the active trace."""
+        status = ERROR
+        start = perf_counter()
+        try:
+            result = rule.validator.evaluate(rule.rule, context, view)
+            status = result.status
+            return result
+        finally:
+            elapsed = perf_counter() - start
+            if metrics.ENABLED:
+                metrics.RULE_SECONDS.observe(elapsed, rule.id, rule.validator_cls.__name__)
+            trace.event('rule', rule_id=rule.id, validator=rule.validator_cls.__name__,
+                        status=status, seconds=round(elapsed, 6))
+
+    def _evaluate_cached(self, context: Dict[str, Any], view: ResolvedView, results: List[ValidationResult],
+                         pending: Dict[CacheKey, int], instrumented: bool = False):
+        """Serve pending rules from the cache (one lookup) and run and store the rest."""
+        rules = self.plan.rules
+        cached = self.cache.get_many(pending)
+        computed = {}
+        for key, i in pending.items():
+            result = cached.get(key)
+            if result is None:
+                rule = rules[i]
+                try:
+                    result = computed[key] = self._run(rule, context, view) if instrumented else \
+                        rule.validator.evaluate(rule.rule, context, view)
+                except Exception as e:
+                    result = ValidationResult(rule.id, ERROR, str(e), NO_DETAILS)
+            results[i] = result
+        if computed:
+            self.cache.put_many(computed)
@@ -1,11 +1,39 @@
 # app/core/rule_loader.py
 import os
 import yaml
+from yaml.constructor import ConstructorError
 from typing import List, Dict, Any
 
-def load_rules(path: str = None) -> List[Dict[str, Any]]:
-    if path is None:
-        path = os.path.join(os.path.dirname(__file__), '..', 'config', 'rules.yaml')
+RULES_PATH = os.path.join(os.path.dirname(__file__), '..', 'config', 'rules.yaml')
+
+# libyaml's parser when PyYAML was built with it (several times faster)
+_SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+class UniqueKeyLoader(_SafeLoader):
+    """
+    SafeLoader that refuses duplicate mapping keys.
+    Plain yaml.safe_load keeps only the last duplicate, which silently drops
+    e.g. repeated `or:` blocks inside a trigger.
+    """
+
+    def construct_mapping(self, node, deep=False):
+        seen = set()
+        for key_node, _ in node.value:
+            key = self.construct_object(key_node, deep=deep)
+            if key in seen:
+                raise ConstructorError(
+                    "while constructing a mapping", node.start_mark,
+                    f"found duplicate key {key!r}", key_node.start_mark)
+            seen.add(key)
+        return super().construct_mapping(node, deep=deep)
+
+
+def load_yaml(path: str) -> Any:
     with open(path, 'r', encoding='utf-8') as fh:
-        data = yaml.safe_load(fh)
+        return yaml.load(fh, Loader=UniqueKeyLoader)
+
+
+def load_rules(path: str = None) -> List[Dict[str, Any]]:
+    data = load_yaml(path or RULES_PATH)
     return data.get('rules', [])
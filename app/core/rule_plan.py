@@ -0,0 +1,450 @@
+# app/core/rule_plan.py
+import hashlib
+import itertools
+import json
+import os
+from dataclasses import dataclass
+from importlib import import_module
+from typing import Any, Dict, FrozenSet, Iterable, List, Tuple
+
+from .base_validator import BaseValidator, NO_DETAILS, NOT_APPLICABLE, ValidationResult
+from .path_resolver import COLLECTIONS, FIELDS_PATH, PathResolver, ResolvedView, load_fields_config
+from .rule_loader import RULES_PATH, load_rules
+from .trigger_index import TriggerIndex
+from app.utils import metrics
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Parsed rules.yaml + fields.yaml are kept here as JSON, keyed by the files'
+# contents, so later processes skip YAML parsing. Empty disables it.
+CONFIG_SNAPSHOT_DIR = os.getenv("CONFIG_SNAPSHOT_DIR",
+                                os.path.join(os.path.dirname(RULES_PATH), '__pycache__'))
+_SNAPSHOT_FORMAT = b"1"
+
+
+class RulePlanError(ValueError):
+    """Raised when rules.yaml / fields.yaml cannot be compiled unambiguously."""
+
+
+def _gt(value: Any, threshold: float) -> bool:
+    """value > threshold, treating values <= 1 as fractions (0.85 => 85)."""
+    try:
+        v = float(value)
+    except (TypeError, ValueError):
+        return False
+    if v <= 1:
+        v = v * 100
+    return v > threshold
+
+
+# truth table slot of each predicate instance
+_slots = itertools.count()
+
+
+class _Predicate:
+    """
+    Trigger predicates are called with the ResolvedView of one evaluation.
+    `check` is what parents (and __call__) run: evaluate, or for a predicate
+    that occurs in several places of the rule set, `cached`, which keeps its
+    outcome in the view's truth table so it is evaluated once per loan
+    (see share_predicates).
+    """
+    __slots__ = ('slot', 'check')
+
+    def __init__(self):
+        self.slot = next(_slots)
+        self.check = self.evaluate
+
+    def __call__(self, view: ResolvedView) -> bool:
+        return self.check(view)
+
+    def cached(self, view: ResolvedView) -> bool:
+        truth = view.truth
+        result = truth.get(self.slot)
+        if result is None:
+            result = truth[self.slot] = self.evaluate(view)
+        return result
+
+
+class FieldPredicate(_Predicate):
+    """
+    Compiled form of a single trigger entry such as
+        purpose_of_loan: ["Purchase", "No Cash-Out Refinance"]
+        ltv: ["GT80"]
+    Matches when the field resolves (in any collection defining it) to a
+    non-empty value that equals one of the allowed values, exceeds one of the
+    GT thresholds, or when ANY is allowed.
+    """
+    __slots__ = ('field', 'collections', 'match_any', 'equals', 'equals_raw', 'gt')
+
+    def __init__(self, field: str, allowed: Any, collections: Tuple[str, ...] = COLLECTIONS,
+                 rule_id: str = None):
+        if not isinstance(allowed, list):
+            allowed = [allowed]
+        gt: List[float] = []
+        equals = []
+        for a in allowed:
+            if isinstance(a, str) and a.upper().startswith('GT'):
+                try:
+                    gt.append(float(a[2:]))
+                except ValueError:
+                    raise RulePlanError(f"{rule_id}: invalid GT token {a!r} for '{field}'")
+            else:
+                equals.append(a)
+        self.field = field
+        self.collections = tuple(collections)
+        self.match_any = any(str(a).upper() == 'ANY' for a in allowed)
+        # scalars are compared stripped, list members as-is
+        self.equals: FrozenSet[str] = frozenset(str(a).strip() for a in equals)
+        self.equals_raw: FrozenSet[str] = frozenset(str(a) for a in equals)
+        self.gt: Tuple[float, ...] = tuple(gt)
+        super().__init__()
+
+    def key(self) -> Tuple:
+        """Identity for deduplication: predicates with equal keys always agree."""
+        return ('field', self.field, self.collections, self.match_any, self.equals, self.equals_raw, self.gt)
+
+    def matches(self, value: Any) -> bool:
+        if self.match_any:
+            return True
+        for threshold in self.gt:
+            if _gt(value, threshold):
+                return True
+        if isinstance(value, list):
+            return any(str(x) in self.equals_raw for x in value)
+        return str(value).strip() in self.equals
+
+    def evaluate(self, view: ResolvedView) -> bool:
+        for coll in self.collections:
+            val = view.get(coll, self.field)
+            if val is None or val == "":
+                continue
+            if self.matches(val):
+                return True
+        return False
+
+
+class AllOf(_Predicate):
+    """AND of predicates (a trigger mapping, or one block of an `or:` list)."""
+    __slots__ = ('predicates', 'checks')
+
+    def __init__(self, predicates):
+        self.predicates = tuple(predicates)
+        self.checks = tuple(p.check for p in self.predicates)
+        super().__init__()
+
+    def key(self) -> Tuple:
+        return ('all',) + tuple(p.key() for p in self.predicates)
+
+    def evaluate(self, view: ResolvedView) -> bool:
+        for check in self.checks:
+            if not check(view):
+                return False
+        return True
+
+
+class AnyOf(_Predicate):
+    """OR of predicates (an `or:` list)."""
+    __slots__ = ('predicates', 'checks')
+
+    def __init__(self, predicates):
+        self.predicates = tuple(predicates)
+        self.checks = tuple(p.check for p in self.predicates)
+        super().__init__()
+
+    def key(self) -> Tuple:
+        return ('any',) + tuple(p.key() for p in self.predicates)
+
+    def evaluate(self, view: ResolvedView) -> bool:
+        for check in self.checks:
+            if check(view):
+                return True
+        return False
+
+
+def share_predicates(predicate: _Predicate, shared: Dict[Tuple, _Predicate],
+                     uses: Dict[Tuple, int]) -> _Predicate:
+    """
+    predicate with every sub-predicate replaced by the first identical one
+    recorded in `shared` (key() -> predicate); `uses` counts occurrences.
+    Call memoize_shared once all rules went through this.
+    """
+    key = predicate.key()
+    uses[key] = uses.get(key, 0) + 1
+    existing = shared.get(key)
+    if existing is not None:
+        return existing
+    if not isinstance(predicate, FieldPredicate):
+        predicate.predicates = tuple(share_predicates(p, shared, uses) for p in predicate.predicates)
+    shared[key] = predicate
+    return predicate
+
+
+def memoize_shared(shared: Dict[Tuple, _Predicate], uses: Dict[Tuple, int]):
+    """
+    Predicates occurring more than once go through the truth table; the
+    others are evaluated directly, which is cheaper than a lookup.
+    """
+    for key, predicate in shared.items():
+        predicate.check = predicate.cached if uses[key] > 1 else predicate.evaluate
+    for predicate in shared.values():
+        if not isinstance(predicate, FieldPredicate):
+            predicate.checks = tuple(p.check for p in predicate.predicates)
+
+
+def _compile_blocks(blocks: Any, key: str, resolver: PathResolver, rule_id: str) -> Tuple[AllOf, ...]:
+    if not isinstance(blocks, list) or not all(isinstance(b, dict) for b in blocks):
+        raise RulePlanError(f"{rule_id}: '{key}' must be a list of trigger mappings")
+    return tuple(compile_trigger(b, resolver, rule_id) for b in blocks)
+
+
+def compile_trigger(trigger: Dict[str, Any], resolver: PathResolver, rule_id: str = None) -> AllOf:
+    """
+    Compile a trigger mapping into a predicate tree.
+        field: [values]     -> every field must match (AND)
+        or: [{...}, {...}]  -> at least one block must match
+        and: [{...}, {...}] -> every block must match; use this to combine
+                               several `or:` groups in one trigger
+    """
+    trigger = trigger or {}
+    if not isinstance(trigger, dict):
+        raise RulePlanError(f"{rule_id}: trigger must be a mapping")
+    fields, groups = [], []
+    for key, allowed in trigger.items():
+        if key == 'or':
+            if allowed:
+                groups.append(AnyOf(_compile_blocks(allowed, key, resolver, rule_id)))
+        elif key == 'and':
+            if allowed:
+                groups.append(AllOf(_compile_blocks(allowed, key, resolver, rule_id)))
+        else:
+            fields.append(FieldPredicate(key, allowed, resolver.collections_for(key), rule_id))
+    # plain field checks are cheaper than OR groups, so run them first
+    return AllOf(fields + groups)
+
+
+def trigger_fields(predicate) -> List[str]:
+    """All field names referenced by a compiled trigger."""
+    if isinstance(predicate, FieldPredicate):
+        return [predicate.field]
+    out = []
+    for p in predicate.predicates:
+        out.extend(trigger_fields(p))
+    return out
+
+
+def equality_constraints(trigger: AllOf) -> Dict[str, FieldPredicate]:
+    """Top-level plain-equality entries of a trigger, usable for indexing."""
+    return {p.field: p for p in trigger.predicates
+            if isinstance(p, FieldPredicate) and not p.gt and not p.match_any}
+
+
+@dataclass(frozen=True)
+class CompiledRule:
+    id: str
+    rule: Dict[str, Any]
+    trigger: AllOf
+    validator_cls: type
+    # shared, stateless instance of validator_cls
+    validator: BaseValidator
+    # the rule's result whenever it doesn't apply (shared, immutable)
+    not_applicable: ValidationResult
+    # source collections whose changes can change the rule's result
+    reads: FrozenSet[str]
+    # the rule's `type` plus its `tags` from rules.yaml, for selecting subsets
+    tags: FrozenSet[str]
+
+
+@dataclass(frozen=True)
+class RulePlan:
+    rules: Tuple[CompiledRule, ...]
+    # not_applicable of every rule, in rule order: the starting results
+    not_applicable: Tuple[ValidationResult, ...]
+    # dependency graph: collection -> bitmask of the rules reading it
+    dependents: Dict[str, int]
+    # tag -> bitmask of the rules carrying it
+    tags: Dict[str, int]
+    fields: Dict[str, Dict]
+    resolver: PathResolver
+    index: TriggerIndex
+    version: str
+
+
+def rule_reads(trigger: AllOf, validator_cls: type, resolver: PathResolver) -> FrozenSet[str]:
+    """
+    Collections a rule depends on: those defining its trigger fields plus
+    the ones its validator declares (BaseValidator.reads / raw_reads).
+    Validators without a declaration depend on everything.
+    """
+    if validator_cls.reads is None:
+        return frozenset(COLLECTIONS)
+    collections = set(validator_cls.reads) | set(validator_cls.raw_reads)
+    for field in trigger_fields(trigger):
+        collections.update(resolver.collections_for(field))
+    return frozenset(collections)
+
+
+def rule_tags(rule: Dict[str, Any], rule_id: str) -> FrozenSet[str]:
+    tags = rule.get('tags') or []
+    if not isinstance(tags, list) or not all(isinstance(t, str) for t in tags):
+        raise RulePlanError(f"{rule_id}: 'tags' must be a list of strings")
+    if rule.get('type'):
+        tags = tags + [str(rule['type'])]
+    return frozenset(tags)
+
+
+def select_rules(plan: RulePlan, ids: Iterable[str] = None, prefixes: Iterable[str] = None,
+                 tags: Iterable[str] = None) -> int:
+    """
+    Bitmask of the plan's rules matching every given criterion (None = no
+    constraint): one of `ids` (an entry "A..B" is the rules from A through
+    B in rules.yaml order), an id starting with one of `prefixes`, or one
+    of `tags`. Unknown ids and tags raise ValueError.
+    """
+    rules = plan.rules
+    mask = (1 << len(rules)) - 1
+    if ids is not None:
+        positions = {r.id: i for i, r in enumerate(rules)}
+        selected = 0
+        for entry in ids:
+            first, sep, last = entry.partition('..')
+            for rule_id in (first, last) if sep else (first,):
+                if rule_id not in positions:
+                    raise ValueError(f"unknown rule id '{rule_id}'")
+            lo, hi = positions[first], positions[last if sep else first]
+            if lo > hi:
+                lo, hi = hi, lo
+            selected |= ((1 << (hi - lo + 1)) - 1) << lo
+        mask &= selected
+    if prefixes is not None:
+        selected = 0
+        for i, r in enumerate(rules):
+            if any(r.id.startswith(p) for p in prefixes):
+                selected |= 1 << i
+        mask &= selected
+    if tags is not None:
+        selected = 0
+        for tag in tags:
+            if tag not in plan.tags:
+                raise ValueError(f"unknown rule tag '{tag}'")
+            selected |= plan.tags[tag]
+        mask &= selected
+    return mask
+
+
+def plan_version(rules: List[Dict[str, Any]], fields_config: Dict[str, Dict]) -> str:
+    blob = json.dumps({'rules': rules, 'fields': fields_config}, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()[:12]
+
+
+def compile_rule_plan(rules: List[Dict[str, Any]], fields_config: Dict[str, Dict]) -> RulePlan:
+    validators_mod = import_module('app.validators.validators')
+    resolver = PathResolver(fields_config)
+
+    compiled = []
+    seen_ids = set()
+    # validator registry: one instance per validator class for the whole plan
+    validators: Dict[type, BaseValidator] = {}
+    # predicate key -> the one instance all rules use, and its occurrences
+    shared: Dict[Tuple, _Predicate] = {}
+    uses: Dict[Tuple, int] = {}
+    for rule in rules:
+        rule_id = rule.get('id')
+        if not rule_id:
+            raise RulePlanError(f"rule without id: {rule.get('name')!r}")
+        if rule_id in seen_ids:
+            raise RulePlanError(f"duplicate rule id '{rule_id}'")
+        seen_ids.add(rule_id)
+
+        validator_name = rule.get('validator')
+        validator_cls = getattr(validators_mod, validator_name or '', None)
+        if not isinstance(validator_cls, type):
+            raise RulePlanError(f"{rule_id}: validator '{validator_name}' not found.")
+
+        trigger = share_predicates(compile_trigger(rule.get('trigger'), resolver, rule_id), shared, uses)
+        for field in trigger_fields(trigger):
+            if not resolver.collections_for(field):
+                logger.warning("%s: trigger field '%s' is not defined in fields.yaml; "
+                               "it never matches", rule_id, field)
+
+        if validator_cls not in validators:
+            validators[validator_cls] = validator_cls()
+            for coll, names in (validator_cls.reads or {}).items():
+                for name in names:
+                    if coll not in resolver.collections_for(name):
+                        logger.warning("%s reads '%s.%s', which is not defined in fields.yaml",
+                                       validator_name, coll, name)
+        compiled.append(CompiledRule(id=rule_id, rule=rule, trigger=trigger,
+                                     validator_cls=validator_cls,
+                                     validator=validators[validator_cls],
+                                     not_applicable=ValidationResult(rule_id, NOT_APPLICABLE, '', NO_DETAILS),
+                                     reads=rule_reads(trigger, validator_cls, resolver),
+                                     tags=rule_tags(rule, rule_id)))
+
+    memoize_shared(shared, uses)
+    index = TriggerIndex([equality_constraints(r.trigger) for r in compiled])
+    dependents = {coll: 0 for coll in COLLECTIONS}
+    for i, r in enumerate(compiled):
+        for coll in r.reads:
+            dependents[coll] = dependents.get(coll, 0) | (1 << i)
+    tags: Dict[str, int] = {}
+    for i, r in enumerate(compiled):
+        for tag in r.tags:
+            tags[tag] = tags.get(tag, 0) | (1 << i)
+    return RulePlan(rules=tuple(compiled), not_applicable=tuple(r.not_applicable for r in compiled),
+                    dependents=dependents, tags=tags,
+                    fields=resolver.fields, resolver=resolver,
+                    index=index, version=plan_version(rules, fields_config))
+
+
+def _snapshot_path(rules_path: str, fields_path: str) -> str:
+    digest = hashlib.sha256(_SNAPSHOT_FORMAT)
+    for path in (rules_path, fields_path):
+        with open(path, 'rb') as fh:
+            digest.update(hashlib.sha256(fh.read()).digest())
+    return os.path.join(CONFIG_SNAPSHOT_DIR, f"config-{digest.hexdigest()[:16]}.json")
+
+
+def _read_snapshot(path: str):
+    try:
+        with open(path, 'rb') as fh:
+            rules, fields_config = json.loads(fh.read())
+        return rules, fields_config
+    except (OSError, ValueError):
+        return None
+
+
+def _write_snapshot(path: str, rules: List[Dict[str, Any]], fields_config: Dict[str, Dict]):
+    try:
+        blob = json.dumps([rules, fields_config])
+        # only if JSON round-trips the YAML exactly (no dates, non-str keys, ...)
+        if json.loads(blob) != [rules, fields_config]:
+            return
+        os.makedirs(CONFIG_SNAPSHOT_DIR, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            fh.write(blob)
+        os.replace(tmp, path)
+    except (OSError, TypeError, ValueError) as e:
+        logger.debug("config snapshot not written: %s", e)
+
+
+def load_rule_plan(rules_path: str = None, fields_path: str = None) -> RulePlan:
+    """
+    Compile rules.yaml + fields.yaml. The parsed YAML comes from a snapshot
+    in CONFIG_SNAPSHOT_DIR when the files are unchanged since it was taken;
+    snapshots are only written for configs that compiled.
+    """
+    rules_path, fields_path = rules_path or RULES_PATH, fields_path or FIELDS_PATH
+    with metrics.stage('config_load'):
+        if not CONFIG_SNAPSHOT_DIR:
+            return compile_rule_plan(load_rules(rules_path), load_fields_config(fields_path))
+        snapshot = _snapshot_path(rules_path, fields_path)
+        cached = _read_snapshot(snapshot)
+        if cached is not None:
+            return compile_rule_plan(*cached)
+        rules, fields_config = load_rules(rules_path), load_fields_config(fields_path)
+        plan = compile_rule_plan(rules, fields_config)
+        _write_snapshot(snapshot, rules, fields_config)
+        return plan
@@ -0,0 +1,93 @@
+# app/core/trigger_index.py
+from typing import Any, Dict, Iterator, List, Sequence
+
+
+def iter_bits(mask: int) -> Iterator[int]:
+    """Yield the positions of the set bits of mask, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class _FieldIndex:
+    __slots__ = ('field', 'collections', 'unconstrained', 'by_scalar', 'by_item')
+
+    def __init__(self, field: str, collections):
+        self.field = field
+        self.collections = tuple(collections)
+        self.unconstrained = 0
+        # stripped allowed value -> rules (scalar field values are compared stripped)
+        self.by_scalar: Dict[str, int] = {}
+        # raw allowed value -> rules (list field values are compared item by item)
+        self.by_item: Dict[str, int] = {}
+
+    def mask(self, view) -> int:
+        mask = self.unconstrained
+        for coll in self.collections:
+            val = view.get(coll, self.field)
+            if val is None or val == "":
+                continue
+            if isinstance(val, list):
+                for x in val:
+                    mask |= self.by_item.get(str(x), 0)
+            else:
+                mask |= self.by_scalar.get(str(val).strip(), 0)
+        return mask
+
+
+class TriggerIndex:
+    """
+    Hash index over the equality fields that discriminate between rules
+    (purpose_of_loan, property_will_be, no_units, ...).
+
+    `constraints[i]` maps field -> FieldPredicate for the plain equality
+    entries at the top level of rule i's trigger (no GT tokens, no ANY).
+    For a given loan, `candidates` looks up each indexed field's value once
+    and returns a bitmask of the rules whose equality triggers can still
+    match; every other rule is NOT_APPLICABLE without evaluating its trigger.
+    The result is a superset of the triggered rules, never a subset, so
+    candidates still get their full trigger checked.
+    """
+
+    def __init__(self, constraints: Sequence[Dict[str, Any]], fields: Sequence[str] = None):
+        self.size = len(constraints)
+        self.all = (1 << self.size) - 1
+        if fields is None:
+            fields = self._discriminating_fields(constraints)
+
+        self.fields: List[_FieldIndex] = []
+        for field in fields:
+            preds = [c.get(field) for c in constraints]
+            sample = next((p for p in preds if p is not None), None)
+            if sample is None:
+                continue
+            idx = _FieldIndex(field, sample.collections)
+            for i, pred in enumerate(preds):
+                bit = 1 << i
+                if pred is None:
+                    idx.unconstrained |= bit
+                    continue
+                for v in pred.equals:
+                    idx.by_scalar[v] = idx.by_scalar.get(v, 0) | bit
+                for v in pred.equals_raw:
+                    idx.by_item[v] = idx.by_item.get(v, 0) | bit
+            self.fields.append(idx)
+
+    @staticmethod
+    def _discriminating_fields(constraints: Sequence[Dict[str, Any]]) -> List[str]:
+        """Fields constrained by at least two rules with differing allowed values."""
+        seen: Dict[str, set] = {}
+        for c in constraints:
+            for field, pred in c.items():
+                seen.setdefault(field, set()).add(pred.equals_raw)
+        return [f for f, value_sets in seen.items() if len(value_sets) > 1]
+
+    def candidates(self, view, within: int = -1) -> int:
+        """Bitmask of the rules (among `within`) whose triggers can match view."""
+        mask = self.all & within
+        for idx in self.fields:
+            mask &= idx.mask(view)
+            if not mask:
+                break
+        return mask
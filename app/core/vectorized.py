@@ -0,0 +1,375 @@
+# app/core/vectorized.py
+"""
+Columnar evaluation of many loans at once (portfolio re-scoring).
+
+Resolved fields are pulled into per-field columns once, triggers are
+evaluated as boolean arrays and the pure threshold / date-seasoning
+validators run as NumPy array operations. Everything else - and any loan
+whose values take an unusual path through a validator - is handed to the
+regular scalar validator, so the output is identical to calling
+RuleDispatcher.evaluate on every context.
+"""
+from numbers import Real
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .base_validator import ERROR, NO_DETAILS, ValidationResult
+from .path_resolver import ResolvedView
+from .rule_dispatcher import RuleDispatcher
+from .rule_plan import AllOf, AnyOf, CompiledRule, FieldPredicate
+from app.utils.date_utils import evaluation_now, parse_date
+
+PASS, ALERT, NOT_APPLICABLE, SCALAR = 0, 1, 2, 3
+
+_NAN = float('nan')
+
+
+def _to_float(v: Any) -> Tuple[float, bool]:
+    try:
+        return float(v), True
+    except Exception:
+        return _NAN, False
+
+
+def _to_month(v: Any):
+    d = parse_date(v)
+    if d is None:
+        return np.datetime64('NaT', 'M')
+    return np.datetime64(f"{d.year:04d}-{d.month:02d}", 'M')
+
+
+class Column:
+    """
+    Values of one (collection, field) across a set of loans. Converters run
+    once per distinct value (the column is factorized on first use) and are
+    gathered back with `codes`.
+    """
+    __slots__ = ('values', '_uniques', '_codes', '_derived')
+
+    def __init__(self, values: List[Any]):
+        self.values = values
+        self._uniques: List[Any] = None
+        self._codes: np.ndarray = None
+        self._derived: Dict[str, Any] = {}
+
+    def _factorize(self):
+        index: Dict[Any, int] = {}
+        try:
+            codes = [index.setdefault((type(v), v), len(index)) for v in self.values]
+            uniques = [key[1] for key in index]
+        except TypeError:  # lists / dicts: no sharing for those
+            index, uniques, codes = {}, [], []
+            for v in self.values:
+                try:
+                    key = (type(v), v)
+                    code = index.get(key)
+                except TypeError:
+                    key = code = None
+                if code is None:
+                    code = len(uniques)
+                    uniques.append(v)
+                    if key is not None:
+                        index[key] = code
+                codes.append(code)
+        self._uniques = uniques
+        self._codes = np.array(codes, dtype=np.intp)
+
+    @property
+    def uniques(self) -> List[Any]:
+        if self._uniques is None:
+            self._factorize()
+        return self._uniques
+
+    @property
+    def codes(self) -> np.ndarray:
+        if self._codes is None:
+            self._factorize()
+        return self._codes
+
+    def lut(self, fn: Callable[[Any], Any], dtype=bool) -> np.ndarray:
+        uniques = self.uniques
+        table = np.fromiter((fn(u) for u in uniques), dtype=dtype, count=len(uniques))
+        return table[self.codes]
+
+    def floats(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(float64 values, parsed ok) - NaN where float() fails."""
+        if 'floats' not in self._derived:
+            try:
+                # object -> float64 calls float() on each value, in C
+                vals = np.fromiter(self.values, dtype=object, count=len(self.values)).astype(np.float64)
+                ok = np.ones(vals.shape, dtype=bool)
+            except Exception:
+                pairs = [_to_float(u) for u in self.uniques]
+                vals = np.array([p[0] for p in pairs], dtype=np.float64)[self.codes]
+                ok = np.array([p[1] for p in pairs], dtype=bool)[self.codes]
+            self._derived['floats'] = (vals, ok)
+        return self._derived['floats']
+
+    def months(self) -> np.ndarray:
+        """datetime64[M] of each value, NaT where parse_date fails."""
+        if 'months' not in self._derived:
+            table = np.array([_to_month(u) for u in self.uniques], dtype='datetime64[M]')
+            self._derived['months'] = table[self.codes]
+        return self._derived['months']
+
+    def truthy(self) -> np.ndarray:
+        if 'truthy' not in self._derived:
+            self._derived['truthy'] = self.lut(bool)
+        return self._derived['truthy']
+
+
+def _num(x: Any) -> bool:
+    return isinstance(x, Real) and not isinstance(x, bool)
+
+
+def _params(rule: Dict[str, Any], key: str = 'params'):
+    """rule[key] if it is a mapping the kernels can read safely, else None."""
+    value = rule.get(key, {})
+    return value if isinstance(value, dict) else None
+
+
+# ---------------------------------------------------------------
+# Kernels: (validator, rule, columns) -> status codes for every loan.
+# Defaults come from the validator, so both paths share them.
+# SCALAR marks loans the scalar validator has to decide.
+# ---------------------------------------------------------------
+
+def _ltv_kernel(validator, rule, col):
+    thresholds = _params(rule, 'thresholds')
+    if thresholds is None or not all(v is None or _num(v) for v in thresholds.values()):
+        return None
+    alert = np.zeros(len(col('los', 'ltv').values), dtype=bool)
+    for key in ('ltv', 'cltv', 'hcltv'):
+        v, ok = col('los', key).floats()
+        limit = thresholds.get(key)
+        if limit is None:
+            continue
+        pct = np.where(v <= 1, v * 100, v)
+        alert |= ok & (pct > limit)
+    return np.where(alert, ALERT, PASS)
+
+
+def _dti_kernel(validator, rule, col):
+    params = _params(rule)
+    if params is None:
+        return None
+    limit = params.get('dti_limit', validator.dti_limit)
+    if not _num(limit):
+        return None
+    d, ok = col('los', 'dti').floats()
+    return np.where(~ok, NOT_APPLICABLE, np.where(d > limit, ALERT, PASS))
+
+
+def _credit_score_kernel(validator, rule, col):
+    s, ok = col('los', 'average_representative_credit_score').floats()
+    return np.where(~ok, NOT_APPLICABLE, np.where(s <= validator.min_score, ALERT, PASS))
+
+
+def _ami(rule):
+    return (_params(rule) or {}).get('area_median_income')
+
+
+def _income_kernel(validator, rule, col):
+    if _params(rule) is None:
+        return None
+    inc, inc_ok = col('los', 'total_income').floats()
+    ami_col = col('los', 'area_median_income')
+    default = _ami(rule)
+    pairs = [_to_float(u or default) for u in ami_col.uniques]
+    ami = np.array([p[0] for p in pairs], dtype=np.float64)[ami_col.codes]
+    ami_ok = np.array([p[1] for p in pairs], dtype=bool)[ami_col.codes]
+    ok = inc_ok & ami_ok
+    return np.where(~ok, NOT_APPLICABLE, np.where(inc > ami, ALERT, PASS))
+
+
+def _cashback_kernel(validator, rule, col):
+    params = _params(rule)
+    if params is None:
+        return None
+    absolute = params.get('absolute_limit', validator.absolute_limit)
+    percent = params.get('percent_limit', validator.percent_limit)
+    if not (_num(absolute) and _num(percent)):
+        return None
+    loan, loan_ok = col('los', 'loan_amount').floats()
+    by_percent = loan * percent
+    # builtin min(): NaN on the right never wins
+    max_allowed = np.where(by_percent < absolute, by_percent, absolute)
+    any_neg = np.zeros(loan.shape, dtype=bool)
+    alert = np.zeros(loan.shape, dtype=bool)
+    for key in ('cash_from_borrower', 'cash_to_borrower'):
+        v, ok = col('los', key).floats()
+        neg = ok & (v < 0)
+        any_neg |= neg
+        alert |= neg & (np.abs(v) > max_allowed)
+    status = np.where(alert, ALERT, PASS)
+    # no negative amount: the scalar validator decides what that means
+    status = np.where(any_neg, status, SCALAR)
+    return np.where(loan_ok, status, NOT_APPLICABLE)
+
+
+def _seasoning_kernel(collection, field):
+    def kernel(validator, rule, col):
+        params = _params(rule)
+        if params is None:
+            return None
+        min_months = params.get('min_months', validator.min_months)
+        if not _num(min_months):
+            return None
+        date_col = col(collection, field)
+        close_col = col('los', 'estimated_closing_date')
+        present = date_col.truthy() & close_col.truthy()
+        opened, closing = date_col.months(), close_col.months()
+        months = np.abs((closing - opened).astype(np.int64))
+        status = np.where(months < min_months, ALERT, PASS)
+        # an unparseable closing date makes months_between fall back to now()
+        status = np.where(np.isnat(closing), SCALAR, status)
+        status = np.where(np.isnat(opened), NOT_APPLICABLE, status)
+        return np.where(present, status, NOT_APPLICABLE)
+    return kernel
+
+
+# validator name -> (kernel, details(validator, rule, value getter))
+KERNELS: Dict[str, Tuple[Callable, Callable]] = {
+    'LTVValidator': (_ltv_kernel, lambda validator, rule, v: {
+        'ltv': v('los', 'ltv'), 'cltv': v('los', 'cltv'), 'hcltv': v('los', 'hcltv'),
+        'thresholds': rule.get('thresholds', {})}),
+    'DTIValidator': (_dti_kernel, lambda validator, rule, v: {
+        'dti': v('los', 'dti'), 'limit': rule.get('params', {}).get('dti_limit', validator.dti_limit)}),
+    'CreditScoreValidator': (_credit_score_kernel, lambda validator, rule, v: {
+        'score': v('los', 'average_representative_credit_score')}),
+    'IncomeValidator': (_income_kernel, lambda validator, rule, v: {
+        'total_income': v('los', 'total_income'),
+        'area_median_income': v('los', 'area_median_income') or _ami(rule)}),
+    'CashbackValidator': (_cashback_kernel, lambda validator, rule, v: {
+        'cash_from': v('los', 'cash_from_borrower'), 'cash_to': v('los', 'cash_to_borrower'),
+        'loan_amount': v('los', 'loan_amount')}),
+    'TitleValidator': (_seasoning_kernel('title', 'chain_title_date'), lambda validator, rule, v: {
+        'chain_title_date': v('title', 'chain_title_date'),
+        'estimated_closing_date': v('los', 'estimated_closing_date')}),
+    'AppraisalPriorSaleValidator': (_seasoning_kernel('appraisal', 'prior_sale_date'), lambda validator, rule, v: {
+        'prior_sale_date': v('appraisal', 'prior_sale_date'),
+        'estimated_closing_date': v('los', 'estimated_closing_date')}),
+}
+
+
+class _Table:
+    """
+    Lazily extracted field values over a fixed list of contexts. A field is
+    only walked for the loans that still need it (e.g. loans whose trigger
+    has not already failed on an earlier field).
+    """
+
+    def __init__(self, resolver, contexts: Sequence[Dict[str, Any]]):
+        self.resolver = resolver
+        self.contexts = contexts
+        self._values: Dict[Tuple[str, str], Tuple[np.ndarray, np.ndarray]] = {}
+
+    def take(self, collection: str, field: str, rows: np.ndarray) -> List[Any]:
+        key = (collection, field)
+        if key not in self._values:
+            n = len(self.contexts)
+            self._values[key] = (np.empty(n, dtype=object), np.zeros(n, dtype=bool))
+        values, filled = self._values[key]
+        missing = rows[~filled[rows]]
+        if missing.size:
+            contexts = self.contexts
+            resolved = self.resolver.resolve_many([contexts[i] for i in missing], collection, field)
+            for i, v in zip(missing.tolist(), resolved):
+                values[i] = v
+            filled[missing] = True
+        return [values[i] for i in rows.tolist()]
+
+    def value(self, collection: str, field: str, i: int) -> Any:
+        entry = self._values.get((collection, field))
+        if entry is not None and entry[1][i]:
+            return entry[0][i]
+        return self.take(collection, field, np.array([i]))[0]
+
+    def column(self, collection: str, field: str, rows: np.ndarray) -> Column:
+        return Column(self.take(collection, field, rows))
+
+
+class ColumnarEvaluator:
+    """
+    Evaluate a list of contexts against a dispatcher's rule plan.
+        results = ColumnarEvaluator(dispatcher).evaluate(contexts)
+    results[i] is exactly what dispatcher.evaluate(contexts[i]) returns.
+    """
+
+    def __init__(self, dispatcher: RuleDispatcher):
+        self.dispatcher = dispatcher
+        self.plan = dispatcher.plan
+
+    def evaluate(self, contexts: Sequence[Dict[str, Any]]) -> List[List[ValidationResult]]:
+        with evaluation_now():
+            return self._evaluate(contexts)
+
+    def _evaluate(self, contexts: Sequence[Dict[str, Any]]) -> List[List[ValidationResult]]:
+        table = _Table(self.dispatcher.resolver, contexts)
+        everyone = np.arange(len(contexts))
+        # views are only needed for loans that go through a scalar validator
+        views: List[ResolvedView] = [None] * len(contexts)
+        # built rule by rule (one column of results per rule), transposed at the end
+        columns: List[List[ValidationResult]] = []
+        for rule in self.plan.rules:
+            triggered = self._mask(rule.trigger, table, everyone)
+            column = [rule.not_applicable] * len(contexts)
+            rows = np.flatnonzero(triggered)
+            if rows.size:
+                self._validate(rule, rows, table, views, contexts, column)
+            columns.append(column)
+        return [list(row) for row in zip(*columns)] if columns else [[] for _ in contexts]
+
+    def _mask(self, pred, table: _Table, rows: np.ndarray) -> np.ndarray:
+        """Truth of pred for each loan in rows (array aligned with rows)."""
+        if isinstance(pred, FieldPredicate):
+            mask = np.zeros(rows.size, dtype=bool)
+            for coll in pred.collections:
+                mask |= table.column(coll, pred.field, rows).lut(
+                    lambda v: v is not None and v != "" and pred.matches(v))
+            return mask
+        if isinstance(pred, AnyOf):
+            mask = np.zeros(rows.size, dtype=bool)
+            for p in pred.predicates:
+                open_ = ~mask
+                if not open_.any():
+                    break
+                mask[open_] = self._mask(p, table, rows[open_])
+            return mask
+        if isinstance(pred, AllOf):
+            mask = np.ones(rows.size, dtype=bool)
+            for p in pred.predicates:
+                if not mask.any():
+                    break
+                mask[mask] = self._mask(p, table, rows[mask])
+            return mask
+        raise TypeError(f"Unknown trigger predicate {type(pred).__name__}")
+
+    def _validate(self, rule: CompiledRule, rows, table: _Table, views, contexts, column):
+        kernel, details = KERNELS.get(rule.validator_cls.__name__, (None, None))
+        status = None
+        if kernel:
+            status = kernel(rule.validator, rule.rule, lambda coll, field: table.column(coll, field, rows))
+        for k, i in enumerate(rows.tolist()):
+            code = SCALAR if status is None else status[k]
+            if code == SCALAR:
+                if views[i] is None:
+                    views[i] = self.dispatcher.resolver.view(contexts[i])
+                column[i] = self._scalar(rule, contexts[i], views[i])
+            elif code != NOT_APPLICABLE:
+                values = lambda coll, field: table.value(coll, field, i)
+                column[i] = _result(rule, code, details(rule.validator, rule.rule, values))
+
+    @staticmethod
+    def _scalar(rule: CompiledRule, context: Dict[str, Any], view: ResolvedView) -> ValidationResult:
+        try:
+            return rule.validator.evaluate(rule.rule, context, view)
+        except Exception as e:
+            return ValidationResult(rule.id, ERROR, str(e), NO_DETAILS)
+
+
+def _result(rule: CompiledRule, code: int, details: Dict[str, Any]) -> ValidationResult:
+    if code == ALERT:
+        return rule.validator.alert_result(rule.rule, details=details)
+    return rule.validator.pass_result(rule.rule, details=details)
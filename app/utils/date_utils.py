@@ -1,8 +1,12 @@
 # app/utils/date_utils.py
 
+import os
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime
+from functools import lru_cache
 from typing import Optional
-from dateutil import parser
 
 # Explicit formats we want to support (priority order)
 SUPPORTED_FORMATS = [
@@ -13,6 +17,117 @@ SUPPORTED_FORMATS = [
     "%Y/%m/%d",   # ISO with slashes
 ]
 
+# Distinct date strings remembered by parse_date
+DATE_CACHE_SIZE = int(os.getenv("DATE_CACHE_SIZE", "65536"))
+
+# Shapes of the SUPPORTED_FORMATS: 1-2 digit month/day, 4 digit year
+_DAY_FIRST = re.compile(r'(\d{1,2})([-/])(\d{1,2})\2(\d{4})')
+_YEAR_FIRST = re.compile(r'(\d{4})([-/])(\d{1,2})\2(\d{1,2})')
+
+# "now" shared by every date computation of one evaluation: a one-item
+# list, filled the first time now() is asked for
+_now: ContextVar[Optional[list]] = ContextVar('evaluation_now', default=None)
+
+
+def now() -> datetime:
+    """The evaluation's "now" when inside evaluation_now(), else the wall clock."""
+    pinned = _now.get()
+    if pinned is None:
+        return datetime.now()
+    if pinned[0] is None:
+        pinned[0] = datetime.now()
+    return pinned[0]
+
+
+@contextmanager
+def evaluation_now(at: datetime = None):
+    """
+    Pin now() for the enclosed evaluation, so all rules of one loan measure
+    against the same instant and the clock is read at most once. Nested
+    scopes keep the outermost instant (e.g. one "now" for a whole batch).
+    """
+    if _now.get() is not None:
+        yield
+        return
+    token = _now.set([at])
+    try:
+        yield
+    finally:
+        _now.reset(token)
+
+
+def _ymd(year: str, month: str, day: str) -> Optional[datetime]:
+    # same ranges strptime's %m / %d accept: 1-12 / 1-31, no zero
+    m, d = int(month), int(day)
+    if not (1 <= m <= 12 and 1 <= d <= 31):
+        return None
+    try:
+        return datetime(int(year), m, d)
+    except ValueError:      # e.g. 02-30-2024, year 0000
+        return None
+
+
+def _sniff(value: str):
+    """
+    Parse value by its shape, trying the SUPPORTED_FORMATS it can match in
+    the same order strptime would. Returns a datetime, None when the shape
+    matches but no format yields a valid date, or False for other shapes.
+    """
+    m = _DAY_FIRST.fullmatch(value)
+    if m:
+        a, sep, b, year = m.groups()
+        if sep == '-':
+            # %m-%d-%Y, then %d-%m-%Y
+            return _ymd(year, a, b) or _ymd(year, b, a)
+        return _ymd(year, a, b)         # %m/%d/%Y
+    m = _YEAR_FIRST.fullmatch(value)
+    if m:
+        year, _, month, day = m.groups()
+        return _ymd(year, month, day)   # %Y-%m-%d / %Y/%m/%d
+    return False
+
+
+def _parse_strptime(value: str) -> Optional[datetime]:
+    """The original format loop: one strptime attempt per format."""
+    for fmt in SUPPORTED_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except:
+            pass
+    return None
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def _parse_explicit(value: str) -> Optional[datetime]:
+    # datetimes are immutable, so cached ones can be shared
+    parsed = _sniff(value)
+    if parsed is False:
+        # unusual spellings strptime still accepts (e.g. ' 5' days)
+        return _parse_strptime(value)
+    return parsed
+
+
+def _dateutil_parse(value: str) -> datetime:
+    # dateutil is imported on first use, not at startup
+    from dateutil import parser
+    return parser.parse(value)
+
+
+def _parse_legacy(value) -> Optional[datetime]:
+    """Uncached original implementation (kept for benchmarks)."""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value
+    value = str(value).strip()
+    parsed = _parse_strptime(value)
+    if parsed is not None:
+        return parsed
+    try:
+        return _dateutil_parse(value)
+    except:
+        return None
+
 
 def parse_date(value) -> Optional[datetime]:
     """
@@ -30,16 +145,15 @@ def parse_date(value) -> Optional[datetime]:
 
     value = str(value).strip()
 
-    # Try explicit formats first (strict)
-    for fmt in SUPPORTED_FORMATS:
-        try:
-            return datetime.strptime(value, fmt)
-        except:
-            pass
+    # Explicit formats first (strict), sniffed from the shape and cached
+    parsed = _parse_explicit(value)
+    if parsed is not None:
+        return parsed
 
-    # Fallback — flexible parser
+    # Fallback — flexible parser. Not cached: it fills missing parts
+    # (e.g. the day of "March 2024") from today's date.
     try:
-        return parser.parse(value)
+        return _dateutil_parse(value)
     except:
         return None
 
@@ -53,7 +167,7 @@ def months_between(d1, d2=None) -> int:
     if d1 is None:
         raise ValueError(f"Invalid date: {d1}")
 
-    d2 = datetime.now() if d2 is None else parse_date(d2)
+    d2 = now() if d2 is None else parse_date(d2)
     if d2 is None:
         raise ValueError(f"Invalid date: {d2}")
 
@@ -70,8 +184,8 @@ def days_between(d1, d2=None) -> int:
     if d1 is None:
         raise ValueError("Invalid d1")
 
-    d2 = datetime.now() if d2 is None else parse_date(d2)
+    d2 = now() if d2 is None else parse_date(d2)
     if d2 is None:
         raise ValueError("Invalid d2")
 
-    return abs((d2 - d1).days)
\ No newline at end of file
+    return abs((d2 - d1).days)
@@ -1,19 +1,164 @@
 # app/utils/fuzzy_matcher.py
-try:
-    from rapidfuzz import fuzz
-    def fuzzy_ratio(a, b):
-        if a is None or b is None:
-            return 0
-        return int(fuzz.token_set_ratio(str(a), str(b)))
-except Exception:
-    import difflib
-    def fuzzy_ratio(a, b):
-        if a is None or b is None:
-            return 0
-        return int(difflib.SequenceMatcher(None, str(a), str(b)).ratio() * 100)
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+_scorer = None
+# (process.extract, default_process) once rapidfuzz is loaded; False without it
+_batch = None
+
+
+def load_scorer():
+    """
+    rapidfuzz's token_set_ratio (difflib's ratio without rapidfuzz).
+    Imported on first use: rapidfuzz pulls in numpy, which slows startup.
+    """
+    global _scorer, _batch
+    if _scorer is None:
+        try:
+            from rapidfuzz.fuzz import token_set_ratio
+            from rapidfuzz.process import extract
+            from rapidfuzz.utils import default_process
+            _scorer = token_set_ratio
+            _batch = (extract, default_process)
+        except Exception:
+            import difflib
+            _scorer = lambda a, b: difflib.SequenceMatcher(None, a, b).ratio() * 100
+            _batch = False
+    return _scorer
+
+
+def fuzzy_ratio(a, b):
+    if a is None or b is None:
+        return 0
+    return int((_scorer or load_scorer())(str(a), str(b)))
+
+
+# str.isalnum() / str.isspace() are exactly what \w / \s match, minus '_'
+_NOT_ALNUM_OR_SPACE = re.compile(r'[^\w\s]|_')
+
+@lru_cache(maxsize=4096)
+def _normalize(s: str) -> str:
+    s = _NOT_ALNUM_OR_SPACE.sub('', s)
+    if 'Σ' in s:
+        # str.lower() maps a word-final sigma to 'ς'; lowercase char by char
+        return ''.join(ch.lower() for ch in s).strip()
+    return s.lower().strip()
 
 def normalize_string(s):
     if s is None:
         return ""
-    s = str(s)
-    return ''.join(ch.lower() for ch in s if ch.isalnum() or ch.isspace()).strip()
+    return _normalize(str(s))
+
+
+# Minimum creditor name score for a tradeline to count as the liability
+NAME_MATCH_THRESHOLD = 70
+
+
+class TradelineMatch(NamedTuple):
+    tradeline: Optional[Dict[str, Any]]     # None when no candidate scored high enough
+    last4: str
+    creditor_name: Any
+    score: int
+
+
+class _Names(NamedTuple):
+    reported: List[Any]         # creditor names of a bucket, in credit report order
+    scored: List[str]           # the same, as the scorer compares them
+
+
+class TradelineIndex:
+    """
+    Tradelines of one credit report keyed by the last 4 digits of their
+    account number, built on the first lookup. A bucket's creditor names
+    are normalized for the scorer once, when it is first looked up. Build
+    it once per context (see PathResolver.shared) and reuse it for every
+    liability that needs matching.
+    """
+    __slots__ = ('_tradelines', '_by_last4', '_names', '_error', '_matches')
+
+    def __init__(self, tradelines: Iterable[Dict[str, Any]]):
+        self._tradelines = tradelines
+        self._by_last4: Dict[str, List[Dict[str, Any]]] = None
+        self._names: Dict[str, _Names] = {}
+        self._error = None
+        self._matches: Dict[Tuple[str, str, int], Optional[TradelineMatch]] = {}
+
+    def _build(self):
+        by_last4 = self._by_last4 = {}
+        try:
+            for t in self._tradelines:
+                acc_no = t.get("Creditor Account Number") or t.get("Creditor_Account_Number")
+                if acc_no:
+                    acc_last4 = str(acc_no)[-4:]
+                    bucket = by_last4.get(acc_last4)
+                    if bucket is None:
+                        by_last4[acc_last4] = [t]
+                    else:
+                        bucket.append(t)
+        except Exception as e:
+            # tradelines before the malformed one can still match
+            self._error = e
+
+    def candidates(self, last4: str) -> List[Dict[str, Any]]:
+        """Tradelines whose account number ends in last4, in credit report order."""
+        if self._by_last4 is None:
+            self._build()
+        return self._by_last4.get(last4, [])
+
+    def _bucket_names(self, last4: str) -> _Names:
+        names = self._names.get(last4)
+        if names is None:
+            reported = [t.get("Creditor Name") or t.get("Creditor_Name") or "" for t in self._by_last4[last4]]
+            if _scorer is None:
+                load_scorer()
+            # what token_set_ratio's default processor does to each pair
+            scored = [_batch[1](str(n)) for n in reported] if _batch else []
+            names = self._names[last4] = _Names(reported, scored)
+        return names
+
+    def match(self, account_number: Any, name: Any,
+              threshold: int = NAME_MATCH_THRESHOLD) -> Optional[TradelineMatch]:
+        """
+        First tradeline (in credit report order) whose last 4 digits equal
+        those of account_number and whose creditor name scores >= threshold
+        against name. If none does, the last candidate is returned with
+        tradeline None; None when no last 4 digits match at all.
+        Results are remembered per (last 4, name).
+        """
+        last4 = str(account_number)[-4:] if account_number else ""
+        key = (last4, str(name), threshold)
+        try:
+            return self._matches[key]
+        except KeyError:
+            pass
+        found = None
+        # built even without last 4 digits: malformed tradelines surface as they always did
+        candidates = self.candidates(last4)
+        if candidates:
+            names = self._bucket_names(last4)
+            hit = self._first_match(names, name, threshold)
+            if hit is not None:
+                found = TradelineMatch(candidates[hit[0]], last4, names.reported[hit[0]], hit[1])
+            else:
+                # scored on its own: only the hits come back from the batch
+                last = names.reported[-1]
+                found = TradelineMatch(None, last4, last, fuzzy_ratio(last, name))
+        if (found is None or found.tradeline is None) and self._error is not None:
+            raise self._error
+        self._matches[key] = found
+        return found
+
+    @staticmethod
+    def _first_match(names: _Names, name: Any, threshold: int) -> Optional[Tuple[int, int]]:
+        """(index, score) of the first name scoring >= threshold against name."""
+        if name is None:
+            return None
+        if not _batch:
+            scores = ((i, fuzzy_ratio(n, name)) for i, n in enumerate(names.reported))
+            return next((hit for hit in scores if hit[1] >= threshold), None)
+        extract, default_process = _batch
+        # one call scores the whole bucket; hits come best first
+        hits = extract(default_process(str(name)), names.scored, scorer=_scorer, processor=None,
+                       score_cutoff=threshold, limit=None)
+        return min(((i, int(score)) for _, score, i in hits), default=None)
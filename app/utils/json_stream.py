@@ -0,0 +1,149 @@
+# app/utils/json_stream.py
+import re
+from typing import List
+
+# 64 MB - no single loan context should come anywhere near this
+MAX_DOCUMENT_BYTES = 64 * 1024 * 1024
+
+_TOKEN = re.compile(rb'[\[\]{}",]')
+_STRING = re.compile(rb'"(?:[^"\\]|\\.)*"', re.S)
+_SPACE = re.compile(rb'[ \t\r\n]*')
+
+
+class StreamFormatError(ValueError):
+    """The byte stream is neither NDJSON nor a well-formed JSON array."""
+
+
+class JSONStreamSplitter:
+    """
+    Incrementally splits a byte stream into raw JSON documents without
+    buffering the whole stream. Accepts either
+      - NDJSON: one document per line, or
+      - a JSON array: one document per element.
+    The format is sniffed from the first non-blank byte. Documents are
+    returned as raw bytes; decoding them (and reporting bad ones) is left
+    to the caller so one malformed document doesn't end the stream.
+    """
+
+    def __init__(self, max_document_bytes: int = MAX_DOCUMENT_BYTES):
+        self.max_document_bytes = max_document_bytes
+        self._buf = b''
+        # unterminated NDJSON line so far, as received (joined once it ends)
+        self._line: List[bytes] = []
+        self._line_bytes = 0
+        self._mode = None       # None until sniffed, then 'ndjson' / 'array' / 'done'
+        self._pos = 0           # scan position in _buf (array mode)
+        self._start = None      # start of the current element (array mode)
+        self._depth = 0
+
+    def feed(self, data: bytes) -> List[bytes]:
+        if self._mode == 'done':
+            if data.strip():
+                raise StreamFormatError("unexpected data after JSON array")
+            return []
+        if self._mode == 'ndjson':
+            return self._feed_ndjson(data)
+        self._buf += data
+        if self._mode is None:
+            m = _SPACE.match(self._buf)
+            if m.end() == len(self._buf):
+                return []
+            if self._buf[m.end():m.end() + 1] == b'[':
+                self._mode = 'array'
+                self._pos = m.end() + 1
+            else:
+                self._mode = 'ndjson'
+                data, self._buf = self._buf, b''
+                return self._feed_ndjson(data)
+        return self._feed_array()
+
+    def close(self) -> List[bytes]:
+        if self._mode == 'ndjson':
+            tail = b''.join(self._line).strip()
+            self._line, self._line_bytes = [], 0
+            return [tail] if tail else []
+        if self._mode == 'array':
+            raise StreamFormatError("unexpected end of stream inside JSON array")
+        if self._mode == 'done' and self._buf[self._pos:].strip():
+            raise StreamFormatError("unexpected data after JSON array")
+        return []
+
+    def _check_size(self, pending: int):
+        if pending > self.max_document_bytes:
+            raise StreamFormatError(f"document exceeds {self.max_document_bytes} bytes")
+
+    def _feed_ndjson(self, data: bytes) -> List[bytes]:
+        # only the new bytes are searched, so a long line arriving in many
+        # small chunks costs linear time
+        if b'\n' not in data:
+            if data:
+                self._line.append(data)
+                self._line_bytes += len(data)
+                self._check_size(self._line_bytes)
+            return []
+        *lines, tail = data.split(b'\n')
+        if self._line:
+            lines[0] = b''.join(self._line) + lines[0]
+        self._line, self._line_bytes = ([tail], len(tail)) if tail else ([], 0)
+        self._check_size(self._line_bytes)
+        return [line for line in (x.strip() for x in lines) if line]
+
+    def _feed_array(self) -> List[bytes]:
+        out = []
+        buf = self._buf
+        pos, start, depth = self._pos, self._start, self._depth
+        while self._mode == 'array':
+            if start is None:
+                # between elements: skip blanks and separators
+                pos = _SPACE.match(buf, pos).end()
+                if pos >= len(buf):
+                    break
+                if buf[pos:pos + 1] == b',':
+                    pos += 1
+                    continue
+                if buf[pos:pos + 1] == b']':
+                    pos += 1
+                    self._mode = 'done'
+                    break
+                start, depth = pos, 0
+
+            m = _TOKEN.search(buf, pos)
+            if m is None:
+                pos = len(buf)
+                break
+            ch = m.group()
+            if ch == b'"':
+                s = _STRING.match(buf, m.start())
+                if s is None:
+                    # string continues in the next chunk
+                    pos = m.start()
+                    break
+                pos = s.end()
+            elif ch in (b'{', b'['):
+                depth += 1
+                pos = m.end()
+            elif depth == 0:
+                if ch == b'}':
+                    raise StreamFormatError("unbalanced '}' in JSON array")
+                # ',' or ']' closing a scalar element
+                out.append(buf[start:m.start()].strip())
+                start, pos = None, m.start()
+            elif ch == b',':
+                pos = m.end()
+            else:
+                depth -= 1
+                pos = m.end()
+                if depth == 0:
+                    out.append(buf[start:pos])
+                    start = None
+
+        # drop everything already handed out
+        cut = start if start is not None else pos
+        if self._mode == 'array':
+            self._buf = buf[cut:]
+            self._pos, self._start, self._depth = pos - cut, (None if start is None else 0), depth
+            if start is not None:
+                self._check_size(len(self._buf))
+        else:
+            self._buf, self._pos = buf[pos:], 0
+        return out
@@ -1,14 +1,101 @@
 # app/utils/logger.py
+"""
+Loggers hand records to a bounded in-memory queue; one background thread
+writes them to the console and, as JSON lines, to LOG_FILE (rotated by
+size). Logging from a request thread never waits for I/O: when the queue
+is full, records are dropped and counted instead.
+"""
+import atexit
+import json
 import logging, os
+import queue
+import threading
+from datetime import datetime, timezone
 from logging import Logger
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_FILE = os.getenv("LOG_FILE", os.path.join("logs", "app.log"))
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# LogRecord attributes; anything else on a record came in via `extra=`
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, extra fields, exc."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        out = {'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+               'level': record.levelname, 'logger': record.name, 'msg': record.getMessage()}
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS:
+                out[key] = value
+        if record.exc_info:
+            out['exc'] = self.formatException(record.exc_info)
+        return json.dumps(out, default=str)
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking."""
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_handler: _DroppingQueueHandler = None
+_listener: QueueListener = None
+_lock = threading.Lock()
+
+
+def _queue_handler() -> _DroppingQueueHandler:
+    global _handler, _listener
+    with _lock:
+        if _handler is None:
+            console = logging.StreamHandler()
+            console.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+            # sampled traces (DEBUG) only go to the file
+            console.setLevel(getattr(logging, os.getenv('LOG_LEVEL', 'INFO').upper(), logging.INFO))
+            handlers = [console]
+            if LOG_FILE:
+                os.makedirs(os.path.dirname(LOG_FILE) or '.', exist_ok=True)
+                file_handler = RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES,
+                                                   backupCount=LOG_BACKUP_COUNT, encoding='utf-8', delay=True)
+                file_handler.setFormatter(JSONFormatter())
+                handlers.append(file_handler)
+            q = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+            _listener = QueueListener(q, *handlers, respect_handler_level=True)
+            _listener.start()
+            atexit.register(shutdown_logging)
+            _handler = _DroppingQueueHandler(q)
+    return _handler
+
+
+def shutdown_logging():
+    """Write out queued records and stop the background thread."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def dropped_records() -> int:
+    return _handler.dropped if _handler is not None else 0
+
 
 def get_logger(name: str = __name__) -> Logger:
     lvl = os.getenv('LOG_LEVEL', 'INFO').upper()
     logger = logging.getLogger(name)
     if not logger.handlers:
-        ch = logging.StreamHandler()
-        fmt = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        ch.setFormatter(fmt)
-        logger.addHandler(ch)
+        logger.addHandler(_queue_handler())
     logger.setLevel(getattr(logging, lvl, logging.INFO))
     return logger
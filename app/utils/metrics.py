@@ -0,0 +1,153 @@
+# app/utils/metrics.py
+"""
+In-process latency histograms and counters, rendered in the Prometheus
+text format by GET /metrics.
+
+Off unless METRICS_ENABLED is set: the hot path checks `metrics.ENABLED`
+once per evaluation, so a disabled build pays for a few attribute reads.
+Each process keeps its own numbers; with several uvicorn workers, scrape
+each one (or let Prometheus sum them).
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+ENABLED = os.getenv("METRICS_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Seconds; rules run in microseconds, requests in milliseconds
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                   0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def inc_each(self, label_tuples: Iterable[Tuple]):
+        """inc() once per label tuple, under a single lock acquisition."""
+        values = self._values
+        with self._lock:
+            for labels in label_tuples:
+                values[labels] = values.get(labels, 0) + 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self._values: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(counts), total) for labels, (counts, total) in self._values.items())
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+STAGE_SECONDS = Histogram(
+    "rule_engine_stage_seconds",
+    "Time per processing stage (config_load, context_fetch, trigger_check, validate, serialize)",
+    ("stage",))
+RULE_SECONDS = Histogram(
+    "rule_engine_rule_seconds", "Validator run time per rule", ("rule_id", "validator"))
+RULE_RESULTS = Counter(
+    "rule_engine_rule_results_total", "Results per rule and status", ("rule_id", "status"))
+EVALUATIONS = Counter(
+    "rule_engine_evaluations_total", "Loans evaluated")
+RESULT_STORE_BATCH_SIZE = Histogram(
+    "rule_engine_result_store_batch_size", "Results written per bulk_write of the result store",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000))
+RESULT_STORE_FLUSH_SECONDS = Histogram(
+    "rule_engine_result_store_flush_seconds", "Time per bulk_write of the result store")
+RESULT_STORE_WRITES = Counter(
+    "rule_engine_result_store_writes_total",
+    "Results handed to the result store by outcome (written, unchanged, dropped, failed)", ("outcome",))
+
+REGISTRY = (STAGE_SECONDS, RULE_SECONDS, RULE_RESULTS, EVALUATIONS,
+            RESULT_STORE_BATCH_SIZE, RESULT_STORE_FLUSH_SECONDS, RESULT_STORE_WRITES)
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    for metric in REGISTRY:
+        metric.clear()
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block as processing stage `name` (no-op when disabled)."""
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, name)
@@ -0,0 +1,104 @@
+# app/utils/serialization.py
+"""
+Result encoding for API responses and batch output.
+
+JSON goes through orjson when it is installed (stdlib json otherwise) and
+msgpack is offered when the msgpack package is installed; `negotiate`
+picks one from an Accept header. datetimes are written as ISO 8601 by the
+encoder itself, so results are never walked by jsonable_encoder first.
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Mapping, Tuple
+from app.core.base_validator import NO_DETAILS, PASS, ValidationResult
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+_MSGPACK_TYPES = (MSGPACK, "application/x-msgpack")
+
+
+def _default(obj: Any) -> Any:
+    """Values the encoders don't handle themselves."""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, Decimal):
+        return float(obj)
+    return str(obj)
+
+
+def result_dicts(results: Iterable[ValidationResult], compact: bool = False) -> List[Dict[str, Any]]:
+    """
+    Results in their JSON shape; compact leaves `details` out of PASS
+    results (and of any result that has none).
+    """
+    out = []
+    for r in results:
+        d = {"rule_id": r.rule_id, "status": r.status, "message": r.message}
+        if not compact:
+            d["details"] = {} if r.details is NO_DETAILS else r.details
+        elif r.status is not PASS and r.details:
+            d["details"] = r.details
+        out.append(d)
+    return out
+
+
+def dumps_json(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, separators=(',', ':')).encode('utf-8')
+
+
+def dumps_msgpack(obj: Any) -> bytes:
+    if msgpack is None:
+        raise RuntimeError("msgpack is not installed")
+    return msgpack.packb(obj, default=_default, use_bin_type=True)
+
+
+def negotiate(accept: str) -> str:
+    """MSGPACK if the Accept header prefers it (and msgpack is available), else JSON."""
+    if msgpack is None or not accept:
+        return JSON
+    best, best_q = JSON, -1.0
+    for position, part in enumerate(accept.split(',')):
+        media_type, _, params = part.partition(';')
+        media_type = media_type.strip().lower()
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media_type in _MSGPACK_TYPES:
+            encoding = MSGPACK
+        elif media_type in (JSON, "application/*", "*/*"):
+            encoding = JSON
+        else:
+            continue
+        # earlier entries win ties
+        if q > best_q:
+            best, best_q = encoding, q
+    return best if best_q > 0 else JSON
+
+
+def encode(obj: Any, media_type: str = JSON) -> Tuple[bytes, str]:
+    """obj encoded as media_type (JSON or MSGPACK); returns (body, media type)."""
+    if media_type == MSGPACK:
+        return dumps_msgpack(obj), MSGPACK
+    return dumps_json(obj), JSON
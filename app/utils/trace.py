@@ -0,0 +1,58 @@
+# app/utils/trace.py
+"""
+Sampled per-rule tracing.
+
+An evaluation is traced when it runs inside a trace_scope that was sampled
+(1 in TRACE_SAMPLE_EVERY; 0 samples nothing) or forced, e.g. by sending the
+TRACE_HEADER request header. Traced evaluations log one 'app.trace' record
+per triggered rule (validator, status, seconds) plus whatever the
+validators add with event(); untraced ones only pay for a ContextVar read.
+Trace records are DEBUG and go to the JSON log file, not the console.
+"""
+import itertools
+import logging
+import os
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+from app.utils.logger import get_logger
+
+TRACE_SAMPLE_EVERY = int(os.getenv("TRACE_SAMPLE_EVERY", "0"))
+TRACE_HEADER = os.getenv("TRACE_HEADER", "X-Trace")
+
+logger = get_logger('app.trace')
+logger.setLevel(logging.DEBUG)
+
+_trace_id: ContextVar[Optional[str]] = ContextVar('trace_id', default=None)
+_counter = itertools.count(1)
+
+
+def active() -> Optional[str]:
+    """Id of the trace the caller runs in, or None."""
+    return _trace_id.get()
+
+
+def sampled(force: bool = False) -> bool:
+    return force or (TRACE_SAMPLE_EVERY > 0 and next(_counter) % TRACE_SAMPLE_EVERY == 0)
+
+
+@contextmanager
+def trace_scope(force: bool = False, trace_id: str = None) -> Iterator[Optional[str]]:
+    """Start a trace if this call is sampled (or forced); yields its id, or None."""
+    current = _trace_id.get()
+    if current is not None or not sampled(force):
+        yield current
+        return
+    token = _trace_id.set(trace_id or uuid.uuid4().hex[:16])
+    try:
+        yield _trace_id.get()
+    finally:
+        _trace_id.reset(token)
+
+
+def event(name: str, **data):
+    """Log a trace record if a trace is active."""
+    trace_id = _trace_id.get()
+    if trace_id is not None:
+        logger.debug(name, extra={'trace_id': trace_id, 'data': data})
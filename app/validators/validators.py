@@ -1,11 +1,16 @@
 # app/validators/validators.py
+from collections.abc import Mapping
 from app.core.base_validator import BaseValidator
+from app.utils import trace
 from app.utils.date_utils import parse_date, months_between, days_between
-from app.utils.fuzzy_matcher import fuzzy_ratio, normalize_string
+from app.utils.fuzzy_matcher import TradelineIndex, normalize_string
 
-# All validators follow evaluate(rule, context, resolver) -> returns dict result
+# All validators follow evaluate(rule, context, resolver) -> returns a ValidationResult
+# and declare the fields.yaml fields they read (`reads`) for incremental re-evaluation
 
 class LTVValidator(BaseValidator):
+    reads = {'los': ['ltv', 'cltv', 'hcltv']}
+
     def evaluate(self, rule, context, resolver):
         ltv = resolver.resolve(context, 'los', 'ltv')
         cltv = resolver.resolve(context, 'los', 'cltv')
@@ -35,10 +40,14 @@ class LTVValidator(BaseValidator):
         return self.pass_result(rule, details=details)
 
 class DTIValidator(BaseValidator):
+    reads = {'los': ['dti']}
+    # rule params override it
+    dti_limit = 50
+
     def evaluate(self, rule, context, resolver):
         dti = resolver.resolve(context, 'los', 'dti')
         params = rule.get('params', {})
-        limit = params.get('dti_limit', 50)
+        limit = params.get('dti_limit', self.dti_limit)
         details = {'dti': dti, 'limit': limit}
         try:
             d = float(dti)
@@ -49,6 +58,8 @@ class DTIValidator(BaseValidator):
         return self.pass_result(rule, details=details)
 
 class OccupancyValidator(BaseValidator):
+    reads = {'los': ['property_will_be']}
+
     def evaluate(self, rule, context, resolver):
         # Rule 14: For HomeReady/Home Possible -> property_will_be must be Primary
         prop = resolver.resolve(context, 'los', 'property_will_be')
@@ -60,6 +71,8 @@ class OccupancyValidator(BaseValidator):
         return self.pass_result(rule, details=details)
 
 class SecondHomeValidator(BaseValidator):
+    reads = {'los': ['no_units']}
+
     def evaluate(self, rule, context, resolver):
         # Rule 15: if Property Will Be Secondary -> No Units must equal 1
         no_units = resolver.resolve(context, 'los', 'no_units')
@@ -72,6 +85,8 @@ class SecondHomeValidator(BaseValidator):
         return self.pass_result(rule, details=details)
 
 class InvestmentValidator(BaseValidator):
+    reads = {'los': ['loan_program_detail', 'property_type']}
+
     def evaluate(self, rule, context, resolver):
         # Rule 16: Investment property not manufactured
         loan_prog = resolver.resolve(context, 'los', 'loan_program_detail')
@@ -84,6 +99,10 @@ class InvestmentValidator(BaseValidator):
         return self.pass_result(rule, details=details)
 
 class CreditScoreValidator(BaseValidator):
+    reads = {'los': ['average_representative_credit_score']}
+    # scores at or below it alert
+    min_score = 620
+
     def evaluate(self, rule, context, resolver):
         # Rule 17: Average representative > 620
         score = resolver.resolve(context, 'los', 'average_representative_credit_score')
@@ -92,27 +111,27 @@ class CreditScoreValidator(BaseValidator):
             s = float(score)
         except:
             return self.not_applicable_result(rule)
-        if s <= 620:
+        if s <= self.min_score:
             return self.alert_result(rule, details=details)
         return self.pass_result(rule, details=details)
 
 class GiftValidator(BaseValidator):
+    reads = {'los': ['gift_amount', 'cash_to_borrower', 'loan_program_detail', 'borrower_current_address_housing',
+                     'borrower_previous_address_housing', 'real_estate_street_address', 'borrower_section_5a_ownership']}
+
     def evaluate(self, rule, context, resolver):
         # Rule 18: CONDITION only if gift amount > 0 
         gift_amount = resolver.resolve(context, 'los', 'gift_amount')
         cash_to = resolver.resolve(context, 'los', 'cash_to_borrower')
         details = {'gift_amount': gift_amount}
 
-        loan_program_detail_ = resolver.resolve(context,'los' ,'loan_program_detail')
-        print(f"Loan Program Detail: {loan_program_detail_}")
-        borrower_current_address_housing_ = resolver.resolve(context,'los' ,'borrower_current_address_housing')
-        print(f"Borrower Current Address Housing: {borrower_current_address_housing_}")
-        borrower_previous_address_housing_ = resolver.resolve(context,'los' , 'borrower_previous_address_housing')
-        print(f"Borrower Previous Address Housing: {borrower_previous_address_housing_}")
-        real_estate_street_address_ = resolver.resolve(context,'los' , 'real_estate_street_address')
-        print(f"Real Estate Street Address: {real_estate_street_address_}")
-        borrower_section_5a_ownership_ = resolver.resolve(context,'los' , 'borrower_section_5a_ownership')
-        print(f"Borrower Section 5a Ownership: {borrower_section_5a_ownership_}")
+        if trace.active():
+            trace.event('gift_inputs', rule_id=rule.get('id'),
+                        loan_program_detail=resolver.resolve(context, 'los', 'loan_program_detail'),
+                        borrower_current_address_housing=resolver.resolve(context, 'los', 'borrower_current_address_housing'),
+                        borrower_previous_address_housing=resolver.resolve(context, 'los', 'borrower_previous_address_housing'),
+                        real_estate_street_address=resolver.resolve(context, 'los', 'real_estate_street_address'),
+                        borrower_section_5a_ownership=resolver.resolve(context, 'los', 'borrower_section_5a_ownership'))
         try:
             g = float(gift_amount) if gift_amount is not None else 0.0
         except:
@@ -123,6 +142,9 @@ class GiftValidator(BaseValidator):
         return self.pass_result(rule, details=details)
 
 class CashoutSeasoningValidator(BaseValidator):
+    reads = {'los': ['liabilities_account_number', 'liabilities_name', 'estimated_closing_date']}
+    raw_reads = {'credit_report': ['Tradelines']}
+
     def evaluate(self, rule, context, resolver):
         # STEP 0 — Resolve core fields
         liabilities_acc = resolver.resolve(context, 'los', 'liabilities_account_number') or ""
@@ -140,32 +162,23 @@ class CashoutSeasoningValidator(BaseValidator):
         if not tradelines_raw:
             return self.not_applicable_result(rule)
 
-        # If Tradelines is a dict, convert to list
-        if isinstance(tradelines_raw, dict):
+        # If Tradelines is a single document, convert to list
+        if isinstance(tradelines_raw, Mapping):
             tradelines = [tradelines_raw]
         else:
             tradelines = tradelines_raw
 
-        # STEP (i): Match last 4 + fuzzy name
-        last4 = str(liabilities_acc)[-4:] if liabilities_acc else ""
+        # STEP (i): Match last 4 + fuzzy name (index shared per context)
+        index = resolver.shared(context, 'tradeline_index', lambda: TradelineIndex(tradelines))
+        match = index.match(liabilities_acc, liabilities_name)
         matched = None
-
-        for t in tradelines:
-            acc_no = t.get("Creditor Account Number") or t.get("Creditor_Account_Number") or ""
-            acc_last4 = str(acc_no)[-4:] if acc_no else ""
-            creditor_name = t.get("Creditor Name") or t.get("Creditor_Name") or ""
-
-            if last4 and acc_last4 and last4 == acc_last4:
-                # fuzzy match name
-                score = fuzzy_ratio(creditor_name, liabilities_name)
-                details.update({
-                    'matched_account_last4': acc_last4,
-                    'creditor_name': creditor_name,
-                    'fuzzy_score': score
-                })
-                if score >= 70:  # default threshold
-                    matched = t
-                    break
+        if match is not None:
+            details.update({
+                'matched_account_last4': match.last4,
+                'creditor_name': match.creditor_name,
+                'fuzzy_score': match.score
+            })
+            matched = match.tradeline
 
         # If STEP (i) fails ⇒ alert, STOP HERE
         if not matched:
@@ -202,6 +215,12 @@ class CashoutSeasoningValidator(BaseValidator):
 
 
 class TitleValidator(BaseValidator):
+    reads = {'title': ['chain_title_date'], 'los': ['estimated_closing_date']}
+    # two parsed dates: several times the cost of the cache lookup
+    cache_results = True
+    # rule params override it
+    min_months = 6
+
     def evaluate(self, rule, context, resolver):
         # Rule 20: chain title date vs estimated closing >= 6 months
         chain_date = resolver.resolve(context, 'title', 'chain_title_date')
@@ -213,11 +232,17 @@ class TitleValidator(BaseValidator):
             months = months_between(parse_date(chain_date), parse_date(est_close))
         except:
             return self.not_applicable_result(rule)
-        if months < rule.get('params', {}).get('min_months', 6):
+        if months < rule.get('params', {}).get('min_months', self.min_months):
             return self.alert_result(rule, details=details)
         return self.pass_result(rule, details=details)
 
 class FraudValidator(BaseValidator):
+    reads = {'drive_report': ['drive_street', 'drive_city', 'drive_state', 'drive_unit', 'fraud_recorded_date'],
+             'los': ['estimated_closing_date', 'urla_lender_subject_street', 'urla_lender_subject_city',
+                     'urla_lender_subject_state', 'urla_lender_subject_unit']}
+    # address normalization and date parsing outweigh the cache lookup
+    cache_results = True
+
     def evaluate(self, rule, context, resolver):
         # Rule 21: only when drive report address EXACT matches subject property address
         drive = context.get('drive_report', {})
@@ -235,8 +260,7 @@ class FraudValidator(BaseValidator):
         subj_unit = resolver.resolve(context, 'los', 'urla_lender_subject_unit')
         details = {'drive_addr': {'street': dr_street, 'city': dr_city, 'state': dr_state, 'unit': dr_unit},
                    'subject_addr': {'street': subj_street, 'city': subj_city, 'state': subj_state, 'unit': subj_unit}}
-        print(dr_street)
-        print(subj_street)
+        trace.event('fraud_addresses', rule_id=rule.get('id'), **details)
         # exact normalized comparison
         if normalize_string(dr_street) != normalize_string(subj_street) or \
            normalize_string(dr_city) != normalize_string(subj_city) or \
@@ -257,6 +281,10 @@ class FraudValidator(BaseValidator):
         return self.pass_result(rule, details=details)
 
 class AppraisalPriorSaleValidator(BaseValidator):
+    reads = {'appraisal': ['prior_sale_date'], 'los': ['estimated_closing_date']}
+    cache_results = True
+    # rule params override it
+    min_months = 6
 
     def evaluate(self, rule, context, resolver):
         prior_sale = resolver.resolve(context, 'appraisal', 'prior_sale_date')
@@ -268,11 +296,13 @@ class AppraisalPriorSaleValidator(BaseValidator):
             months = months_between(parse_date(prior_sale), parse_date(est_close))
         except:
             return self.not_applicable_result(rule)
-        if months < rule.get('params', {}).get('min_months', 6):
+        if months < rule.get('params', {}).get('min_months', self.min_months):
             return self.alert_result(rule, details=details)
         return self.pass_result(rule, details=details)
 
 class LoanProgramValidator(BaseValidator):
+    reads = {'los': ['amortization_type']}
+
     def evaluate(self, rule, context, resolver):
         # Rule 23: HomeReady/Home Possible must be Fixed Rate amortization
         amort = resolver.resolve(context, 'los', 'amortization_type')
@@ -284,6 +314,11 @@ class LoanProgramValidator(BaseValidator):
         return self.pass_result(rule, details=details)
 
 class CashbackValidator(BaseValidator):
+    reads = {'los': ['cash_from_borrower', 'cash_to_borrower', 'loan_amount']}
+    # rule params override them
+    absolute_limit = 2000
+    percent_limit = 0.01
+
     def evaluate(self, rule, context, resolver):
         # Rule 24: Negative cash from/to borrower must not exceed max(1% loan amount, $2000)
         cash_from = resolver.resolve(context, 'los', 'cash_from_borrower')
@@ -306,14 +341,16 @@ class CashbackValidator(BaseValidator):
                 continue
         if not negs:
             return self.not_applicable_result(rule, details=details)
-        max_allowed = min(rule.get('params', {}).get('absolute_limit', 2000),
-                          loan * rule.get('params', {}).get('percent_limit', 0.01))
+        max_allowed = min(rule.get('params', {}).get('absolute_limit', self.absolute_limit),
+                          loan * rule.get('params', {}).get('percent_limit', self.percent_limit))
         for amt in negs:
             if amt > max_allowed:
                 return self.alert_result(rule, details=details)
         return self.pass_result(rule, details=details)
 
 class HomebuyerProgramValidator(BaseValidator):
+    reads = {'los': ['homebuyer_education_certificate']}
+
     def evaluate(self, rule, context, resolver):
         # Rule 25: Condition if homebuyer education certificate missing
         cert = resolver.resolve(context, 'los', 'homebuyer_education_certificate')
@@ -323,6 +360,8 @@ class HomebuyerProgramValidator(BaseValidator):
         return self.condition_result(rule, message=rule.get('condition_message'), details=details)
 
 class HomebuyerLTVValidator(BaseValidator):
+    reads = {'los': ['ltv', 'homebuyer_education_certificate']}
+
     def evaluate(self, rule, context, resolver):
         # Rule 26: If LTV > 95 and first-time buyer indicators then condition if certificate missing
         ltv = resolver.resolve(context, 'los', 'ltv')
@@ -341,6 +380,8 @@ class HomebuyerLTVValidator(BaseValidator):
         return self.pass_result(rule, details=details)
 
 class IncomeValidator(BaseValidator):
+    reads = {'los': ['total_income', 'area_median_income']}
+
     def evaluate(self, rule, context, resolver):
         # Rule 27: Compare total_income to area median income (AMI)
         income = resolver.resolve(context, 'los', 'total_income')
@@ -356,6 +397,8 @@ class IncomeValidator(BaseValidator):
         return self.pass_result(rule, details=details)
 
 class LienPayoffValidator(BaseValidator):
+    reads = {'los': ['liabilities_will_be_paid_off', 'liabilities_account_type', 'liabilities_name']}
+
     def evaluate(self, rule, context, resolver):
         # Rule 28: If liabilities will be paid off -> if count > 1 OR account type != 'Mortgage' -> ALERT
         paid_off = resolver.resolve(context, 'los', 'liabilities_will_be_paid_off')
@@ -0,0 +1,381 @@
+# app/worker.py
+"""
+Re-validation worker.
+
+    python -m app.worker
+
+Watches the five source collections and re-evaluates a loan whenever one
+of its documents is inserted or updated. Updates arrive in bursts (all
+five documents of a loan within seconds), so they are coalesced per
+loan_id: a loan is evaluated once its updates have been quiet for
+WORKER_DEBOUNCE_SECONDS, or WORKER_MAX_DELAY_SECONDS after its first
+pending update at the latest. Only the rules depending on the changed
+collections are re-run when the loan's stored results came from the
+same rule plan. Results are written behind to RESULTS_COLLECTION, one
+document per loan and rule plan (see core.result_store).
+
+Change streams need a replica set (a single-node one is enough); without
+one the worker polls each collection by WORKER_UPDATED_FIELD instead.
+The stored source position (resume token / poll marks) only moves past
+an update once its loan's results have been written, so a worker that
+dies with loans still pending picks their updates up again on restart.
+"""
+import os
+import signal
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure, PyMongoError
+from app.core.base_validator import ValidationResult
+from app.core.mongo_client import MongoClientWrapper, SOURCE_COLLECTIONS, close_clients
+from app.core.projections import build_projections
+from app.core.result_store import RESULTS_COLLECTION, ResultStore
+from app.core.rule_dispatcher import RuleDispatcher
+from app.core.rule_plan import load_rule_plan
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+WORKER_STATE_COLLECTION = os.getenv("WORKER_STATE_COLLECTION", "ValidationWorkerState")
+# auto | change_stream | poll
+WORKER_MODE = os.getenv("WORKER_MODE", "auto")
+WORKER_DEBOUNCE_SECONDS = float(os.getenv("WORKER_DEBOUNCE_SECONDS", "2"))
+WORKER_MAX_DELAY_SECONDS = float(os.getenv("WORKER_MAX_DELAY_SECONDS", "30"))
+WORKER_POLL_INTERVAL_SECONDS = float(os.getenv("WORKER_POLL_INTERVAL_SECONDS", "5"))
+WORKER_UPDATED_FIELD = os.getenv("WORKER_UPDATED_FIELD", "updated_at")
+
+# Error code of "$changeStream is only supported on replica sets"
+_CHANGE_STREAMS_UNSUPPORTED = 40573
+
+
+class Coalescer:
+    """
+    Pending updates per loan_id. A loan becomes due when it has been quiet
+    for `debounce` seconds or has waited `max_delay` seconds since its
+    first pending update, whichever comes first. Thread-safe.
+
+    Sources also hand it their positions (checkpoint); a position is
+    released by committable() once every update added before it has been
+    popped, so it is never stored ahead of an unevaluated update.
+    """
+
+    def __init__(self, debounce: float = WORKER_DEBOUNCE_SECONDS,
+                 max_delay: float = WORKER_MAX_DELAY_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.clock = clock
+        # loan_id -> (first update, last update, changed collections,
+        # sequence number of the first update)
+        self._pending: Dict[Any, Tuple[float, float, Set[str], int]] = {}
+        # updates added so far
+        self._seq = 0
+        # position key -> [(updates added before it, value)], oldest first
+        self._checkpoints: Dict[str, List[Tuple[int, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, loan_id: Any, collection: str):
+        now = self.clock()
+        with self._lock:
+            self._seq += 1
+            entry = self._pending.get(loan_id)
+            if entry is None:
+                self._pending[loan_id] = (now, now, {collection}, self._seq)
+            else:
+                entry[2].add(collection)
+                self._pending[loan_id] = (entry[0], now, entry[2], entry[3])
+
+    def pop_due(self) -> List[Tuple[Any, Set[str]]]:
+        """Remove and return (loan_id, changed collections) of every due loan."""
+        now = self.clock()
+        due = []
+        with self._lock:
+            for loan_id, (first, last, collections, _) in list(self._pending.items()):
+                if now - last >= self.debounce or now - first >= self.max_delay:
+                    del self._pending[loan_id]
+                    due.append((loan_id, collections))
+        return due
+
+    def checkpoint(self, key: str, value: Any):
+        """A source's position `key` is now `value`, past every update added so far."""
+        with self._lock:
+            marks = self._checkpoints.setdefault(key, [])
+            if marks and marks[-1][0] == self._seq:
+                marks[-1] = (self._seq, value)
+            else:
+                marks.append((self._seq, value))
+
+    def committable(self) -> Dict[str, Any]:
+        """
+        Remove and return the latest position per key that no pending update
+        precedes. Call it once the loans popped so far are stored.
+        """
+        with self._lock:
+            oldest = min((entry[3] for entry in self._pending.values()), default=None)
+            out = {}
+            for key, marks in self._checkpoints.items():
+                n = 0
+                for seq, value in marks:
+                    if oldest is not None and seq >= oldest:
+                        break
+                    out[key] = value
+                    n += 1
+                del marks[:n]
+            return out
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+
+class ChangeStreamSource:
+    """Database change stream over the source collections (needs a replica set)."""
+
+    def __init__(self, db, state, save: Callable[[str, Any], None] = None):
+        """`save` records the resume token (default: state.set right away)."""
+        self.db = db
+        self.state = state
+        self.save = save or state.set
+        self.names = {name: coll for coll, name in SOURCE_COLLECTIONS.items()}
+        self._token = None
+
+    def check(self):
+        """Raise OperationFailure if change streams aren't available."""
+        with self.db.watch([{'$match': {'operationType': 'insert', 'ns.coll': '_'}}], max_await_time_ms=1):
+            pass
+
+    def run(self, emit: Callable[[Any, str], None], stop: threading.Event):
+        pipeline = [{'$match': {
+            'operationType': {'$in': ['insert', 'update', 'replace']},
+            'ns.coll': {'$in': list(self.names)},
+        }}]
+        while not stop.is_set():
+            token = self._token or self.state.get('resume_token')
+            try:
+                with self.db.watch(pipeline, full_document='updateLookup', resume_after=token,
+                                   max_await_time_ms=1000) as stream:
+                    if token is None:
+                        # first run: nothing was emitted before this point
+                        self.state.set('resume_token', stream.resume_token)
+                    while not stop.is_set():
+                        event = stream.try_next()
+                        if event is not None:
+                            loan_id = (event.get('fullDocument') or {}).get('loan_id')
+                            if loan_id is not None:
+                                emit(loan_id, self.names[event['ns']['coll']])
+                        self._token = stream.resume_token
+                        self.save('resume_token', self._token)
+            except PyMongoError as e:
+                logger.warning(f"Change stream interrupted ({e}); resuming")
+                stop.wait(1)
+
+
+class PollingSource:
+    """
+    Polls each source collection for documents whose WORKER_UPDATED_FIELD
+    moved past the last value seen. Documents must set that field on every
+    write. Starts from the stored position (the last value and the _ids
+    seen at it), or from now on the first run.
+    """
+
+    def __init__(self, db, state, field: str = WORKER_UPDATED_FIELD,
+                 interval: float = WORKER_POLL_INTERVAL_SECONDS, save: Callable[[str, Any], None] = None):
+        """`save` records the poll marks (default: state.set right away)."""
+        self.db = db
+        self.state = state
+        self.save = save or state.set
+        self.field = field
+        self.interval = interval
+        # collection -> (last value seen, _ids seen at that value)
+        self._marks: Dict[str, Tuple[Any, Set[Any]]] = {}
+
+    def _mark(self, coll: str) -> Tuple[Any, Set[Any]]:
+        if coll not in self._marks:
+            mark = self.state.get(f'poll.{coll}')
+            if mark is None:
+                # first run: nothing was emitted before now
+                mark = {'since': datetime.now(timezone.utc).replace(tzinfo=None), 'seen': []}
+                self.state.set(f'poll.{coll}', mark)
+            elif not isinstance(mark, dict):
+                # stored before the seen _ids were
+                mark = {'since': mark, 'seen': []}
+            self._marks[coll] = (mark['since'], set(mark['seen']))
+        return self._marks[coll]
+
+    def poll(self, emit: Callable[[Any, str], None]) -> int:
+        """One pass over all collections; returns the number of changed documents."""
+        changed = 0
+        for coll, name in SOURCE_COLLECTIONS.items():
+            since, seen = self._mark(coll)
+            # $gte + the _ids already seen at `since`: writes sharing the
+            # last timestamp are neither missed nor repeated
+            cursor = self.db[name].find({self.field: {'$gte': since}},
+                                        {'loan_id': 1, self.field: 1}).sort(self.field, ASCENDING)
+            for doc in cursor:
+                value = doc.get(self.field)
+                if value == since and doc['_id'] in seen:
+                    continue
+                if value != since:
+                    since, seen = value, set()
+                seen.add(doc['_id'])
+                changed += 1
+                if doc.get('loan_id') is not None:
+                    emit(doc['loan_id'], coll)
+            self._marks[coll] = (since, seen)
+            self.save(f'poll.{coll}', {'since': since, 'seen': list(seen)})
+        return changed
+
+    def run(self, emit: Callable[[Any, str], None], stop: threading.Event):
+        while not stop.is_set():
+            try:
+                self.poll(emit)
+            except PyMongoError as e:
+                logger.warning(f"Polling failed ({e}); retrying")
+            stop.wait(self.interval)
+
+
+class _WorkerState:
+    """Resume position (change stream token / poll marks), kept in Mongo."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._cache: Dict[str, Any] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(key: str) -> str:
+        # MongoDB would nest dotted field names
+        return key.replace('.', ':')
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            if self._cache is None:
+                doc = self.collection.find_one({'_id': 'worker'}) or {}
+                self._cache = {k: v for k, v in doc.items() if k != '_id'}
+            return self._cache.get(self._key(key))
+
+    def set(self, key: str, value: Any):
+        key = self._key(key)
+        with self._lock:
+            if self._cache is not None:
+                if self._cache.get(key) == value:
+                    return
+                self._cache[key] = value
+        self.collection.update_one({'_id': 'worker'}, {'$set': {key: value}}, upsert=True)
+
+
+class RevalidationWorker:
+    """
+    Feeds source changes into a Coalescer from a background thread and
+    re-validates due loans on the main thread. Call drain() to process
+    what is due now (tests), run() to loop until stop(). Source positions
+    are stored by drain(), after the results it queued are flushed.
+    """
+
+    def __init__(self, mongo: MongoClientWrapper = None, dispatcher: RuleDispatcher = None,
+                 coalescer: Coalescer = None, mode: str = WORKER_MODE, store: ResultStore = None):
+        self.dispatcher = dispatcher or RuleDispatcher(plan=load_rule_plan())
+        self.mongo = mongo or MongoClientWrapper(projections=build_projections(self.dispatcher.plan))
+        self.coalescer = Coalescer() if coalescer is None else coalescer
+        self.store = ResultStore(self.mongo.db[RESULTS_COLLECTION]) if store is None else store
+        self.state = _WorkerState(self.mongo.db[WORKER_STATE_COLLECTION])
+        self.source = self._select_source(mode)
+        self.stop_event = threading.Event()
+        self.evaluations = 0
+        # set once results were dropped or failed to write: positions stay
+        # where they are so that a restart replays the lost updates
+        self._hold_positions = False
+
+    def _select_source(self, mode: str):
+        save = self.coalescer.checkpoint
+        if mode == 'poll':
+            return PollingSource(self.mongo.db, self.state, save=save)
+        source = ChangeStreamSource(self.mongo.db, self.state, save=save)
+        if mode == 'change_stream':
+            return source
+        try:
+            source.check()
+            return source
+        except (OperationFailure, NotImplementedError) as e:
+            code = getattr(e, 'code', None)
+            if code not in (None, _CHANGE_STREAMS_UNSUPPORTED):
+                raise
+            logger.info(f"Change streams unavailable ({e}); polling by '{WORKER_UPDATED_FIELD}'")
+            return PollingSource(self.mongo.db, self.state, save=save)
+
+    def revalidate(self, loan_id: Any, changed: Set[str]) -> Optional[List[ValidationResult]]:
+        """Evaluate one loan and queue its results for storing; None if it has no LOS document."""
+        context = self.mongo.load_context(loan_id)
+        if not context['los']:
+            logger.info(f"Skipping loan {loan_id}: no LOS document")
+            return None
+        plan = self.dispatcher.plan
+        previous = self.store.get(loan_id, plan.version)
+        if previous:
+            results = self.dispatcher.evaluate_incremental(context, previous['results'], changed)
+        else:
+            results = self.dispatcher.evaluate(context)
+        self.store.put(loan_id, plan.version, results, changed=sorted(changed))
+        self.evaluations += 1
+        return results
+
+    def drain(self) -> int:
+        """
+        Re-validate every loan that is due, write their results and store
+        the source positions that are now covered; returns how many loans
+        were evaluated.
+        """
+        done = 0
+        for loan_id, changed in self.coalescer.pop_due():
+            try:
+                if self.revalidate(loan_id, changed) is not None:
+                    done += 1
+            except Exception:
+                logger.exception(f"Re-validation of loan {loan_id} failed")
+        self._store_positions()
+        return done
+
+    def _store_positions(self):
+        lost = self.store.failed + self.store.dropped
+        self.store.flush()
+        if self.store.failed + self.store.dropped != lost and not self._hold_positions:
+            self._hold_positions = True
+            logger.error("Results were not stored; source positions are no longer saved, "
+                         "a restart re-validates from the last stored one")
+        if self._hold_positions:
+            return
+        for key, value in self.coalescer.committable().items():
+            self.state.set(key, value)
+
+    def run(self, tick: float = 0.5):
+        feeder = threading.Thread(target=self.source.run, args=(self.coalescer.add, self.stop_event),
+                                  name="revalidation-source", daemon=True)
+        feeder.start()
+        logger.info(f"Worker started ({type(self.source).__name__}, plan {self.dispatcher.plan.version})")
+        while not self.stop_event.is_set():
+            self.drain()
+            self.stop_event.wait(tick)
+        feeder.join(timeout=5)
+        # flush what is pending without waiting for the debounce
+        self.coalescer.debounce = 0
+        self.drain()
+        self.store.close()
+        logger.info(f"Worker stopped after {self.evaluations} evaluations")
+
+    def stop(self, *_):
+        self.stop_event.set()
+
+
+def main():
+    worker = RevalidationWorker()
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    try:
+        worker.run()
+    finally:
+        close_clients()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+# tests/benchmarks/bench_dates.py
+"""
+parse_date / months_between against the original strptime loop.
+
+    python -m tests.benchmarks.bench_dates
+"""
+import random
+import timeit
+from app.utils import date_utils
+
+
+def _samples(n: int = 2000, distinct: int = 200):
+    rng = random.Random(7)
+    pool = []
+    for _ in range(distinct):
+        y, m, d = rng.randint(1995, 2025), rng.randint(1, 12), rng.randint(1, 28)
+        pool.append(rng.choice([f"{m:02d}-{d:02d}-{y}", f"{y}-{m:02d}-{d:02d}",
+                                f"{d + 12 if d <= 19 else d:02d}-{m:02d}-{y}", f"{m}/{d}/{y}", f"{y}/{m}/{d}"]))
+    return [rng.choice(pool) for _ in range(n)]
+
+
+def _bench(label: str, fn, values, repeat: int = 5) -> float:
+    best = min(timeit.repeat(lambda: [fn(v) for v in values], number=1, repeat=repeat))
+    print(f"{label:<34}{best / len(values) * 1e6:8.2f} us/date")
+    return best
+
+
+def main():
+    values = _samples()
+    legacy = _bench("legacy strptime loop", date_utils._parse_legacy, values)
+    date_utils._parse_explicit.cache_clear()
+    cold = _bench("sniffed, cold cache (1 pass)", date_utils.parse_date, values, repeat=1)
+    warm = _bench("sniffed, warm cache", date_utils.parse_date, values)
+    date_utils._parse_explicit.cache_clear()
+    sniff = _bench("sniffed, no cache", date_utils._sniff, values)
+    print(f"speedup: {legacy / cold:.1f}x cold, {legacy / warm:.1f}x warm, {legacy / sniff:.1f}x sniff only")
+
+    _bench("months_between(d, None)", date_utils.months_between, values)
+    with date_utils.evaluation_now():
+        _bench("  ... inside evaluation_now()", date_utils.months_between, values)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# tests/benchmarks/bench_engine.py
+"""
+Engine benchmarks over synthetic loans (see generator.py). Results are
+written as JSON so runs can be compared across commits.
+
+    python -m tests.benchmarks.bench_engine                  # -> .benchmarks/<commit>.json
+    python -m tests.benchmarks.bench_engine -n 200 -k validator -o /tmp/run.json
+    python -m tests.benchmarks.bench_engine --compare .benchmarks/abc123.json .benchmarks/def456.json
+
+--compare exits with status 1 when a benchmark got slower by more than
+--threshold (default 10%), so it can gate CI.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import timeit
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Tuple
+from app.core.result_cache import ResultCache
+from app.core.rule_dispatcher import RuleDispatcher
+from app.core.rule_plan import load_rule_plan
+from app.utils import date_utils
+from app.utils.fuzzy_matcher import fuzzy_ratio
+from tests.benchmarks.generator import generate_contexts
+
+RESULTS_DIR = '.benchmarks'
+
+# name -> (callable running one batch, operations per batch)
+Benchmark = Tuple[Callable[[], Any], int]
+
+
+def _commit() -> Tuple[str, bool]:
+    try:
+        sha = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                             text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                    capture_output=True, text=True).stdout.strip())
+        return sha, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+
+
+def build_benchmarks(contexts: List[Dict[str, Any]]) -> Dict[str, Benchmark]:
+    plan = load_rule_plan()
+    dispatcher = RuleDispatcher(plan=plan)
+    resolver = plan.resolver
+    benches: Dict[str, Benchmark] = {}
+
+    fields = [(coll, name) for coll, coll_fields in plan.fields.items() for name in (coll_fields or {})]
+    benches['resolver.resolve'] = (
+        lambda: [resolver.resolve(c, coll, name) for c in contexts for coll, name in fields],
+        len(contexts) * len(fields))
+
+    benches['dispatcher.check_trigger'] = (
+        lambda: [dispatcher._check_trigger(rule, c) for c in contexts for rule in plan.rules],
+        len(contexts) * len(plan.rules))
+    # every trigger against one view per loan, without the trigger index
+    benches['dispatcher.all_triggers'] = (
+        lambda: [[rule.trigger(view) for rule in plan.rules] for view in map(resolver.view, contexts)],
+        len(contexts))
+
+    # each validator over the loans that trigger one of its rules
+    calls: Dict[str, List[Tuple[Any, Dict[str, Any]]]] = {}
+    for c in contexts:
+        view = resolver.view(c)
+        for rule in plan.rules:
+            if rule.trigger(view):
+                calls.setdefault(rule.validator_cls.__name__, []).append((rule, c))
+
+    def validate(pairs):
+        for rule, c in pairs:
+            try:
+                rule.validator.evaluate(rule.rule, c, resolver.view(c))
+            except Exception:   # reported as ERROR by the dispatcher
+                pass
+    for name, pairs in sorted(calls.items()):
+        benches[f'validator.{name}'] = (lambda pairs=pairs: validate(pairs), len(pairs))
+
+    dates = [v for c in contexts for coll, name in fields if 'date' in name
+             for v in [resolver.resolve(c, coll, name)] if v]
+
+    def parse_cold():
+        date_utils._parse_explicit.cache_clear()
+        return [date_utils.parse_date(v) for v in dates]
+    benches['parse_date.cold'] = (parse_cold, len(dates))
+    benches['parse_date.warm'] = (lambda: [date_utils.parse_date(v) for v in dates], len(dates))
+
+    names = [(t.get('Creditor Name'), resolver.resolve(c, 'los', 'liabilities_name') or 'CHASE')
+             for c in contexts for t in _tradelines(c)]
+    benches['fuzzy_ratio'] = (lambda: [fuzzy_ratio(a, b) for a, b in names], len(names))
+
+    benches['dispatcher.evaluate'] = (lambda: [dispatcher.evaluate(c) for c in contexts], len(contexts))
+    # the same loans again: validators with cache_results are served from the cache
+    cached = RuleDispatcher(plan=plan, cache=ResultCache(maxsize=100000, ttl=3600))
+    for c in contexts:
+        cached.evaluate(c)
+    benches['dispatcher.evaluate.cached'] = (lambda: [cached.evaluate(c) for c in contexts], len(contexts))
+
+    try:
+        from fastapi.testclient import TestClient
+        from app.api.routes import app
+    except Exception:       # httpx missing: no route benchmark
+        pass
+    else:
+        client = TestClient(app)
+        bodies = [json.dumps(c).encode('utf-8') for c in contexts[:100]]
+        headers = {'content-type': 'application/json'}
+        benches['route.validate'] = (
+            lambda: [client.post('/validate', content=b, headers=headers) for b in bodies], len(bodies))
+    return benches
+
+
+def _tradelines(context: Dict[str, Any]) -> List[Dict[str, Any]]:
+    t = (context.get('credit_report') or {}).get('Tradelines') or []
+    return [t] if isinstance(t, dict) else t
+
+
+def run(n: int = 500, seed: int = 1, repeat: int = 5, select: str = None) -> Dict[str, Any]:
+    contexts = generate_contexts(n, seed=seed)
+    benches = build_benchmarks(contexts)
+    results = {}
+    for name, (fn, ops) in benches.items():
+        if select and select not in name:
+            continue
+        fn()    # warm-up
+        times = [t / ops * 1e6 for t in timeit.repeat(fn, number=1, repeat=repeat)]
+        results[name] = {'unit': 'us/op', 'ops': ops, 'min': round(min(times), 3),
+                         'median': round(statistics.median(times), 3),
+                         'mean': round(statistics.fmean(times), 3)}
+        print(f"{name:<40}{results[name]['min']:10.2f} us/op  ({ops} ops)", file=sys.stderr)
+    sha, dirty = _commit()
+    return {'meta': {'commit': sha, 'dirty': dirty, 'python': platform.python_version(),
+                     'platform': platform.platform(), 'cpus': os.cpu_count(),
+                     'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                     'loans': n, 'seed': seed, 'repeat': repeat},
+            'benchmarks': results}
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any], threshold: float = 0.10) -> int:
+    """Print min-time ratios new/old; returns the number of regressions beyond threshold."""
+    regressions = 0
+    print(f"{'benchmark':<40}{old['meta']['commit']:>12}{new['meta']['commit']:>12}   ratio")
+    for name in sorted(set(old['benchmarks']) | set(new['benchmarks'])):
+        a, b = old['benchmarks'].get(name), new['benchmarks'].get(name)
+        if a is None or b is None:
+            print(f"{name:<40}{a['min'] if a else '-':>12}{b['min'] if b else '-':>12}")
+            continue
+        ratio = b['min'] / a['min'] if a['min'] else float('inf')
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  SLOWER'
+            regressions += 1
+        elif ratio < 1 - threshold:
+            flag = '  faster'
+        print(f"{name:<40}{a['min']:>12.2f}{b['min']:>12.2f}{ratio:8.2f}x{flag}")
+    return regressions
+
+
+def main(argv: List[str] = None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('-n', '--loans', type=int, default=500, help="synthetic loans (default 500)")
+    ap.add_argument('--seed', type=int, default=1)
+    ap.add_argument('-r', '--repeat', type=int, default=5, help="timed repetitions per benchmark")
+    ap.add_argument('-k', dest='select', help="only benchmarks whose name contains this")
+    ap.add_argument('-o', '--output', help=f"results file (default {RESULTS_DIR}/<commit>.json)")
+    ap.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="compare two results files")
+    ap.add_argument('--threshold', type=float, default=0.10, help="regression threshold for --compare")
+    args = ap.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as fh_old, open(args.compare[1]) as fh_new:
+            regressions = compare(json.load(fh_old), json.load(fh_new), args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    report = run(args.loans, args.seed, args.repeat, args.select)
+    output = args.output
+    if output is None:
+        meta = report['meta']
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{meta['commit']}{'-dirty' if meta['dirty'] else ''}.json")
+    with open(output, 'w') as fh:
+        json.dump(report, fh, indent=2)
+    print(f"wrote {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
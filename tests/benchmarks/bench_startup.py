@@ -0,0 +1,111 @@
+# tests/benchmarks/bench_startup.py
+"""
+Startup benchmarks: importing the API and booting it (import + warm-up) in
+fresh interpreters, with and without the config snapshot, and loading the
+rule plan in-process. Same results format as bench_engine, so runs can be
+compared with `python -m tests.benchmarks.bench_engine --compare`.
+
+    python -m tests.benchmarks.bench_startup                 # -> .benchmarks/<commit>-startup.json
+    python -m tests.benchmarks.bench_startup -r 10 -o /tmp/startup.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+from tests.benchmarks.bench_engine import RESULTS_DIR, _commit
+
+# printed by the child: seconds taken, then the heavy modules it ended up importing
+_CHILD = """
+import sys, time
+start = time.perf_counter()
+import app.main
+{extra}
+elapsed = time.perf_counter() - start
+heavy = [m for m in ('pymongo', 'numpy', 'rapidfuzz', 'dateutil.parser') if m in sys.modules]
+print(elapsed, ','.join(heavy))
+"""
+_WARM_UP = "from app.api.routes import warm_up; warm_up()"
+
+
+def _child(extra: str, snapshot_dir: str) -> List[str]:
+    env = dict(os.environ, LOG_FILE='', CONFIG_SNAPSHOT_DIR=snapshot_dir)
+    out = subprocess.run([sys.executable, '-c', _CHILD.format(extra=extra)], env=env,
+                         capture_output=True, text=True, check=True).stdout.split()
+    return out + [''] * (2 - len(out))
+
+
+def _summary(times_ms: List[float], **extra) -> Dict[str, Any]:
+    return {'unit': 'ms', 'ops': 1, 'min': round(min(times_ms), 3),
+            'median': round(statistics.median(times_ms), 3),
+            'mean': round(statistics.fmean(times_ms), 3), **extra}
+
+
+def run(repeat: int = 5) -> Dict[str, Any]:
+    import yaml
+    from app.core import rule_plan
+    from app.core.path_resolver import FIELDS_PATH
+    from app.core.rule_loader import RULES_PATH, UniqueKeyLoader
+
+    results = {}
+    snapshots = tempfile.mkdtemp(prefix='bench-startup-')
+    _child('', snapshots)     # writes the snapshot
+    for name, extra, snapshot_dir in [('import.app_main', '', snapshots),
+                                      ('import.app_main.no_snapshot', '', ''),
+                                      ('boot.app_main', _WARM_UP, snapshots)]:
+        runs = [_child(extra, snapshot_dir) for _ in range(repeat)]
+        results[name] = _summary([float(t) * 1e3 for t, _ in runs], heavy_imports=runs[-1][1])
+        print(f"{name:<40}{results[name]['min']:10.2f} ms  imported: {runs[-1][1] or '-'}", file=sys.stderr)
+
+    def parse(loader):
+        for path in (RULES_PATH, FIELDS_PATH):
+            with open(path, encoding='utf-8') as fh:
+                yaml.load(fh, Loader=loader)
+
+    rule_plan.load_rule_plan()      # imports the validators
+    saved = rule_plan.CONFIG_SNAPSHOT_DIR
+    try:
+        # plain SafeLoader: the pure-Python parser the loader used before
+        for name, fn, snapshot_dir in [('config.yaml_safe_loader', lambda: parse(yaml.SafeLoader), ''),
+                                       ('config.yaml_unique_key_loader', lambda: parse(UniqueKeyLoader), ''),
+                                       ('load_rule_plan.no_snapshot', rule_plan.load_rule_plan, ''),
+                                       ('load_rule_plan.snapshot', rule_plan.load_rule_plan, snapshots)]:
+            rule_plan.CONFIG_SNAPSHOT_DIR = snapshot_dir
+            results[name] = _summary([t * 1e3 for t in timeit.repeat(fn, number=1, repeat=repeat)])
+            print(f"{name:<40}{results[name]['min']:10.2f} ms", file=sys.stderr)
+    finally:
+        rule_plan.CONFIG_SNAPSHOT_DIR = saved
+
+    sha, dirty = _commit()
+    return {'meta': {'commit': sha, 'dirty': dirty, 'python': platform.python_version(),
+                     'platform': platform.platform(), 'cpus': os.cpu_count(),
+                     'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                     'repeat': repeat, 'libyaml': getattr(yaml, '__with_libyaml__', False)},
+            'benchmarks': results}
+
+
+def main(argv: List[str] = None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('-r', '--repeat', type=int, default=5, help="runs per benchmark")
+    ap.add_argument('-o', '--output', help=f"results file (default {RESULTS_DIR}/<commit>-startup.json)")
+    args = ap.parse_args(argv)
+
+    report = run(args.repeat)
+    output = args.output
+    if output is None:
+        meta = report['meta']
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{meta['commit']}{'-dirty' if meta['dirty'] else ''}-startup.json")
+    with open(output, 'w') as fh:
+        json.dump(report, fh, indent=2)
+    print(f"wrote {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
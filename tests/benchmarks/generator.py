@@ -0,0 +1,150 @@
+# tests/benchmarks/generator.py
+"""
+Synthetic loan contexts built from the fields.yaml paths.
+
+Values are drawn so that rules actually trigger: fields used in triggers
+mostly take one of the values the rules test for (or straddle their GT
+thresholds), dates come in every supported format (and some others),
+credit reports carry 0-60 tradelines, and any field may be missing.
+Deterministic for a given seed.
+
+    from tests.benchmarks.generator import generate_contexts
+    contexts = generate_contexts(500, seed=1)
+"""
+import random
+from typing import Any, Dict, List, Tuple
+from app.core.path_resolver import COLLECTIONS, PathResolver
+from app.core.rule_plan import FieldPredicate, RulePlan, load_rule_plan
+
+TRADELINE_COUNTS = (0, 1, 3, 8, 15, 30, 60)
+CREDITORS = ['CHASE BANK USA', 'WELLS FARGO HOME MTG', 'CAPITAL ONE', 'DISCOVER FIN SVCS',
+             'SYNCHRONY BANK/AMAZON', 'AMERICAN EXPRESS', 'ROCKET MORTGAGE', 'US BANK',
+             'NAVIENT', 'TOYOTA MOTOR CREDIT', 'PENNYMAC LOAN SERVICES', 'MR. COOPER']
+STREETS = ['123 Main St', '45 Oak Ave.', '9 Elm Street', '1600 Pennsylvania Ave NW', '77 Sunset Blvd']
+CITIES = ['Anytown', 'Springfield', 'Austin', 'San Jose', 'Portland']
+STATES = ['CA', 'TX', 'OR', 'NY', 'FL']
+NUMERIC = ('ltv', 'cltv', 'hcltv', 'dti', 'score', 'amount', 'income', 'cash', 'units')
+
+
+def trigger_values(plan: RulePlan) -> Dict[str, Tuple[List[Any], List[float]]]:
+    """field -> (values the rules test for, GT thresholds)."""
+    out: Dict[str, Tuple[List[Any], List[float]]] = {}
+
+    def walk(predicate):
+        if isinstance(predicate, FieldPredicate):
+            values, thresholds = out.setdefault(predicate.field, ([], []))
+            values.extend(v for v in sorted(predicate.equals_raw) if v not in values and v.upper() != 'ANY')
+            thresholds.extend(t for t in predicate.gt if t not in thresholds)
+            return
+        for p in predicate.predicates:
+            walk(p)
+
+    for rule in plan.rules:
+        walk(rule.trigger)
+    return out
+
+
+def random_date(rng: random.Random) -> str:
+    y, m, d = rng.randint(2005, 2025), rng.randint(1, 12), rng.randint(1, 28)
+    return rng.choice([f"{m:02d}-{d:02d}-{y}", f"{m:02d}-{d:02d}-{y}", f"{y}-{m:02d}-{d:02d}",
+                       f"{m}/{d}/{y}", f"{y}/{m:02d}/{d:02d}", f"{d + 12 if d <= 19 else d:02d}-{m:02d}-{y}",
+                       f"{y}-{m:02d}-{d:02d}T00:00:00", f"March {d}, {y}", "N/A"])
+
+
+def _number(rng: random.Random, name: str, thresholds: List[float]):
+    if thresholds:
+        t = rng.choice(thresholds)
+        value = round(t + rng.uniform(-10, 10), 2)
+        # some lenders send ratios as fractions (0.85 for 85%)
+        return round(value / 100, 4) if rng.random() < 0.2 else value
+    if 'score' in name:
+        return rng.randint(560, 820)
+    if 'units' in name:
+        return rng.randint(1, 4)
+    if 'income' in name or 'amount' in name:
+        return rng.randint(0, 900) * 1000
+    if 'cash' in name:
+        return rng.choice([0, 0, rng.randint(1, 50000)])
+    return round(rng.uniform(10, 100), 2)
+
+
+def _value(rng: random.Random, name: str, allowed: Tuple[List[Any], List[float]]):
+    values, thresholds = allowed
+    if values and rng.random() < 0.8:
+        v = rng.choice(values)
+        return int(v) if v.isdigit() else v
+    if any(n in name for n in NUMERIC) or thresholds:
+        return _number(rng, name, thresholds)
+    if 'date' in name:
+        return random_date(rng)
+    if name.endswith('street') or 'street_address' in name:
+        return rng.choice(STREETS)
+    if name.endswith('city'):
+        return rng.choice(CITIES)
+    if name.endswith('state'):
+        return rng.choice(STATES)
+    if name.endswith('unit'):
+        return rng.choice(['', '1', '15', 'B'])
+    if 'housing' in name:
+        return rng.choice(['Own', 'Rent', 'No primary housing expense', ''])
+    return rng.choice(['Yes', 'No', '', 'Other'])
+
+
+def _set(doc: Dict[str, Any], keys: Tuple[str, ...], value: Any):
+    for key in keys[:-1]:
+        nxt = doc.setdefault(key, {})
+        if not isinstance(nxt, dict):
+            return
+        doc = nxt
+    doc[keys[-1]] = value
+
+
+def _tradelines(rng: random.Random) -> List[Dict[str, Any]]:
+    return [{'Creditor Name': rng.choice(CREDITORS),
+             'Creditor Account Number': str(rng.randint(10 ** 11, 10 ** 12 - 1)),
+             'Date_Opened': random_date(rng),
+             'Balance': rng.randint(0, 450000),
+             'Account Type': rng.choice(['Mortgage', 'Revolving', 'Installment'])}
+            for _ in range(rng.choice(TRADELINE_COUNTS))]
+
+
+def generate_context(rng: random.Random, resolver: PathResolver,
+                     allowed: Dict[str, Tuple[List[Any], List[float]]],
+                     loan_id: str, missing: float = 0.1) -> Dict[str, Any]:
+    context: Dict[str, Any] = {coll: {} for coll in COLLECTIONS}
+    context['los']['loan_id'] = loan_id
+    for coll in COLLECTIONS:
+        for name in resolver.fields.get(coll) or {}:
+            keys = resolver.keys(coll, name)
+            if not keys or keys[0] == 'credit_report' or rng.random() < missing:
+                continue
+            _set(context[coll], keys, _value(rng, name, allowed.get(name, ([], []))))
+
+    tradelines = _tradelines(rng)
+    if tradelines:
+        # a single tradeline sometimes arrives as a bare object
+        context['credit_report']['Tradelines'] = tradelines[0] if len(tradelines) == 1 and rng.random() < 0.5 \
+            else tradelines
+        if rng.random() < 0.7:
+            # the liability being paid off is (usually) on the credit report
+            t = rng.choice(tradelines)
+            name = t['Creditor Name'] if rng.random() < 0.6 else t['Creditor Name'].title() + ' LLC'
+            _set(context['los'], resolver.keys('los', 'liabilities_name'), name)
+            _set(context['los'], resolver.keys('los', 'liabilities_account_number'),
+                 'XXXX' + t['Creditor Account Number'][-4:])
+    if rng.random() < 0.5:
+        # drive report on the subject property: exact and near address matches
+        for part in ('street', 'city', 'state', 'unit'):
+            subject = resolver.resolve(context, 'los', f'urla_lender_subject_{part}')
+            keys = resolver.keys('drive_report', f'drive_{part}')
+            if subject:
+                _set(context['drive_report'], keys, subject.upper() if rng.random() < 0.3 else subject)
+    return context
+
+
+def generate_contexts(n: int, seed: int = 0, plan: RulePlan = None,
+                      missing: float = 0.1) -> List[Dict[str, Any]]:
+    plan = plan or load_rule_plan()
+    rng = random.Random(seed)
+    allowed = trigger_values(plan)
+    return [generate_context(rng, plan.resolver, allowed, f"SYN-{seed}-{i:06d}", missing) for i in range(n)]
@@ -0,0 +1,12 @@
+# tests/conftest.py
+import json
+import os
+
+# keep test runs out of the tracked logs/app.log
+os.environ.setdefault('LOG_FILE', '')
+
+
+def load_dummy():
+    """A fresh copy of the sample loan context (tests mutate it)."""
+    with open('tests/dummy_data.json', 'r', encoding='utf-8') as fh:
+        return json.load(fh)
@@ -0,0 +1,273 @@
+# tests/test_api.py
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from types import MappingProxyType
+import pytest
+from app.utils.json_stream import JSONStreamSplitter, StreamFormatError
+
+pytest.importorskip("httpx")  # required by fastapi.testclient
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from app.api.admission import AdmissionController
+from app.api import routes
+from app.api.routes import app, dispatcher, get_mongo
+from app.core.mongo_client import MongoClientWrapper
+from app.core.projections import build_projection, build_projections
+from app.utils import metrics, serialization
+from app.utils.logger import JSONFormatter
+from tests.conftest import load_dummy
+
+client = TestClient(app)
+
+def split(body: bytes, chunk: int):
+    splitter = JSONStreamSplitter()
+    docs = []
+    for i in range(0, len(body), chunk):
+        docs += splitter.feed(body[i:i + chunk])
+    return [json.loads(d) for d in docs + splitter.close()]
+
+@pytest.mark.parametrize('chunk', [1, 7, 4096])
+def test_splitter_handles_ndjson_and_arrays(chunk):
+    docs = [{"s": 'a "quoted", [bracketed] {braced} \\\\ é', "n": [1, {"x": []}]}, 3, None]
+    assert split(json.dumps(docs).encode(), chunk) == docs
+    assert split(json.dumps(docs, indent=2).encode(), chunk) == docs
+    assert split(b"\n".join(json.dumps(d).encode() for d in docs), chunk) == docs
+
+def test_splitter_joins_long_ndjson_lines_fed_in_pieces():
+    line = json.dumps({"k": "x" * 100000}).encode()
+    splitter = JSONStreamSplitter(max_document_bytes=150000)
+    docs = []
+    for i in range(0, len(line), 7):
+        docs += splitter.feed(line[i:i + 7])
+    docs += splitter.feed(b"\n" + line[:10])
+    assert docs == [line] and splitter.close() == [line[:10]]
+    small = JSONStreamSplitter(max_document_bytes=1000)
+    with pytest.raises(StreamFormatError):
+        for i in range(0, len(line), 100):
+            small.feed(line[i:i + 100])
+
+def test_splitter_rejects_truncated_array():
+    splitter = JSONStreamSplitter()
+    splitter.feed(b'[{"a": 1}, {"b"')
+    with pytest.raises(StreamFormatError):
+        splitter.close()
+
+def test_validate_batch_reports_errors_inline():
+    ctx = load_dummy()
+    body = b"\n".join([json.dumps(ctx).encode(), b"{not json", b"[1]", json.dumps(ctx).encode()])
+    resp = client.post('/validate/batch', content=body)
+    assert resp.status_code == 200
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert [line['index'] for line in lines] == [0, 1, 2, 3]
+    assert 'error' in lines[1] and 'error' in lines[2]
+    single = client.post('/validate', json=ctx).json()
+    assert lines[0]['results'] == lines[3]['results'] == single['results']
+
+@pytest.mark.parametrize("projected", [False, True])
+def test_validate_by_loan_id_loads_all_collections(projected):
+    mongomock = pytest.importorskip("mongomock")
+    ctx = load_dummy()
+    db = mongomock.MongoClient()
+    projections = build_projections(dispatcher.plan) if projected else None
+    mongo = MongoClientWrapper(client=db, projections=projections)
+    mongo.db['LOS'].insert_one(dict(ctx['los']))
+    for coll, key in [('Title', 'title'), ('Appraisal', 'appraisal'),
+                      ('CreditReport', 'credit_report'), ('DriveReport', 'drive_report')]:
+        mongo.db[coll].insert_one(dict(ctx[key], loan_id='LOAN-123'))
+    app.dependency_overrides[get_mongo] = lambda: mongo
+    try:
+        resp = client.get('/validate/LOAN-123')
+        assert resp.status_code == 200
+        assert resp.json()['results'] == client.post('/validate', json=ctx).json()['results']
+        assert client.get('/validate/NOPE').status_code == 404
+    finally:
+        app.dependency_overrides.clear()
+
+
+def test_projection_stops_at_unaddressable_keys():
+    proj = build_projection([('loan_id',), ('A', 'B.C', 'D'), ('A', 'X'), ('Z', 'Y')])
+    assert proj == {'A': 1, 'Z.Y': 1, 'loan_id': 1, '_id': 0}
+    assert build_projection([('loan_id',), ('$e', 'f')]) is None
+
+
+def test_metrics_endpoint(monkeypatch):
+    metrics.reset()
+    assert 'rule_engine_rule_seconds_count' not in client.get('/metrics').text
+    monkeypatch.setattr(metrics, 'ENABLED', True)
+    try:
+        client.post('/validate', json=load_dummy())
+        client.post('/validate', json=load_dummy())
+        resp = client.get('/metrics')
+    finally:
+        metrics.reset()
+    assert resp.headers['content-type'].startswith('text/plain')
+    text = resp.text
+    assert 'rule_engine_rule_seconds_count{rule_id="PPV-0013",validator="DTIValidator"} 2' in text
+    assert 'rule_engine_rule_results_total{rule_id="PPV-0013",status="ALERT"} 2' in text
+    assert 'rule_engine_stage_seconds_count{stage="trigger_check"} 2' in text
+    assert 'rule_engine_stage_seconds_count{stage="serialize"} 2' in text
+    assert 'rule_engine_evaluations_total 2' in text
+    assert 'rule_engine_stage_seconds_bucket{stage="validate",le="+Inf"} 2' in text
+
+def test_forced_trace_logs_each_rule(caplog, capsys):
+    payload = load_dummy()
+    with caplog.at_level('DEBUG', logger='app.trace'):
+        plain = client.post('/validate', json=payload)
+        traced = client.post('/validate', json=payload, headers={'X-Trace': '1'})
+    assert 'x-trace-id' not in plain.headers
+    trace_id = traced.headers['x-trace-id']
+    records = [r for r in caplog.records if r.name == 'app.trace']
+    assert records and all(r.trace_id == trace_id for r in records)
+    rules = {r.data['rule_id']: r.data['status'] for r in records if r.getMessage() == 'rule'}
+    assert rules == {r['rule_id']: r['status'] for r in traced.json()['results'] if r['rule_id'] in rules}
+    assert rules
+    # validators no longer print on the hot path
+    assert capsys.readouterr().out == ''
+
+    line = json.loads(JSONFormatter().format(records[-1]))
+    assert line['logger'] == 'app.trace' and line['trace_id'] == trace_id and 'data' in line
+
+def test_rule_selection_and_response_modes():
+    ctx = load_dummy()
+    full = client.post('/validate', json=ctx).json()['results']
+    by_id = {r['rule_id']: r for r in full}
+
+    ltv = client.post('/validate', params={'rules': 'PPV-0001..PPV-0012'}, json=ctx).json()['results']
+    assert ltv == full[:12]
+    picked = client.post('/validate', params={'rules': 'PPV-0020,PPV-0003', 'tags': 'simple'}, json=ctx).json()
+    assert picked['results'] == [by_id['PPV-0003']]
+    assert client.post('/validate', params={'prefix': 'PPV-002'}, json=ctx).json()['results'] == \
+        [r for r in full if r['rule_id'].startswith('PPV-002')]
+    assert client.post('/validate', params={'rules': 'PPV-9999'}, json=ctx).status_code == 400
+    assert client.post('/validate', params={'tags': 'nope'}, json=ctx).status_code == 400
+
+    alerts = client.post('/validate', params={'alerts_only': 'true'}, json=ctx).json()['results']
+    assert alerts == [r for r in full if r['status'] not in ('PASS', 'NOT_APPLICABLE')]
+    fast = client.post('/validate', params={'fail_fast': 'true'}, json=ctx).json()['results']
+    statuses = [r['status'] for r in full]
+    assert fast == (full[:statuses.index('ALERT') + 1] if 'ALERT' in statuses else full)
+
+def test_compact_responses_and_encoding():
+    ctx = load_dummy()
+    full = client.post('/validate', json=ctx)
+    assert full.headers['content-type'] == 'application/json'
+    compact = client.post('/validate', params={'compact': 'true'}, json=ctx).json()['results']
+    for c, f in zip(compact, full.json()['results']):
+        if f['status'] == 'PASS' or not f['details']:
+            assert c == {k: v for k, v in f.items() if k != 'details'}
+        else:
+            assert c == f
+    # without msgpack installed, JSON is the only encoding offered
+    accept = client.post('/validate', json=ctx, headers={'accept': 'application/msgpack, */*;q=0.1'})
+    assert accept.headers['content-type'] == (serialization.MSGPACK if serialization.msgpack else 'application/json')
+    assert serialization.negotiate('text/html') == 'application/json'
+
+    when = datetime(2024, 3, 1, 12, 30)
+    assert json.loads(serialization.dumps_json({'d': when, 'm': MappingProxyType({'x': {1, 2} - {1}})})) == \
+        {'d': '2024-03-01T12:30:00', 'm': {'x': [2]}}
+
+def test_admission_rejects_when_saturated():
+    gate = threading.Event()
+    controller = AdmissionController(ThreadPoolExecutor(1), workers=1, max_queue=1, queue_timeout=0.2)
+
+    async def scenario():
+        running = asyncio.ensure_future(controller.run(gate.wait, 5))
+        await asyncio.sleep(0.05)
+        queued = asyncio.ensure_future(controller.run(lambda: 'late'))
+        await asyncio.sleep(0.05)
+        assert controller.stats()['queued'] == 1 and controller.stats()['in_flight'] == 1
+        with pytest.raises(HTTPException) as full:
+            await controller.run(lambda: 'rejected')
+        with pytest.raises(HTTPException) as late:
+            await queued
+        gate.set()
+        assert await running is True
+        assert await controller.run(lambda: 'ok') == 'ok'
+        return full.value, late.value
+
+    full, late = asyncio.run(scenario())
+    assert (full.status_code, late.status_code) == (429, 503)
+    assert full.headers['Retry-After'] == '1'
+    assert controller.stats() == {'workers': 1, 'max_queue': 1, 'queued': 0, 'in_flight': 0,
+                                  'completed': 2, 'rejected': 1, 'timed_out': 1}
+    controller.shutdown()
+
+def test_admission_cancelled_while_queued_is_not_a_timeout():
+    gate = threading.Event()
+    controller = AdmissionController(ThreadPoolExecutor(1), workers=1, max_queue=1, queue_timeout=5)
+
+    async def scenario():
+        running = asyncio.ensure_future(controller.run(gate.wait, 5))
+        await asyncio.sleep(0.05)
+        queued = asyncio.ensure_future(controller.run(lambda: 'never'))
+        await asyncio.sleep(0.05)
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        gate.set()
+        await running
+        # the slot is free again
+        assert await asyncio.wait_for(controller.run(lambda: 'ok'), 1) == 'ok'
+
+    asyncio.run(scenario())
+    stats = controller.stats()
+    assert (stats['queued'], stats['timed_out'], stats['rejected']) == (0, 0, 0)
+    controller.shutdown()
+
+def test_ready_after_warm_up(monkeypatch):
+    monkeypatch.setattr(routes, '_ready', False)
+    assert client.get('/ready').status_code == 503
+    routes.warm_up()
+    resp = client.get('/ready')
+    assert resp.status_code == 200 and resp.json()['plan_version'] == dispatcher.plan.version
+
+def test_full_evaluations_are_stored_behind(monkeypatch):
+    mongomock = pytest.importorskip("mongomock")
+    from app.core.result_store import ResultStore
+    coll = mongomock.MongoClient().db.results
+    store = ResultStore(coll, flush_interval=60)
+    monkeypatch.setattr(routes, '_store', store)
+    ctx = load_dummy()
+    loan_id = ctx['los']['loan_id']
+    body = client.post('/validate', json=ctx).json()
+    # partial evaluations aren't stored
+    client.post('/validate', params={'rules': body['results'][0]['rule_id']}, json=ctx)
+    assert store.flush(timeout=5)
+    stored = coll.find_one({'loan_id': loan_id, 'plan_version': dispatcher.plan.version})
+    assert stored['results'] == body['results'] and coll.count_documents({}) == 1
+    client.post('/validate', json=ctx)
+    assert client.get('/results/stats').json()['unchanged'] == 1
+    store.close()
+
+def test_stored_results_come_back_from_a_process_executor(monkeypatch):
+    mongomock = pytest.importorskip("mongomock")
+    from app.api.admission import build_executor
+    from app.core.result_store import ResultStore
+    coll = mongomock.MongoClient().db.results
+    store = ResultStore(coll, flush_interval=60)
+    controller = AdmissionController(build_executor('process', 1), workers=1)
+    monkeypatch.setattr(routes, '_store', store)
+    monkeypatch.setattr(routes, 'admission', controller)
+    try:
+        ctx = load_dummy()
+        resp = client.post('/validate', json=ctx)
+        assert resp.status_code == 200
+        assert store.flush(timeout=5)
+        assert coll.find_one({'loan_id': ctx['los']['loan_id']})['results'] == resp.json()['results']
+    finally:
+        store.close()
+        controller.executor.shutdown()
+
+def test_dotenv_is_loaded_before_any_setting_is_read():
+    env = {k: v for k, v in os.environ.items() if not k.startswith(('ADMISSION_', 'TRACE_', 'METRICS_'))}
+    # app.api.admission reads its settings when imported, before anything touches Mongo
+    out = subprocess.run([sys.executable, '-c', 'import os, app.api.admission; '
+                          'print(os.environ.get("ADMISSION_MAX_QUEUE"), os.environ.get("TRACE_HEADER"))'],
+                         env=env, capture_output=True, text=True, check=True).stdout.split()
+    assert out == ['64', 'X-Trace']
@@ -0,0 +1,146 @@
+# tests/test_batch.py
+import json
+import pytest
+from app import batch
+from app.batch import _JSONLSource, run
+from app.core.base_validator import results_to_dicts
+from app.core.mongo_client import MongoClientWrapper
+from app.core.projections import build_projections
+from app.core.rule_dispatcher import RuleDispatcher
+from app.core.rule_plan import load_rule_plan
+from tests.conftest import load_dummy
+
+class RawCollection:
+    """
+    mongomock collection answering with RawBSONDocuments once given a
+    RawBSONDocument document_class (mongomock itself can't decode into one).
+    """
+
+    def __init__(self, collection, codec_options=None):
+        self.collection = collection
+        self.codec_options = codec_options
+
+    def with_options(self, codec_options=None):
+        return RawCollection(self.collection, codec_options)
+
+    def _raw(self, doc):
+        from bson import encode
+        return doc if doc is None else self.codec_options.document_class(encode(doc), self.codec_options)
+
+    def find_one(self, *args, **kwargs):
+        return self._raw(self.collection.find_one(*args, **kwargs))
+
+    def find(self, *args, **kwargs):
+        return RawCursor(self, self.collection.find(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+class RawCursor:
+    def __init__(self, collection: RawCollection, cursor):
+        self.collection = collection
+        self.cursor = cursor
+
+    def sort(self, *args):
+        self.cursor.sort(*args)
+        return self
+
+    def __iter__(self):
+        return map(self.collection._raw, self.cursor)
+
+class RawDatabase:
+    def __init__(self, db):
+        self.db = db
+
+    def __getitem__(self, name):
+        return RawCollection(self.db[name])
+
+class RawClient:
+    def __init__(self, client):
+        self.client = client
+
+    def __getitem__(self, db_name):
+        return RawDatabase(self.client[db_name])
+
+def insert_loans(db, ctx, ids):
+    for i, loan_id in enumerate(ids):
+        db['LOS'].insert_one(dict(ctx['los'], loan_id=loan_id))
+        # some loans lack a title or a credit report
+        if i % 3:
+            db['Title'].insert_one(dict(ctx['title'], loan_id=loan_id))
+        if i % 2:
+            db['CreditReport'].insert_one(dict(ctx['credit_report'], loan_id=loan_id))
+
+def test_batch_run_resumes_from_checkpoint(tmp_path):
+    ctx = load_dummy()
+    src = tmp_path / 'in.jsonl'
+    src.write_text(''.join(json.dumps(ctx) + '\n' for _ in range(5)) + '[1]\n', encoding='utf-8')
+    out = tmp_path / 'out.jsonl'
+    source = _JSONLSource(str(src), chunk_size=2)
+
+    assert run(source, str(out), workers=1)['loans'] == 6
+    lines = sorted((json.loads(l) for l in out.read_text().splitlines()), key=lambda l: l['index'])
+    expected = results_to_dicts(RuleDispatcher(plan=load_rule_plan()).evaluate(ctx))
+    assert [l['results'] for l in lines[:5]] == [expected] * 5
+    assert lines[5]['error'] == 'context must be a JSON object'
+
+    # simulate a crash after the first chunk: a torn output line, a torn record
+    ckpt = tmp_path / 'out.jsonl.ckpt'
+    header, first = ckpt.read_text().splitlines()[:2]
+    ckpt.write_text(header + '\n' + first + '\n{"chunk"', encoding='utf-8')
+    with open(out, 'a') as fh:
+        fh.write('{"index": 2, "lo')
+    stats = run(source, str(out), workers=1)
+    assert (stats['loans'], stats['total']) == (4, 6)
+    resumed = sorted((json.loads(l) for l in out.read_text().splitlines()), key=lambda l: l['index'])
+    assert resumed == lines
+
+def test_streamed_contexts_match_single_loads(monkeypatch):
+    mongomock = pytest.importorskip("mongomock")
+    ctx = load_dummy()
+    dispatcher = RuleDispatcher(plan=load_rule_plan())
+    mongo = MongoClientWrapper(client=mongomock.MongoClient(), projections=build_projections(dispatcher.plan))
+    ids = [f'LOAN-{i:02d}' for i in range(7)]
+    insert_loans(mongo.db, ctx, ids)
+    wanted = ids[::-1] + ['NOPE', ids[0]]
+    streamed = list(mongo.stream_contexts(wanted, chunk_size=3))
+    assert [loan_id for loan_id, _ in streamed] == wanted
+    assert [c for _, c in streamed] == [mongo.load_context(loan_id) for loan_id in wanted]
+    by_query = list(mongo.stream_contexts(query={'loan_id': {'$gte': 'LOAN-02'}}, chunk_size=2))
+    assert by_query == [(loan_id, mongo.load_context(loan_id)) for loan_id in ids[2:]]
+
+    # batch --mongo chunks load this way; missing loans are reported inline
+    monkeypatch.setattr(batch, '_dispatcher', dispatcher)
+    monkeypatch.setattr(batch, '_mongo', mongo)
+    chunk_id, count, text = batch._run_chunk((4, 'mongo', 10, ['LOAN-01', 'NOPE']))
+    first, missing = [json.loads(line) for line in text.splitlines()]
+    assert (chunk_id, count, first['index'], first['loan_id']) == (4, 2, 10, 'LOAN-01')
+    assert first['results'] == results_to_dicts(dispatcher.evaluate(mongo.load_context('LOAN-01')))
+    assert missing == {'index': 11, 'loan_id': 'NOPE', 'error': 'LOS document not found for loan_id NOPE'}
+
+def test_raw_documents_load_and_stream_like_decoded_ones():
+    mongomock = pytest.importorskip("mongomock")
+    from bson.raw_bson import RawBSONDocument
+    from app.utils.serialization import dumps_json, result_dicts
+    ctx = load_dummy()
+    dispatcher = RuleDispatcher(plan=load_rule_plan())
+    client = mongomock.MongoClient()
+    projections = build_projections(dispatcher.plan)
+    decoded = MongoClientWrapper(client=client, projections=projections, raw=False)
+    raw = MongoClientWrapper(client=RawClient(client), projections=projections, raw=True)
+    ids = [f'LOAN-{i:02d}' for i in range(5)]
+    insert_loans(decoded.db, ctx, ids)
+
+    def outcome(context):
+        return json.loads(dumps_json(result_dicts(dispatcher.evaluate(context))))
+
+    context = raw.load_context('LOAN-01')
+    assert isinstance(context['los'], RawBSONDocument) and isinstance(context['title'], RawBSONDocument)
+    assert outcome(context) == outcome(decoded.load_context('LOAN-01'))
+    streamed = list(raw.stream_contexts(ids + ['NOPE'], chunk_size=2))
+    assert [loan_id for loan_id, _ in streamed] == ids + ['NOPE'] and streamed[-1][1]['los'] == {}
+    for loan_id, context in streamed:
+        assert outcome(context) == outcome(decoded.load_context(loan_id))
+    by_query = list(raw.stream_contexts(query={}, chunk_size=2))
+    assert [loan_id for loan_id, _ in by_query] == ids
+    assert all(isinstance(c['los'], RawBSONDocument) for _, c in by_query)
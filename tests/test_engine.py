@@ -1,16 +1,328 @@
 # tests/test_engine.py
+import copy
+import itertools
 import json
+import pytest
+from yaml.constructor import ConstructorError
+from app.core.base_validator import BaseValidator, PASS, ValidationResult, results_to_dicts
 from app.core.path_resolver import PathResolver, load_fields_config
+from app.core.result_cache import MongoCacheBackend, ResultCache
 from app.core.rule_loader import load_rules
 from app.core.rule_dispatcher import RuleDispatcher
+from app.core.rule_plan import AnyOf, RulePlanError, compile_rule_plan, compile_trigger, load_rule_plan, trigger_fields
+from app.core.trigger_index import iter_bits
+from tests.conftest import load_dummy
+
+DUMMY_EXPECTED = {
+    'PPV-0013': 'ALERT', 'PPV-0015': 'ALERT', 'PPV-0017': 'ALERT', 'PPV-0018': 'ALERT',
+    'PPV-0023': 'ALERT', 'PPV-0024': 'ALERT', 'PPV-0027': 'PASS', 'PPV-0028': 'PASS',
+}
 
 def run_test():
-    ctx = json.load(open('tests/dummy_data.json', 'r', encoding='utf-8'))
+    ctx = load_dummy()
     resolver = PathResolver(load_fields_config())
     rules = load_rules()
     dispatcher = RuleDispatcher(resolver=resolver, rules=rules)
     results = dispatcher.evaluate(ctx)
-    print(json.dumps(results, indent=2))
+    print(json.dumps(results_to_dicts(results), indent=2))
+
+def test_dummy_data_statuses():
+    plan = load_rule_plan()
+    results = RuleDispatcher(plan=plan).evaluate(load_dummy())
+    assert len(results) == 28
+    for r in results:
+        assert r.status == DUMMY_EXPECTED.get(r.rule_id, 'NOT_APPLICABLE'), r
+    # untriggered rules share the plan's immutable NOT_APPLICABLE results
+    assert results[0] is plan.rules[0].not_applicable
+    assert results[0].to_dict() == {'rule_id': 'PPV-0001', 'status': 'NOT_APPLICABLE', 'message': '', 'details': {}}
+    by_class = {}
+    for rule in plan.rules:
+        assert by_class.setdefault(rule.validator_cls, rule.validator) is rule.validator
+
+def test_duplicate_trigger_keys_rejected(tmp_path):
+    path = tmp_path / 'rules.yaml'
+    path.write_text(
+        "rules:\n"
+        "  - id: X\n"
+        "    validator: LTVValidator\n"
+        "    trigger:\n"
+        "      or: [{ltv: [GT80]}]\n"
+        "      or: [{cltv: [GT80]}]\n")
+    with pytest.raises(ConstructorError):
+        load_rules(str(path))
+
+@pytest.mark.parametrize('rule', [
+    {'id': 'X', 'validator': 'NoSuchValidator'},
+    {'id': 'X', 'validator': 'LTVValidator', 'trigger': {'ltv': ['GTeighty']}},
+    {'id': 'X', 'validator': 'LTVValidator', 'trigger': {'or': {'ltv': ['GT80']}}},
+])
+def test_invalid_rules_rejected(rule):
+    with pytest.raises(RulePlanError):
+        compile_rule_plan([rule], load_fields_config())
+
+def test_and_of_or_groups():
+    rule = {'id': 'X', 'validator': 'LTVValidator', 'trigger': {'and': [
+        {'or': [{'investor': ['Fannie Mae']}, {'underwriting_risk_assess_type': ['DU']}]},
+        {'or': [{'ltv': ['GT85']}, {'cltv': ['GT95']}]},
+    ]}}
+    plan = compile_rule_plan([rule], load_fields_config())
+    dispatcher = RuleDispatcher(plan=plan)
+    ctx = load_dummy()
+    assert dispatcher._check_trigger(plan.rules[0], ctx)
+    ctx['los']['Loan Details']['LTV'] = 0.8
+    assert not dispatcher._check_trigger(plan.rules[0], ctx)
+
+def test_resolved_view_walks_each_field_once():
+    resolver = PathResolver(load_fields_config())
+    assert resolver.collections_for('ltv') == ('los',)
+    assert resolver.collections_for('drive_street') == ('drive_report',)
+    ctx = load_dummy()
+    view = resolver.view(ctx)
+    assert view.resolve(ctx, 'los', 'ltv') == 90
+    ctx['los']['Loan Details']['LTV'] = 50
+    assert view.resolve(ctx, 'los', 'ltv') == 90
+    assert resolver.resolve(ctx, 'los', 'ltv') == 50
+    assert view.resolve_any(ctx, 'chain_title_date') == '01-07-2020'
+
+def test_trigger_index_never_drops_a_triggered_rule():
+    plan = load_rule_plan()
+    base = load_dummy()
+    grid = itertools.product(
+        ["Purchase", " Cash-Out Refinance ", "No Cash-Out Refinance", ""],
+        [1, "2", 4, None],
+        ["Primary", "Second Home", ["Investment"]],
+        ["Fixed Rate", "Adjustable Rate"],
+    )
+    for purpose, units, prop, amort in grid:
+        ctx = copy.deepcopy(base)
+        info = ctx['los']['URLA Lender']['Property and Loan Information']
+        info.update({'Purpose of Loan': purpose, 'No Units': units, 'Property Will Be': prop})
+        info['Mortgage Loan Information']['Amortization Type'] = amort
+        view = plan.resolver.view(ctx)
+        candidates = set(iter_bits(plan.index.candidates(view)))
+        triggered = {i for i, r in enumerate(plan.rules) if r.trigger(view)}
+        assert triggered <= candidates
+
+def test_shared_predicates_agree_with_per_rule_triggers():
+    from tests.benchmarks.generator import generate_contexts
+    plan = load_rule_plan()
+    ltv1, ltv2 = plan.rules[0].trigger, plan.rules[1].trigger
+    assert [p for p in ltv1.predicates if isinstance(p, AnyOf)][0] is \
+        [p for p in ltv2.predicates if isinstance(p, AnyOf)][0]
+    separate = [compile_trigger(r.rule.get('trigger'), plan.resolver, r.id) for r in plan.rules]
+    for ctx in generate_contexts(200, seed=5, plan=plan):
+        view = plan.resolver.view(ctx)
+        assert [r.trigger(view) for r in plan.rules] == [t(plan.resolver.view(ctx)) for t in separate]
+        # only clauses occurring in several rules are kept in the truth table
+        assert view.truth and len(view.truth) < sum(len(trigger_fields(r.trigger)) for r in plan.rules)
+
+def test_columnar_matches_scalar():
+    pytest.importorskip("numpy")
+    from app.core.vectorized import ColumnarEvaluator
+    dispatcher = RuleDispatcher(plan=load_rule_plan())
+    base = load_dummy()
+    numbers = [None, "", 0, 0.9, 1, "85", 96.5, "abc", -2500, "-100", 2000, 610, 700, True]
+    dates = [None, "", "10-10-2020", "2020-01-15", "13-02-2021", "02/30/2020", "garbage"]
+    contexts = []
+    for i, (purpose, props) in enumerate(itertools.product(
+            ["Purchase", "Cash-Out Refinance", "No Cash-Out Refinance"],
+            ["Primary", "Secondary", "Investment"])):
+        for j in range(20):
+            ctx = copy.deepcopy(base)
+            info = ctx['los']['URLA Lender']['Property and Loan Information']
+            info.update({'Purpose of Loan': purpose, 'Property Will Be': props, 'No Units': 1 + j % 4})
+            info['Terms of Loan']['Loan Amount'] = numbers[(i + j) % len(numbers)]
+            details = ctx['los']['Loan Details']
+            for k, key in enumerate(['LTV', 'CLTV', 'HCLTV', 'DTI', 'Average Represetative Credit Score']):
+                details[key] = numbers[(i * 3 + j * 5 + k) % len(numbers)]
+            money = ctx['los']['URLA 5']['Closing Details']['Summary of Transaction']
+            money['Cash to Borrower'] = numbers[(j * 7) % len(numbers)]
+            ctx['los']['Disclosure Dates']['Estimated Closing Date'] = dates[j % len(dates)]
+            ctx['title']['PropertyInfo']['ChainOfTitle']['Date'] = dates[(i + j * 3) % len(dates)]
+            ctx['appraisal']['Appraisal']['PriorSale']['Date'] = dates[(i * 2 + j) % len(dates)]
+            contexts.append(ctx)
+    expected = [dispatcher.evaluate(ctx) for ctx in contexts]
+    assert ColumnarEvaluator(dispatcher).evaluate(contexts) == expected
+
+def test_synthetic_loans_reach_every_validator():
+    pytest.importorskip("numpy")
+    from app.core.vectorized import ColumnarEvaluator
+    from tests.benchmarks.generator import generate_contexts
+    dispatcher = RuleDispatcher(plan=load_rule_plan())
+    contexts = generate_contexts(300, seed=3, plan=dispatcher.plan)
+    assert contexts == generate_contexts(300, seed=3, plan=dispatcher.plan)
+    expected = [dispatcher.evaluate(ctx) for ctx in contexts]
+    applied = {r.rule_id for results in expected for r in results if r.status != 'NOT_APPLICABLE'}
+    plan = dispatcher.plan
+    # rules with trigger fields missing from fields.yaml can never apply
+    reachable = [rule for rule in plan.rules
+                 if all(plan.resolver.collections_for(f) for f in trigger_fields(rule.trigger))]
+    assert {rule.validator_cls for rule in plan.rules if rule.id in applied} == \
+        {rule.validator_cls for rule in reachable}
+    assert ColumnarEvaluator(dispatcher).evaluate(contexts) == expected
+
+def test_columnar_kernels_use_the_validator_defaults(monkeypatch):
+    pytest.importorskip("numpy")
+    from app.core.vectorized import ColumnarEvaluator
+    from app.validators import validators
+    from tests.benchmarks.generator import generate_contexts
+    for cls, attr, value in [(validators.CreditScoreValidator, 'min_score', 700),
+                             (validators.DTIValidator, 'dti_limit', 30),
+                             (validators.CashbackValidator, 'absolute_limit', 100),
+                             (validators.TitleValidator, 'min_months', 24),
+                             (validators.AppraisalPriorSaleValidator, 'min_months', 24)]:
+        monkeypatch.setattr(cls, attr, value)
+    dispatcher = RuleDispatcher(plan=load_rule_plan())
+    contexts = generate_contexts(200, seed=5, plan=dispatcher.plan)
+    expected = [dispatcher.evaluate(ctx) for ctx in contexts]
+    assert ColumnarEvaluator(dispatcher).evaluate(contexts) == expected
+
+def test_parse_date_agrees_with_strptime_loop():
+    from datetime import datetime
+    from app.utils import date_utils
+    for value in ['05-01-2025', '5-1-2025', '25-12-2024', '02-30-2024', '13-13-2024',
+                  '2025-05-01', '2025/5/1', '05/01/2025', '31/12/2024', '05- 1-2025',
+                  '0000-01-01', '2024-01-05T10:00:00', 'garbage', '12.05.2024']:
+        assert date_utils.parse_date(value) == date_utils._parse_legacy(value), value
+    with date_utils.evaluation_now(datetime(2025, 6, 15)):
+        assert date_utils.months_between('01-15-2025') == 5
+        with date_utils.evaluation_now():
+            assert date_utils.now() == datetime(2025, 6, 15)
+
+def test_tradeline_index_keeps_first_match_and_is_shared_per_view():
+    from app.utils.fuzzy_matcher import TradelineIndex, fuzzy_ratio, normalize_string
+    tradelines = [
+        {'Creditor Account Number': 'xx1234', 'Creditor Name': 'Wells Fargo'},
+        {'Creditor Account Number': '001234', 'Creditor Name': 'Chase Bank'},
+        {'Creditor Account Number': '991234', 'Creditor Name': 'Chase'},
+    ]
+    index = TradelineIndex(tradelines)
+    for _ in range(2):      # second round comes from the remembered matches
+        m = index.match('551234', 'CHASE BANK NA')
+        assert m.tradeline is tradelines[1] and m.creditor_name == 'Chase Bank'
+        miss = index.match('551234', 'Rocket Mortgage')
+        assert miss.tradeline is None and miss.creditor_name == 'Chase'
+        assert index.match('0000', 'Chase') is None
+    # the first name over the threshold wins over a better one later in the report
+    later = [{'Creditor Account Number': '1234', 'Creditor Name': 'Chase Bk'},
+             {'Creditor Account Number': '1234', 'Creditor Name': 'Chase Bank NA'}]
+    m = TradelineIndex(later).match('1234', 'CHASE BANK NA')
+    assert m.tradeline is later[0] and m.score == fuzzy_ratio('Chase Bk', 'CHASE BANK NA') == 76
+    assert normalize_string(' 12_3 Main-St., Apt #4 ') == '123 mainst apt 4'
+
+    view = PathResolver(load_fields_config()).view({})
+    assert view.shared({}, 'k', object) is not view.shared({}, 'k', object)
+    assert view.shared(view.context, 'k', object) is view.shared(view.context, 'k', object)
+
+def test_incremental_evaluation_matches_full():
+    dispatcher = RuleDispatcher(plan=load_rule_plan())
+    plan = dispatcher.plan
+    assert bin(plan.dependents['appraisal']).count('1') == 1
+    base = load_dummy()
+    edits = {
+        'title': lambda c: c['title']['PropertyInfo']['ChainOfTitle'].update(Date='01-01-2024'),
+        'appraisal': lambda c: c['appraisal']['Appraisal']['PriorSale'].update(Date='06-01-2024'),
+        'drive_report': lambda c: c.update(drive_report={}),
+        'credit_report': lambda c: c['credit_report'].update(Tradelines=[]),
+        'los': lambda c: c['los']['Loan Details'].update(DTI=20),
+    }
+    for purpose in ["Purchase", "Cash-Out Refinance", "No Cash-Out Refinance"]:
+        ctx = copy.deepcopy(base)
+        ctx['los']['URLA Lender']['Property and Loan Information']['Purpose of Loan'] = purpose
+        previous = dispatcher.evaluate(ctx)
+        for coll, edit in edits.items():
+            changed = copy.deepcopy(ctx)
+            edit(changed)
+            expected = dispatcher.evaluate(changed)
+            assert dispatcher.evaluate_incremental(changed, previous, [coll]) == expected
+            assert dispatcher.evaluate_incremental(changed, results_to_dicts(previous), [coll]) == expected
+        assert dispatcher.evaluate_incremental(ctx, previous, []) == previous
+    with pytest.raises(ValueError):
+        dispatcher.evaluate_incremental(ctx, previous, ['nope'])
+
+def test_result_cache_serves_rules_whose_reads_are_unchanged(monkeypatch):
+    monkeypatch.setattr(BaseValidator, 'cache_results', True)
+    plan = load_rule_plan()
+    plain = RuleDispatcher(plan=plan)
+    cached = RuleDispatcher(plan=plan, cache=ResultCache(maxsize=1000, ttl=60))
+    ctx = load_dummy()
+    expected = plain.evaluate(ctx)
+    assert cached.evaluate(ctx) == expected
+    stats = cached.cache.stats()
+    assert stats['hits'] == 0 and stats['misses'] == stats['size'] == 8
+    assert cached.evaluate(copy.deepcopy(ctx)) == expected
+    assert cached.cache.stats()['hits'] == 8
+    # a field only the DTI rule reads: every other rule is a hit
+    ctx['los']['Loan Details']['DTI'] = 20
+    assert cached.evaluate(ctx) == plain.evaluate(ctx)
+    stats = cached.cache.stats()
+    assert stats['hits'] == 15 and stats['misses'] == 9
+
+def test_result_cache_hits_on_the_real_plan():
+    from tests.benchmarks.generator import generate_contexts
+    plan = load_rule_plan()
+    plain = RuleDispatcher(plan=plan)
+    cached = RuleDispatcher(plan=plan, cache=ResultCache(maxsize=10000, ttl=60))
+    contexts = generate_contexts(100, seed=5, plan=plan)
+    cacheable = {r.id for r in plan.rules if r.validator_cls.cache_results}
+    assert cacheable and len(cacheable) < len(plan.rules)
+    for ctx in contexts:
+        assert cached.evaluate(ctx) == plain.evaluate(ctx)
+    misses = cached.cache.stats()['misses']
+    for ctx in copy.deepcopy(contexts):
+        assert cached.evaluate(ctx) == plain.evaluate(ctx)
+    stats = cached.cache.stats()
+    assert stats['hits'] == misses > 0 and stats['misses'] == misses
+
+def test_result_cache_lru_ttl_and_shared_backend():
+    mongomock = pytest.importorskip("mongomock")
+    result = ValidationResult('R', PASS, '', {'a': 1})
+    cache = ResultCache(maxsize=2, ttl=60)
+    cache.put_many({('v', 'R', 1, '1'): result, ('v', 'R', 1, '2'): result})
+    assert cache.get_many([('v', 'R', 1, '1')])   # now most recently used
+    cache.put_many({('v', 'R', 1, '3'): result})
+    assert set(cache.get_many([('v', 'R', 1, k) for k in '123'])) == {('v', 'R', 1, '1'), ('v', 'R', 1, '3')}
+    assert cache.stats()['evictions'] == 1
+    cache.ttl = -1
+    cache.put_many({('v', 'R', 1, '4'): result})
+    assert not cache.get_many([('v', 'R', 1, '4')])
+
+    coll = mongomock.MongoClient().db.cache
+    writer = ResultCache(backend=MongoCacheBackend(coll))
+    reader = ResultCache(backend=MongoCacheBackend(coll))
+    writer.put_many({('v', 'R', 1, 'x'): result})
+    assert reader.get_many([('v', 'R', 1, 'x')]) == {('v', 'R', 1, 'x'): result}
+    assert reader.stats()['shared_hits'] == 1
+    assert reader.get_many([('v', 'R', 1, 'x')]) and reader.stats()['hits'] == 1
+
+def test_config_snapshot_is_keyed_by_file_contents(tmp_path, monkeypatch):
+    from app.core import rule_plan
+    monkeypatch.setattr(rule_plan, 'CONFIG_SNAPSHOT_DIR', str(tmp_path / 'snapshots'))
+    rules_path = tmp_path / 'rules.yaml'
+    with open(rule_plan.RULES_PATH, encoding='utf-8') as fh:
+        rules_path.write_text(fh.read(), encoding='utf-8')
+    fresh = load_rule_plan(str(rules_path))
+    assert len(list((tmp_path / 'snapshots').iterdir())) == 1
+
+    def no_yaml(*args):
+        raise AssertionError("YAML parsed despite the snapshot")
+    monkeypatch.setattr(rule_plan, 'load_rules', no_yaml)
+    assert load_rule_plan(str(rules_path)).version == fresh.version
+
+    rules_path.write_text(rules_path.read_text(encoding='utf-8') + "\n# edited\n", encoding='utf-8')
+    with pytest.raises(AssertionError):
+        load_rule_plan(str(rules_path))
+
+def test_raw_bson_contexts_evaluate_like_dicts():
+    bson = pytest.importorskip("bson")
+    from bson.raw_bson import RawBSONDocument
+    from app.utils.serialization import dumps_json, result_dicts
+    from tests.benchmarks.generator import generate_contexts
+    dispatcher = RuleDispatcher(plan=load_rule_plan())
+    for ctx in generate_contexts(200, seed=11, plan=dispatcher.plan):
+        raw = {coll: RawBSONDocument(bson.encode(doc)) for coll, doc in ctx.items()}
+        expected = json.loads(dumps_json(result_dicts(dispatcher.evaluate(ctx))))
+        assert json.loads(dumps_json(result_dicts(dispatcher.evaluate(raw)))) == expected
 
 if __name__ == "__main__":
     run_test()
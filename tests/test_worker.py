@@ -0,0 +1,141 @@
+# tests/test_worker.py
+from datetime import datetime, timedelta
+import pytest
+from app.core.mongo_client import MongoClientWrapper
+from app.core.result_store import ResultStore, results_hash
+from app.core.rule_dispatcher import RuleDispatcher
+from app.worker import Coalescer, PollingSource, RevalidationWorker, RESULTS_COLLECTION
+from tests.conftest import load_dummy
+
+class FakeClock:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+def test_coalescer_debounces_and_caps_delay():
+    clock = FakeClock()
+    c = Coalescer(debounce=2, max_delay=5, clock=clock)
+    c.add('A', 'los')
+    clock.t = 1
+    c.add('A', 'title')
+    c.add('B', 'appraisal')
+    assert c.pop_due() == []
+    clock.t = 3
+    assert c.pop_due() == [('A', {'los', 'title'}), ('B', {'appraisal'})]
+    # a loan that keeps changing is still evaluated after max_delay
+    for t in range(10, 16):
+        clock.t = t
+        c.add('C', 'los')
+        due = c.pop_due()
+        if due:
+            break
+    assert due == [('C', {'los'})] and clock.t == 15 and len(c) == 0
+
+def test_worker_coalesces_polled_updates_per_loan():
+    mongomock = pytest.importorskip("mongomock")
+    ctx = load_dummy()
+    mongo = MongoClientWrapper(client=mongomock.MongoClient())
+    dispatcher = RuleDispatcher()
+    clock = FakeClock()
+    worker = RevalidationWorker(mongo=mongo, dispatcher=dispatcher,
+                                coalescer=Coalescer(debounce=1, max_delay=10, clock=clock), mode='poll')
+    assert isinstance(worker.source, PollingSource)
+    start = datetime.now() + timedelta(seconds=1)
+    for i, (coll, key) in enumerate([('LOS', 'los'), ('Title', 'title'), ('Appraisal', 'appraisal'),
+                                     ('CreditReport', 'credit_report'), ('DriveReport', 'drive_report')]):
+        mongo.db[coll].insert_one(dict(ctx[key], loan_id='LOAN-123', updated_at=start + timedelta(seconds=i)))
+    mongo.db['Title'].insert_one({'loan_id': 'LOAN-999', 'updated_at': start})
+
+    assert worker.source.poll(worker.coalescer.add) == 6
+    assert worker.source.poll(worker.coalescer.add) == 0
+    assert worker.drain() == 0
+    clock.t = 1
+    # one evaluation for the five updates of LOAN-123; LOAN-999 has no LOS document
+    assert worker.drain() == 1 and worker.evaluations == 1
+    assert worker.store.flush(timeout=5)
+    stored = mongo.db[RESULTS_COLLECTION].find_one({'loan_id': 'LOAN-123'})
+    expected = [r.to_dict() for r in dispatcher.evaluate(ctx)]
+    assert stored['results'] == expected
+    assert stored['plan_version'] == dispatcher.plan.version
+    assert stored['changed'] == ['appraisal', 'credit_report', 'drive_report', 'los', 'title']
+
+    # a later update re-runs only the rules reading that collection
+    mongo.db['Appraisal'].update_one({'loan_id': 'LOAN-123'},
+                                     {'$set': {'updated_at': start + timedelta(seconds=9)}})
+    assert worker.source.poll(worker.coalescer.add) == 1
+    clock.t = 5
+    assert worker.drain() == 1 and worker.evaluations == 2
+    assert worker.store.flush(timeout=5)
+    # same results: nothing is written
+    assert worker.store.stats()['unchanged'] == 1
+    stored = mongo.db[RESULTS_COLLECTION].find_one({'loan_id': 'LOAN-123'})
+    assert stored['results'] == expected and len(stored['changed']) == 5
+    worker.store.close()
+
+def test_result_store_batches_upserts_and_skips_unchanged():
+    mongomock = pytest.importorskip("mongomock")
+    coll = mongomock.MongoClient().db.results
+    store = ResultStore(coll, batch_size=3, flush_interval=60)
+    results = RuleDispatcher().evaluate(load_dummy())
+    for i in range(7):
+        assert store.put(f'LOAN-{i}', 'v1', results)
+    # the queued document is visible before it is written
+    assert store.get('LOAN-6', 'v1')['results_hash'] == results_hash([r.to_dict() for r in results])
+    assert not store.put('LOAN-6', 'v1', results)
+    assert store.flush(timeout=5)
+    assert coll.count_documents({}) == 7 and store.stats()['batches'] == 3
+    # another plan version is another document; changed results replace the old ones
+    assert store.put('LOAN-0', 'v2', results)
+    assert store.put('LOAN-1', 'v1', results[:1], note='x')
+    store.close()
+    assert coll.count_documents({}) == 8
+    assert coll.find_one({'loan_id': 'LOAN-1', 'plan_version': 'v1'})['note'] == 'x'
+    # a store that doesn't know the hash yet: the upsert filter leaves the document alone
+    again = ResultStore(coll, batch_size=3, flush_interval=60)
+    before = coll.find_one({'loan_id': 'LOAN-2'})['evaluated_at']
+    assert again.put('LOAN-2', 'v1', results)
+    again.close()
+    stats = again.stats()
+    assert (stats['written'], stats['unchanged'], stats['failed']) == (0, 1, 0)
+    assert coll.count_documents({}) == 8
+    assert coll.find_one({'loan_id': 'LOAN-2'})['evaluated_at'] == before
+    # nothing is queued once the store is closed
+    assert not again.put('LOAN-9', 'v1', results) and again.stats()['dropped'] == 1
+    assert coll.count_documents({}) == 8
+
+def test_restarted_worker_replays_updates_that_were_not_stored():
+    mongomock = pytest.importorskip("mongomock")
+    ctx = load_dummy()
+    client = mongomock.MongoClient()
+    clock = FakeClock()
+
+    def new_worker():
+        return RevalidationWorker(mongo=MongoClientWrapper(client=client), dispatcher=RuleDispatcher(),
+                                  coalescer=Coalescer(debounce=1, max_delay=10, clock=clock), mode='poll')
+
+    first = new_worker()
+    db = first.mongo.db
+    first.source.poll(first.coalescer.add)
+    start = datetime.now() + timedelta(seconds=1)
+    for coll, key in [('LOS', 'los'), ('Title', 'title'), ('Appraisal', 'appraisal'),
+                      ('CreditReport', 'credit_report'), ('DriveReport', 'drive_report')]:
+        db[coll].insert_one(dict(ctx[key], loan_id='LOAN-123', updated_at=start))
+    assert first.source.poll(first.coalescer.add) == 5
+    # not due yet: the worker dies with LOAN-123 pending
+    assert first.drain() == 0
+    first.store.close()
+    assert db[RESULTS_COLLECTION].count_documents({}) == 0
+
+    second = new_worker()
+    assert second.source.poll(second.coalescer.add) == 5
+    clock.t = 1
+    assert second.drain() == 1
+    assert db[RESULTS_COLLECTION].count_documents({'loan_id': 'LOAN-123'}) == 1
+    second.store.close()
+
+    # once stored, the updates are not seen again
+    third = new_worker()
+    assert third.source.poll(third.coalescer.add) == 0
+    third.store.close()